@@ -0,0 +1,354 @@
+"""
+Cached Market API
+HTTP server for the read-only Investment Coach endpoints the frontend calls:
+
+    GET /api/investment-coach/market-analysis
+    GET /api/investment-coach/etf/{symbol}
+
+Market data only changes at market close, so each payload is built, serialized and
+pre-compressed (gzip, plus brotli when the `brotli` package is installed) once per
+market snapshot. Responses carry ETag / Last-Modified / Cache-Control validators and
+conditional requests are answered with 304, so repeat reads cost a dict lookup.
+"""
+
+import email.utils
+import gzip
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from etf_universe import get_universe
+from market_insights import MARKET_DATA, _generate_market_summary, market_snapshot_version
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# API Server Configuration
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+API_PREFIX = "/api/investment-coach"
+MIN_COMPRESS_BYTES = 256      # smaller bodies are sent as-is
+GZIP_LEVEL = 9                # compressed once per snapshot, so use the best ratio
+BROTLI_QUALITY = 11
+ALLOW_ORIGIN = "*"            # the Vite dev server runs on a different port
+
+
+class CachedResponse(NamedTuple):
+    """A serialized payload with its pre-compressed variants and validators"""
+    status: int
+    body: bytes
+    encoded: Dict[str, bytes]     # content-coding -> body
+    etag: str                     # quoted strong ETag of the identity body
+    last_modified: str            # HTTP date
+    last_modified_ts: float
+    expires_ts: float
+
+
+def _compress(body: bytes) -> Dict[str, bytes]:
+    if len(body) < MIN_COMPRESS_BYTES:
+        return {}
+    encoded = {"gzip": gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        encoded["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    # Only keep codings that actually help
+    return {k: v for k, v in encoded.items() if len(v) < len(body)}
+
+
+def _accepted_codings(header: Optional[str]) -> Dict[str, float]:
+    """Parse Accept-Encoding into {coding: q}"""
+    accepted: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(resp: CachedResponse, accept_encoding: Optional[str]) -> Optional[str]:
+    """Best available pre-compressed coding the client accepts (br, then gzip), or None"""
+    accepted = _accepted_codings(accept_encoding)
+    for coding in ("br", "gzip"):
+        if coding in resp.encoded and accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def etag_for(resp: CachedResponse, coding: Optional[str]) -> str:
+    """Per-representation ETag: the identity ETag with the coding appended"""
+    return resp.etag if coding is None else f'{resp.etag[:-1]}-{coding}"'
+
+
+def is_not_modified(resp: CachedResponse, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    """RFC 9110 conditional GET: If-None-Match wins over If-Modified-Since"""
+    if if_none_match is not None:
+        base = resp.etag.strip('"')
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*":
+                return True
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            tag = tag.strip('"')
+            if tag == base or tag.startswith(base + "-"):
+                return True
+        return False
+    if if_modified_since:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(resp.last_modified_ts) <= since
+    return False
+
+
+def _snapshot_times(version: str) -> Tuple[float, float]:
+    """(last market close, next market close) as epoch seconds for a snapshot version"""
+    next_update = datetime.strptime(version, "%Y-%m-%d %H:%M:%S")
+    return (next_update - timedelta(days=1)).timestamp(), next_update.timestamp()
+
+
+def market_analysis_payload(version: str) -> Dict[str, Any]:
+    """Portfolio-independent market overview for the current snapshot"""
+    universe = get_universe()
+    sector_etfs = []
+    for i in universe.sector_funds():
+        row = universe.get(universe.symbol[i])
+        sector_etfs.append({
+            "symbol": row["symbol"],
+            "name": row["name"],
+            "sector": row["sector"],
+            "change_percent": row["change_percent"],
+            "volume": row["volume"],
+        })
+    return {
+        "success": True,
+        "market_summary": _generate_market_summary(),
+        "indices": MARKET_DATA["indices"],
+        "sectors": MARKET_DATA["sectors"],
+        "sector_etfs": sector_etfs,
+        "bonds": MARKET_DATA["bonds"],
+        "economic_indicators": MARKET_DATA["economic_indicators"],
+        "news_headlines": MARKET_DATA["news_headlines"],
+        "next_update": version,
+    }
+
+
+def etf_payload(symbol: str, version: str) -> Optional[Dict[str, Any]]:
+    """Universe row for an ETF, or None if unknown"""
+    row = get_universe().get(symbol)
+    if row is None:
+        return None
+    return {"success": True, "etf": row, "next_update": version}
+
+
+class ResponseCache:
+    """
+    Responses for one market snapshot. When the snapshot version changes, the cache is
+    dropped and market-analysis is rebuilt; ETF entries are built on first request and
+    then kept for the rest of the snapshot.
+    """
+
+    def __init__(self):
+        self.version: Optional[str] = None
+        self._entries: Dict[str, CachedResponse] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "builds": 0, "not_modified": 0, "snapshots": 0}
+
+    def _build(self, status: int, payload: Any, version: str) -> CachedResponse:
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        last_modified_ts, expires_ts = _snapshot_times(version)
+        return CachedResponse(
+            status=status,
+            body=body,
+            encoded=_compress(body),
+            etag='"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+            last_modified=email.utils.formatdate(last_modified_ts, usegmt=True),
+            last_modified_ts=last_modified_ts,
+            expires_ts=expires_ts,
+        )
+
+    def _refresh(self) -> str:
+        version = market_snapshot_version()
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    entries = {"market-analysis": self._build(200, market_analysis_payload(version), version)}
+                    self._entries = entries
+                    self.version = version
+                    self._stats["snapshots"] += 1
+                    self._stats["builds"] += 1
+        return version
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Cached response for "market-analysis" or "etf/<SYMBOL>", or None if unknown"""
+        version = self._refresh()
+        entries = self._entries
+        resp = entries.get(key)
+        if resp is not None:
+            self._count("hits")
+            return resp
+        if not key.startswith("etf/"):
+            return None
+        payload = etf_payload(key[4:], version)
+        if payload is None:
+            return None
+        resp = self._build(200, payload, version)
+        with self._lock:
+            if self.version == version:
+                resp = entries.setdefault(key, resp)
+            self._stats["builds"] += 1
+        return resp
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def record_not_modified(self) -> None:
+        self._count("not_modified")
+
+    def invalidate(self) -> None:
+        """Force a rebuild on the next request (e.g. after the ETF universe is swapped)"""
+        with self._lock:
+            self.version = None
+            self._entries = {}
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "version": self.version, "entries": len(self._entries)}
+
+
+class CachedAPIHandler(BaseHTTPRequestHandler):
+    """Serves cached responses with validators and content negotiation"""
+
+    server: "CachedAPIServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def do_OPTIONS(self) -> None:
+        self.send_response(204)
+        self.send_header("Access-Control-Allow-Origin", ALLOW_ORIGIN)
+        self.send_header("Access-Control-Allow-Methods", "GET, HEAD, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "If-None-Match, If-Modified-Since")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self) -> None:
+        self._serve(head=True)
+
+    def do_GET(self) -> None:
+        self._serve(head=False)
+
+    def _serve(self, head: bool) -> None:
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/health":
+            self._send_json(200, {"status": "ok", "cache": self.server.cache.snapshot_stats()}, head)
+            return
+        if not path.startswith(API_PREFIX + "/"):
+            self._send_json(404, {"success": False, "error": "Not found"}, head)
+            return
+        key = path[len(API_PREFIX) + 1:]
+        if key.startswith("etf/"):
+            key = "etf/" + key[4:].upper()
+
+        cache = self.server.cache
+        resp = cache.get(key)
+        if resp is None:
+            self._send_json(404, {"success": False, "error": f"Unknown resource: {key}"}, head)
+            return
+
+        coding = choose_encoding(resp, self.headers.get("Accept-Encoding"))
+        max_age = max(0, int(resp.expires_ts - time.time()))
+        if is_not_modified(resp, self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")):
+            cache.record_not_modified()
+            self.send_response(304)
+            self._send_validators(resp, coding, max_age)
+            self.end_headers()
+            return
+
+        body = resp.encoded[coding] if coding else resp.body
+        self.send_response(resp.status)
+        self.send_header("Content-Type", "application/json")
+        if coding:
+            self.send_header("Content-Encoding", coding)
+        self.send_header("Content-Length", str(len(body)))
+        self._send_validators(resp, coding, max_age)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def _send_validators(self, resp: CachedResponse, coding: Optional[str], max_age: int) -> None:
+        self.send_header("ETag", etag_for(resp, coding))
+        self.send_header("Last-Modified", resp.last_modified)
+        self.send_header("Cache-Control", f"public, max-age={max_age}")
+        self.send_header("Expires", email.utils.formatdate(resp.expires_ts, usegmt=True))
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Access-Control-Allow-Origin", ALLOW_ORIGIN)
+        self.send_header("Access-Control-Expose-Headers", "ETag, Last-Modified")
+
+    def _send_json(self, status: int, payload: Any, head: bool = False) -> None:
+        raw = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Access-Control-Allow-Origin", ALLOW_ORIGIN)
+        self.end_headers()
+        if not head:
+            self.wfile.write(raw)
+
+
+class CachedAPIServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the shared response cache"""
+
+    daemon_threads = True
+
+    def __init__(self, address=(DEFAULT_HOST, DEFAULT_PORT), cache: Optional[ResponseCache] = None, verbose: bool = False,
+                 handler_class=None):
+        super().__init__(address, handler_class or CachedAPIHandler)
+        self.cache = cache or ResponseCache()
+        self.verbose = verbose
+
+
+def start_server(port: int = DEFAULT_PORT, host: str = DEFAULT_HOST, **kwargs: Any) -> CachedAPIServer:
+    """Start the API server on a background thread and return it (call .shutdown() to stop)"""
+    server = CachedAPIServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, name="cached-api", daemon=True).start()
+    return server
+
+
+# Example usage
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cached market-analysis and ETF endpoints")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = CachedAPIServer((args.host, args.port), verbose=args.verbose)
+    server.cache.get("market-analysis")  # build the first snapshot before taking traffic
+    print(f"API server listening on http://{args.host}:{args.port}{API_PREFIX} (brotli: {'on' if brotli else 'off'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,211 @@
+"""
+Allocation Backtester
+Simulates monthly dollar-cost averaging into a target allocation, with periodic
+rebalancing, over local historical monthly return series. Every allocation x start
+date combination is stepped forward together as NumPy array operations and scored by
+CAGR, max drawdown and annualized volatility.
+
+Return series are read from HISTORICAL_RETURNS_PATH, a CSV with a `date` column and one
+column of monthly decimal returns per asset class in ASSET_CLASSES. No such file ships with
+the repo (market data licensing); supply one or run with --synthetic.
+"""
+
+import csv
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import HISTORICAL_RETURNS_PATH
+
+# Asset classes in the order used by investment_coach.calculate_allocation's breakdown
+ASSET_CLASSES = ("us_large_cap", "us_small_mid", "international", "emerging_growth", "bonds")
+DEFAULT_HORIZON_MONTHS = 120
+DEFAULT_REBALANCE_MONTHS = 12
+DEFAULT_CONTRIBUTION = 500.0
+AGE_BANDS = tuple(range(20, 70, 5))
+RISK_TIERS = ("low", "medium", "high")
+
+
+def load_returns(path: str = HISTORICAL_RETURNS_PATH) -> Tuple[List[str], np.ndarray]:
+    """Dates and a (months, asset classes) array of monthly returns"""
+    dates, rows = [], []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            dates.append(row["date"])
+            rows.append([float(row[k]) for k in ASSET_CLASSES])
+    return dates, np.asarray(rows, dtype=np.float64)
+
+
+def synthetic_returns(months: int = 360, seed: int = 0) -> np.ndarray:
+    """
+    Reproducible correlated lognormal monthly returns, for exercising the engine when no
+    historical file is available. Not market data.
+    """
+    annual_mean = np.array([0.10, 0.11, 0.08, 0.09, 0.045])
+    annual_vol = np.array([0.15, 0.20, 0.17, 0.23, 0.05])
+    corr = np.array([
+        [1.00, 0.85, 0.80, 0.70, 0.10],
+        [0.85, 1.00, 0.75, 0.70, 0.05],
+        [0.80, 0.75, 1.00, 0.80, 0.10],
+        [0.70, 0.70, 0.80, 1.00, 0.05],
+        [0.10, 0.05, 0.10, 0.05, 1.00],
+    ])
+    vol = annual_vol / np.sqrt(12)
+    mu = np.log1p(annual_mean) / 12 - vol ** 2 / 2
+    cov = corr * np.outer(vol, vol)
+    rng = np.random.RandomState(seed)
+    return np.expm1(rng.multivariate_normal(mu, cov, size=months))
+
+
+def allocation_weights(allocation: Dict[str, Any]) -> np.ndarray:
+    """Weights over ASSET_CLASSES from a calculate_allocation() result"""
+    breakdown = allocation["breakdown"]
+    w = np.array([float(breakdown.get(k, 0.0)) for k in ASSET_CLASSES])
+    return w / w.sum() if w.sum() else w
+
+
+def backtest(
+    weights: np.ndarray,
+    returns: np.ndarray,
+    start_indices: Optional[Sequence[int]] = None,
+    horizon_months: int = DEFAULT_HORIZON_MONTHS,
+    contributions: Any = DEFAULT_CONTRIBUTION,
+    rebalance_months: int = DEFAULT_REBALANCE_MONTHS,
+) -> Dict[str, np.ndarray]:
+    """
+    Run every allocation from every start date.
+
+    Args:
+        weights: (A, K) target weights per allocation (rows sum to 1)
+        returns: (T, K) monthly returns
+        start_indices: start months (default: every start with a full horizon)
+        horizon_months: months simulated per run
+        contributions: monthly contribution, scalar or (horizon_months,) schedule,
+            invested at the start of each month at target weights
+        rebalance_months: reset holdings to target weights every N months (0 = never)
+
+    Returns:
+        Arrays of shape (A, S): cagr (time-weighted), max_drawdown, volatility
+        (annualized), final_value, contributed
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    returns = np.asarray(returns, dtype=np.float64)
+    n_months, n_assets = returns.shape
+    if weights.shape[1] != n_assets:
+        raise ValueError(f"weights have {weights.shape[1]} asset classes, returns have {n_assets}")
+    if horizon_months > n_months:
+        raise ValueError(f"horizon of {horizon_months} months exceeds the {n_months} months of data")
+
+    if start_indices is None:
+        start_indices = np.arange(n_months - horizon_months + 1)
+    starts = np.asarray(start_indices, dtype=np.int64)
+    schedule = np.broadcast_to(np.asarray(contributions, dtype=np.float64), (horizon_months,))
+
+    n_alloc, n_starts = len(weights), len(starts)
+    target = weights[:, None, :]                              # (A, 1, K)
+    holdings = np.zeros((n_alloc, n_starts, n_assets))        # (A, S, K) dollars
+    index = np.ones((n_alloc, n_starts))                      # time-weighted growth of $1
+    peak = np.ones((n_alloc, n_starts))
+    max_dd = np.zeros((n_alloc, n_starts))
+    sum_r = np.zeros((n_alloc, n_starts))
+    sum_r2 = np.zeros((n_alloc, n_starts))
+
+    for t in range(horizon_months):
+        holdings += schedule[t] * target
+        if rebalance_months and t and t % rebalance_months == 0:
+            holdings = holdings.sum(axis=2, keepdims=True) * target
+        before = holdings.sum(axis=2)
+        holdings *= 1.0 + returns[starts + t][None, :, :]
+        after = holdings.sum(axis=2)
+
+        r = np.divide(after, before, out=np.ones_like(after), where=before > 0) - 1.0
+        index *= 1.0 + r
+        np.maximum(peak, index, out=peak)
+        np.maximum(max_dd, 1.0 - index / peak, out=max_dd)
+        sum_r += r
+        sum_r2 += r * r
+
+    mean = sum_r / horizon_months
+    var = np.maximum(sum_r2 / horizon_months - mean ** 2, 0.0) * horizon_months / max(horizon_months - 1, 1)
+    return {
+        "cagr": index ** (12.0 / horizon_months) - 1.0,
+        "max_drawdown": max_dd,
+        "volatility": np.sqrt(var * 12.0),
+        "final_value": holdings.sum(axis=2),
+        "contributed": np.full((n_alloc, n_starts), schedule.sum()),
+    }
+
+
+def summarize(results: Dict[str, np.ndarray], labels: Sequence[str]) -> List[Dict[str, Any]]:
+    """Median and 5th/95th percentiles across start dates for each allocation"""
+    out = []
+    for a, label in enumerate(labels):
+        row: Dict[str, Any] = {"allocation": label}
+        for metric in ("cagr", "max_drawdown", "volatility", "final_value"):
+            p5, p50, p95 = np.percentile(results[metric][a], [5, 50, 95])
+            row[metric] = {"p5": round(float(p5), 4), "median": round(float(p50), 4), "p95": round(float(p95), 4)}
+        row["contributed"] = round(float(results["contributed"][a, 0]), 2)
+        out.append(row)
+    return out
+
+
+def sweep_profiles(
+    returns: np.ndarray,
+    ages: Sequence[int] = AGE_BANDS,
+    risk_tiers: Sequence[str] = RISK_TIERS,
+    horizon_months: int = DEFAULT_HORIZON_MONTHS,
+    monthly_contribution: float = DEFAULT_CONTRIBUTION,
+    rebalance_months: int = DEFAULT_REBALANCE_MONTHS,
+) -> List[Dict[str, Any]]:
+    """Backtest calculate_allocation() for every risk tier x age band over all start dates"""
+    from investment_coach import calculate_allocation
+
+    labels, rows = [], []
+    for tier in risk_tiers:
+        for age in ages:
+            labels.append(f"{tier}/age{age}")
+            rows.append(allocation_weights(calculate_allocation(tier, age, monthly_contribution, horizon_months)))
+    results = backtest(
+        np.vstack(rows), returns,
+        horizon_months=horizon_months,
+        contributions=monthly_contribution,
+        rebalance_months=rebalance_months,
+    )
+    return summarize(results, labels)
+
+
+# Example usage
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Backtest recommended allocations over monthly return history")
+    parser.add_argument("--returns", default=HISTORICAL_RETURNS_PATH, help="CSV of monthly returns (not shipped)")
+    parser.add_argument("--synthetic", action="store_true", help="use generated returns instead of a data file")
+    parser.add_argument("--horizon", type=int, default=DEFAULT_HORIZON_MONTHS, help="months per run")
+    parser.add_argument("--contribution", type=float, default=DEFAULT_CONTRIBUTION)
+    parser.add_argument("--rebalance", type=int, default=DEFAULT_REBALANCE_MONTHS, help="months between rebalances, 0 = never")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        series = synthetic_returns(360)
+    else:
+        try:
+            series = load_returns(args.returns)[1]
+        except FileNotFoundError:
+            parser.error(
+                f"no return series at {args.returns}; none is shipped with the repo. Pass a CSV with "
+                f"--returns (a date column plus {', '.join(ASSET_CLASSES)}) or use --synthetic"
+            )
+
+    t0 = time.perf_counter()
+    summary = sweep_profiles(
+        series,
+        horizon_months=args.horizon,
+        monthly_contribution=args.contribution,
+        rebalance_months=args.rebalance,
+    )
+    elapsed = time.perf_counter() - t0
+    print(json.dumps(summary, indent=2))
+    print(f"{len(summary)} allocations x {len(series) - args.horizon + 1} start dates in {elapsed:.2f}s")
@@ -0,0 +1,401 @@
+"""
+Micro-Benchmarks
+Times the Python hot paths of the plan, coach and insights generators and saves the
+results as JSON so two runs can be compared for regressions.
+
+    python benchmarks.py run -o bench_before.json
+    python benchmarks.py run -o bench_after.json
+    python benchmarks.py compare bench_before.json bench_after.json --threshold 0.10
+"""
+
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Benchmark Configuration
+DEFAULT_REPEAT = 7            # timed rounds per benchmark
+MIN_ROUND_S = 0.05            # each round loops the callable until it runs at least this long
+DEFAULT_THRESHOLD = 0.10      # relative slowdown flagged as a regression
+DEFAULT_STAT = "min_us"       # fastest round is the least noisy estimate of intrinsic cost
+
+_BENCHMARKS: Dict[str, Callable[[], Callable[[], Any]]] = {}
+
+
+def benchmark(name: str):
+    """Register a setup function returning the zero-argument callable to time"""
+    def decorator(setup: Callable[[], Callable[[], Any]]):
+        _BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def _sample_payload() -> Dict[str, Any]:
+    with Path("sample_json").open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _sample_profile():
+    from schemas import UserProfile
+    return UserProfile.model_validate(_sample_payload())
+
+
+SAMPLE_PORTFOLIO = {"VOO": 40, "VTI": 20, "VEA": 10, "BND": 30}
+
+
+@benchmark("schemas.UserProfile.model_validate")
+def _bench_model_validate():
+    from schemas import UserProfile
+    payload = _sample_payload()
+    return lambda: UserProfile.model_validate(payload)
+
+
+@benchmark("rag._build_question+_create_prompt")
+def _bench_rag_prompt():
+    from rag import _build_question, _create_prompt
+    profile = _sample_profile()
+    contexts = [("401(k) plans let employees defer part of their salary before tax. " * 12)] * 8
+    return lambda: _create_prompt(_build_question(profile), contexts)
+
+
+@benchmark("rag._retrieve_contexts")
+def _bench_rag_retrieve():
+    from rag import _retrieve_contexts
+    from vectorstore import load_vectordb
+    from config import TOP_K
+    retriever = load_vectordb().as_retriever(search_kwargs={"k": TOP_K})
+    profile = _sample_profile()
+    _retrieve_contexts(retriever, profile)  # warm the embedder and index
+    return lambda: _retrieve_contexts(retriever, profile)
+
+
+@benchmark("rag.json_extraction")
+def _bench_rag_json():
+    from rag import _json_block
+    from fake_llm_server import fake_completion
+    text = "Sure! Here is the plan:\n" + fake_completion('"greeting", "recommendations"')
+
+    def run():
+        m = _json_block.search(text)
+        return json.loads(m.group(0) if m else text)
+    return run
+
+
+@benchmark("investment_coach._parse_ai_recommendations")
+def _bench_coach_json():
+    from investment_coach import _parse_ai_recommendations
+    from fake_llm_server import fake_completion
+    text = "Here you go:\n" + fake_completion('"strategy_overview"')
+    return lambda: _parse_ai_recommendations(text)
+
+
+@benchmark("market_insights._parse_insights")
+def _bench_insights_json():
+    from market_insights import _parse_insights
+    from fake_llm_server import fake_completion
+    text = "Update:\n" + fake_completion('"main_insight"')
+    return lambda: _parse_insights(text)
+
+
+@benchmark("investment_coach.calculate_allocation")
+def _bench_allocation():
+    from investment_coach import calculate_allocation
+    return lambda: calculate_allocation("medium", 30, 500, 60)
+
+
+@benchmark("investment_coach.get_recommended_etfs")
+def _bench_recommended_etfs():
+    from investment_coach import get_recommended_etfs
+    return lambda: get_recommended_etfs("medium", 500)
+
+
+def _synthetic_universe(n: int = 5000):
+    """Universe of n random funds, the size of the full listed-ETF market"""
+    import numpy as np
+    from etf_universe import ETFUniverse
+
+    rng = np.random.RandomState(0)
+    return ETFUniverse(
+        symbol=[f"E{i:05d}" for i in range(n)],
+        name=[f"Synthetic ETF {i}" for i in range(n)],
+        type=rng.choice(["Bond", "Large Cap Equity", "Growth", "International", "Sector"], n).tolist(),
+        expense_ratio=np.round(rng.gamma(2.0, 0.15, n), 2),
+        risk_tier=rng.randint(-1, 3, n),
+        core=rng.rand(n) < 0.01,
+        sector=rng.choice(["broad", "tech", "bonds", "Energy", "Healthcare"], n).tolist(),
+        change_percent=rng.normal(0, 1.5, n),
+        volume=["moderate"] * n,
+        asset_class=rng.choice(["equity", "bond", "commodity", "real_estate"], n).tolist(),
+        avg_daily_volume=rng.lognormal(12, 2, n),
+        min_investment=np.round(rng.lognormal(4, 1, n), 2),
+    )
+
+
+@benchmark("etf_screener.screen[5000 funds]")
+def _bench_screen_large():
+    from etf_screener import ETFScreener, Screen
+    screener = ETFScreener(_synthetic_universe())
+    s = Screen(risk_tier="medium", asset_classes=("equity",), max_expense_ratio=0.2,
+               min_avg_daily_volume=1e5, max_min_investment=250.0, sort_by="score", top_n=10)
+    return lambda: screener.screen(s)
+
+
+@benchmark("etf_overlap.analyze_portfolio[uncached]")
+def _bench_overlap():
+    from etf_overlap import HoldingsMatrix, analyze_portfolio
+    from config import ETF_HOLDINGS_PATH
+    holdings = HoldingsMatrix.from_csv(ETF_HOLDINGS_PATH)
+
+    def run():
+        holdings._overlap_cache.clear()
+        holdings._exposure_cache.clear()
+        return analyze_portfolio(SAMPLE_PORTFOLIO, holdings)
+    return run
+
+
+@benchmark("investment_coach._build_market_context")
+def _bench_coach_context():
+    from investment_coach import _build_market_context, calculate_allocation, get_recommended_etfs
+    etfs = get_recommended_etfs("medium", 500)
+    allocation = calculate_allocation("medium", 30, 500, 60)
+    return lambda: _build_market_context(etfs, allocation)
+
+
+@benchmark("market_insights.calculate_portfolio_impact")
+def _bench_portfolio_impact():
+    from market_insights import calculate_portfolio_impact
+    return lambda: calculate_portfolio_impact(SAMPLE_PORTFOLIO)
+
+
+@benchmark("market_insights._build_market_context")
+def _bench_insights_context():
+    from market_insights import _build_market_context, calculate_portfolio_impact
+    impact = calculate_portfolio_impact(SAMPLE_PORTFOLIO)
+    return lambda: _build_market_context(SAMPLE_PORTFOLIO, impact)
+
+
+@benchmark("projections.project_profiles[1000 profiles]")
+def _bench_projections():
+    from schemas import UserProfile
+    from projections import project_profiles
+    payload = _sample_payload()
+    payload["form"]["debts"] = [
+        {"name": "Credit card", "balance": 3200, "apr_percent": 22.9, "min_payment": 90},
+        {"name": "Student loan", "balance": 18000, "apr_percent": 5.5, "min_payment": 200},
+    ]
+    profiles = [UserProfile.model_validate(payload)] * 1000
+    return lambda: project_profiles(profiles)
+
+
+@benchmark("contributions.optimize_profiles[1000 profiles]")
+def _bench_contributions():
+    from contributions import optimize_profiles
+    profiles = [_sample_profile()] * 1000
+    return lambda: optimize_profiles(profiles)
+
+
+@benchmark("api_server.ResponseCache.get[304]")
+def _bench_cached_api():
+    from api_server import ResponseCache, is_not_modified
+
+    cache = ResponseCache()
+    etag = cache.get("market-analysis").etag
+
+    def run():
+        return is_not_modified(cache.get("market-analysis"), etag, None)
+    return run
+
+
+@benchmark("backtest.backtest[30 allocations x 30y]")
+def _bench_backtest():
+    import numpy as np
+    from backtest import backtest, synthetic_returns
+
+    returns = synthetic_returns(360)
+    weights = np.random.RandomState(0).dirichlet(np.ones(returns.shape[1]), size=30)
+    return lambda: backtest(weights, returns, horizon_months=120)
+
+
+def _time_callable(fn: Callable[[], Any], repeat: int, min_round_s: float) -> Dict[str, Any]:
+    """Calibrate a loop count, then time `repeat` rounds with GC disabled"""
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_round_s or loops >= 1 << 24:
+            break
+        loops *= 2 if elapsed <= 0 else max(2, min(10, int(min_round_s / elapsed) + 1))
+
+    rounds = []
+    gc_was_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            rounds.append((time.perf_counter() - t0) / loops)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    return {
+        "loops": loops,
+        "repeat": repeat,
+        "median_us": round(statistics.median(rounds) * 1e6, 4),
+        "min_us": round(min(rounds) * 1e6, 4),
+        "max_us": round(max(rounds) * 1e6, 4),
+        "stdev_us": round(statistics.stdev(rounds) * 1e6, 4) if len(rounds) > 1 else 0.0,
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(
+    names: Optional[List[str]] = None,
+    repeat: int = DEFAULT_REPEAT,
+    min_round_s: float = MIN_ROUND_S,
+) -> Dict[str, Any]:
+    """Run the selected benchmarks (default: all); ones whose setup fails are recorded as skipped"""
+    results: Dict[str, Any] = {}
+    for name, setup in _BENCHMARKS.items():
+        if names and not any(n in name for n in names):
+            continue
+        try:
+            fn = setup()
+        except Exception as e:
+            results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+            continue
+        results[name] = _time_callable(fn, repeat, min_round_s)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def compare_runs(
+    base: Dict[str, Any],
+    new: Dict[str, Any],
+    threshold: float = DEFAULT_THRESHOLD,
+    stat: str = DEFAULT_STAT,
+) -> Dict[str, Any]:
+    """
+    Compare two saved runs on `stat` ("min_us" or "median_us"). A benchmark regresses
+    when the new value exceeds the base value by more than `threshold` (relative).
+    Benchmarks missing or skipped in either run are listed under "not_compared".
+    """
+    def status(r: Optional[Dict[str, Any]]) -> str:
+        if r is None:
+            return "missing"
+        if "skipped" in r:
+            return f"skipped ({r['skipped']})"
+        return "ok" if stat in r else f"no {stat}"
+
+    base_results, new_results = base.get("results", {}), new.get("results", {})
+    rows, not_compared = [], []
+    for name in list(base_results) + [n for n in new_results if n not in base_results]:
+        b, n = base_results.get(name), new_results.get(name)
+        if status(b) != "ok" or status(n) != "ok":
+            not_compared.append({"name": name, "base": status(b), "new": status(n)})
+            continue
+        ratio = n[stat] / b[stat] if b[stat] else float("inf")
+        rows.append({
+            "name": name,
+            "base_us": b[stat],
+            "new_us": n[stat],
+            "change": round(ratio - 1.0, 4),
+            "regression": ratio - 1.0 > threshold,
+            "improvement": 1.0 - ratio > threshold,
+        })
+    return {
+        "threshold": threshold,
+        "stat": stat,
+        "rows": rows,
+        "regressions": [r["name"] for r in rows if r["regression"]],
+        "not_compared": not_compared,
+    }
+
+
+def format_results(run: Dict[str, Any]) -> str:
+    lines = [f"{'benchmark':<48} {'median us':>12} {'min us':>12} {'stdev us':>10}"]
+    for name, r in run["results"].items():
+        if "skipped" in r:
+            lines.append(f"{name:<48} skipped ({r['skipped'][:60]})")
+        else:
+            lines.append(f"{name:<48} {r['median_us']:>12.3f} {r['min_us']:>12.3f} {r['stdev_us']:>10.3f}")
+    return "\n".join(lines)
+
+
+def format_comparison(cmp: Dict[str, Any]) -> str:
+    lines = [f"{'benchmark':<48} {'base us':>12} {'new us':>12} {'change':>9}"]
+    for r in cmp["rows"]:
+        flag = "  REGRESSION" if r["regression"] else ("  faster" if r["improvement"] else "")
+        lines.append(f"{r['name']:<48} {r['base_us']:>12.3f} {r['new_us']:>12.3f} {r['change']:>+9.1%}{flag}")
+    if cmp.get("not_compared"):
+        lines.append(f"not compared ({len(cmp['not_compared'])}):")
+        for r in cmp["not_compared"]:
+            lines.append(f"  {r['name']:<46} base: {r['base'][:40]}; new: {r['new'][:40]}")
+    return "\n".join(lines)
+
+
+# Example usage
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the Python hot paths")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="run benchmarks and optionally save JSON")
+    run_p.add_argument("-o", "--output", default=None)
+    run_p.add_argument("-k", "--filter", action="append", default=None, help="substring of benchmark names to run")
+    run_p.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    run_p.add_argument("--min-round", type=float, default=MIN_ROUND_S)
+
+    cmp_p = sub.add_parser("compare", help="compare two saved runs")
+    cmp_p.add_argument("base")
+    cmp_p.add_argument("new")
+    cmp_p.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    cmp_p.add_argument("--stat", choices=["min_us", "median_us"], default=DEFAULT_STAT)
+    cmp_p.add_argument("--strict", action="store_true", help="also fail when a benchmark could not be compared")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run = run_benchmarks(args.filter, repeat=args.repeat, min_round_s=args.min_round)
+        print(format_results(run))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(run, f, indent=2)
+    else:
+        with open(args.base, "r", encoding="utf-8") as f:
+            base_run = json.load(f)
+        with open(args.new, "r", encoding="utf-8") as f:
+            new_run = json.load(f)
+        comparison = compare_runs(base_run, new_run, args.threshold, args.stat)
+        print(format_comparison(comparison))
+        failed = comparison["regressions"] or (args.strict and comparison["not_compared"])
+        sys.exit(1 if failed else 0)
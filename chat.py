@@ -0,0 +1,312 @@
+"""
+Session-Aware Chat
+Chat backend for the Results page built on the rag retrieval path. Each session keeps
+its profile block, a per-session retrieval cache and a rolling summary of older turns,
+so the prompt sent per turn stays within a fixed budget however long the conversation
+gets.
+"""
+
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from schemas import UserProfile
+from config import MODEL_ID
+
+# Chat Configuration
+MAX_NEW_TOKENS = 400
+TEMPERATURE = 0.4
+CHARS_PER_TOKEN = 4
+HISTORY_TOKEN_BUDGET = 600      # recent turns kept verbatim
+SUMMARY_TOKEN_BUDGET = 250      # rolling summary of everything older
+CONTEXT_TOKEN_BUDGET = 700      # retrieved chunks per turn
+MIN_RECENT_TURNS = 2            # always keep the last exchange verbatim
+RETRIEVAL_K = 3
+RETRIEVAL_CACHE_SIZE = 64       # cached queries per session
+SESSION_TTL_S = 60 * 60
+MAX_SESSIONS = 10_000
+
+SYSTEM_PROMPT = (
+    "You are an expert financial advisor chatbot helping a newly employed person with their first "
+    "financial decisions. Be conversational, encouraging and concise (2-4 paragraphs max). Reference "
+    "the user's own numbers, explain jargon simply, do 'what if' math from their data and suggest "
+    "specific next steps. Use the provided context for factual claims; if it is not there, say so.\n"
+    "Platform features you can point users to: the AI Investment Coach (/InvestmentCoach) for ETF "
+    "recommendations, allocation, monthly breakdown and rebalancing; and Brokerage Account Opening "
+    "(4 steps, from the Investment Coach Action Plan tab; Principal Securities is the recommended broker)."
+)
+
+_word = re.compile(r"[a-z0-9]+")
+_sentence_end = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    first = _sentence_end.split(text, 1)[0]
+    return first if len(first) <= max_chars else first[:max_chars - 3].rstrip() + "..."
+
+
+def _normalize_query(text: str) -> str:
+    return " ".join(_word.findall(text.lower()))
+
+
+def build_profile_block(p: UserProfile) -> str:
+    """Compact profile facts, built once per session"""
+    cf, bn, sg = p.form.cashflow, p.form.benefits, p.form.savings_goal
+    lines = [
+        f"Name: {p.name}; age {p.age}; {p.quiz.state}; salary ${p.salary:,.0f}; "
+        f"{p.quiz.marital_status.value}; tenure {p.quiz.employment_tenure.value}",
+        f"Risk tolerance: {p.quiz.risk_tolerance.value if p.quiz.risk_tolerance else 'unspecified'}",
+        "Concerns: " + ("; ".join(c.value for c in p.quiz.top_concerns) or "unspecified"),
+    ]
+    if cf.monthly_take_home_pay is not None or cf.monthly_expenses is not None:
+        surplus = (cf.monthly_take_home_pay or 0) - (cf.monthly_expenses or 0)
+        lines.append(
+            f"Monthly take-home ${cf.monthly_take_home_pay or 0:,.0f}, expenses ${cf.monthly_expenses or 0:,.0f}, "
+            f"surplus ${surplus:,.0f}; savings ${cf.current_savings or 0:,.0f}"
+        )
+    if bn.employer_offers_retirement_plan or bn.employer_plan_options:
+        opts = ", ".join(o.value for o in bn.employer_plan_options) or "none listed"
+        lines.append(
+            f"Employer plans: {opts}; match {bn.employer_match_percent or 0}%; "
+            f"contributing {'yes' if bn.contributing_now else 'no'} (${bn.current_monthly_contribution or 0:,.0f}/mo)"
+        )
+    if sg.what_are_you_saving_for:
+        lines.append(
+            f"Goal: {sg.what_are_you_saving_for} ${sg.target_amount or 0:,.0f} in {sg.timeline_months or 'N/A'} months"
+        )
+    return "\n".join(lines)
+
+
+class ChatSession:
+    """Per-session state: profile block, recent turns, rolling summary and retrieval cache"""
+
+    def __init__(self, session_id: str, profile: Optional[UserProfile] = None):
+        self.session_id = session_id
+        self.profile_block = build_profile_block(profile) if profile is not None else ""
+        self.profile = profile
+        self.turns: List[Tuple[str, str]] = []
+        self.summary_lines: List[str] = []
+        self.retrieval_cache: Dict[str, List[Tuple[str, str]]] = {}
+        self.base_contexts: Optional[List[Tuple[str, str]]] = None
+        self.last_active = time.time()
+        self.lock = threading.Lock()
+
+    @property
+    def summary(self) -> str:
+        return "\n".join(self.summary_lines)
+
+    def add_turn(self, role: str, content: str) -> None:
+        self.turns.append((role, content))
+        self._compact()
+
+    def _compact(self) -> None:
+        """Fold the oldest verbatim turns into the rolling summary until both fit their budgets"""
+        while (
+            len(self.turns) > MIN_RECENT_TURNS
+            and sum(estimate_tokens(c) for _, c in self.turns) > HISTORY_TOKEN_BUDGET
+        ):
+            role, content = self.turns.pop(0)
+            label = "User asked" if role == "user" else "Advisor said"
+            self.summary_lines.append(f"- {label}: {_first_sentence(content, 160)}")
+        while self.summary_lines and estimate_tokens(self.summary) > SUMMARY_TOKEN_BUDGET:
+            self.summary_lines.pop(0)
+
+
+class SessionStore:
+    """In-memory sessions with idle expiry"""
+
+    def __init__(self, ttl_s: float = SESSION_TTL_S, max_sessions: int = MAX_SESSIONS):
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, ChatSession] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, session_id: Optional[str], profile: Optional[UserProfile] = None) -> ChatSession:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = ChatSession(session_id or uuid.uuid4().hex, profile)
+                self._sessions[session.session_id] = session
+            elif profile is not None and session.profile is None:
+                session.profile = profile
+                session.profile_block = build_profile_block(profile)
+            session.last_active = now
+            return session
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expire(self, now: float) -> None:
+        stale = [sid for sid, s in self._sessions.items() if now - s.last_active > self.ttl_s]
+        for sid in stale:
+            del self._sessions[sid]
+        if len(self._sessions) >= self.max_sessions:
+            oldest = sorted(self._sessions.values(), key=lambda s: s.last_active)
+            for s in oldest[: len(self._sessions) - self.max_sessions + 1]:
+                del self._sessions[s.session_id]
+
+
+sessions = SessionStore()
+
+
+def _search(retriever, query: str, k: int) -> List[Tuple[str, str]]:
+    docs = retriever.invoke(query) if hasattr(retriever, "invoke") else retriever.similarity_search(query, k=k)
+    out = []
+    for d in docs[:k]:
+        source = (getattr(d, "metadata", None) or {}).get("source", "")
+        out.append((getattr(d, "page_content", "") or "", source))
+    return out
+
+
+def _session_contexts(retriever, session: ChatSession, message: str) -> List[Tuple[str, str]]:
+    """
+    Chunks for this turn: the message's own retrieval (cached per normalized query)
+    followed by the profile-level chunks retrieved once per session, deduplicated and
+    cut to CONTEXT_TOKEN_BUDGET.
+    """
+    if retriever is None:
+        return []
+    if session.base_contexts is None:
+        if session.profile is not None:
+            from rag import _retrieve_contexts
+            contexts, sources = _retrieve_contexts(retriever, session.profile)
+            session.base_contexts = list(zip(contexts, sources))
+        else:
+            session.base_contexts = []
+
+    key = _normalize_query(message)
+    hits = session.retrieval_cache.get(key)
+    if hits is None:
+        hits = _search(retriever, message, RETRIEVAL_K)
+        if len(session.retrieval_cache) >= RETRIEVAL_CACHE_SIZE:
+            session.retrieval_cache.pop(next(iter(session.retrieval_cache)))
+        session.retrieval_cache[key] = hits
+
+    chosen, seen, used = [], set(), 0
+    budget = CONTEXT_TOKEN_BUDGET * CHARS_PER_TOKEN
+    for text, source in hits + session.base_contexts:
+        dedup = (source, text[:120])
+        if not text or dedup in seen:
+            continue
+        seen.add(dedup)
+        if used + len(text) > budget:
+            text = text[: max(0, budget - used)]
+            if len(text) < 200:
+                break
+        chosen.append((text, source))
+        used += len(text)
+        if used >= budget:
+            break
+    return chosen
+
+
+def build_messages(session: ChatSession, message: str, contexts: List[Tuple[str, str]]) -> List[Dict[str, str]]:
+    """Chat messages for one turn: system rules, profile, summary, recent turns, context + question"""
+    system = SYSTEM_PROMPT
+    if session.profile_block:
+        system += "\n\nUSER PROFILE:\n" + session.profile_block
+    if session.summary_lines:
+        system += "\n\nEARLIER IN THIS CONVERSATION:\n" + session.summary
+    messages = [{"role": "system", "content": system}]
+    messages += [{"role": role, "content": content} for role, content in session.turns]
+
+    user = message
+    if contexts:
+        ctx = "\n\n".join(f"[{i + 1}] {text}" for i, (text, _) in enumerate(contexts))
+        user = f"Context:\n{ctx}\n\nQuestion: {message}"
+    messages.append({"role": "user", "content": user})
+    return messages
+
+
+def _call_chat(messages: List[Dict[str, str]]) -> str:
+    from rag import client
+
+    resp = client.chat.completions.create(
+        model=MODEL_ID,
+        messages=messages,
+        max_tokens=MAX_NEW_TOKENS,
+        temperature=TEMPERATURE,
+    )
+    return (resp.choices[0].message.content or "").strip()
+
+
+def chat_turn(
+    retriever,
+    message: str,
+    session_id: Optional[str] = None,
+    profile: Optional[UserProfile] = None,
+    store: SessionStore = sessions,
+) -> Dict[str, Any]:
+    """
+    Answer one chat message. Pass the profile on the first turn of a session; later turns
+    only need the session_id.
+    """
+    t0 = time.perf_counter()
+    session = store.get_or_create(session_id, profile)
+
+    with session.lock:
+        contexts = _session_contexts(retriever, session, message)
+        t1 = time.perf_counter()
+        messages = build_messages(session, message, contexts)
+        prompt_chars = sum(len(m["content"]) for m in messages)
+
+        try:
+            reply = _call_chat(messages)
+        except Exception as e:
+            t_err = time.perf_counter()
+            return {
+                "success": False,
+                "session_id": session.session_id,
+                "error": f"LLM call failed: {type(e).__name__}: {e}",
+                "timing": {"retrieve_s": round(t1 - t0, 3), "total_s": round(t_err - t0, 3)},
+            }
+        t2 = time.perf_counter()
+
+        session.add_turn("user", message)
+        session.add_turn("assistant", reply)
+
+    return {
+        "success": True,
+        "session_id": session.session_id,
+        "reply": reply,
+        "sources": list(dict.fromkeys(s for _, s in contexts if s)),
+        "prompt_tokens_est": (prompt_chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN,
+        "timing": {
+            "retrieve_s": round(t1 - t0, 3),
+            "llm_s": round(t2 - t1, 3),
+            "total_s": round(t2 - t0, 3),
+        },
+    }
+
+
+# Example usage
+if __name__ == "__main__":
+    import json
+    from pathlib import Path
+
+    sample_path = Path("sample_json")
+    with sample_path.open("r", encoding="utf-8") as f:
+        profile = UserProfile.model_validate(json.load(f))
+
+    from vectorstore import load_vectordb
+    from config import TOP_K
+
+    retriever = load_vectordb().as_retriever(search_kwargs={"k": TOP_K})
+    sid = None
+    for question in ["Should I use the Roth 401k?", "How much should I save each month for my car?"]:
+        out = chat_turn(retriever, question, session_id=sid, profile=profile)
+        sid = out["session_id"]
+        print(json.dumps(out, indent=2))
@@ -0,0 +1,219 @@
+"""
+Compact Output Schema
+Optional wire format for the three generators' LLM output: one- or two-letter keys,
+citations as numbers of the context chunks shown in the prompt instead of repeated
+URLs, and short codes for boilerplate warnings. The server expands a compact
+completion back into the regular response shape and records how many completion
+tokens the compact form saved.
+
+Enable with COMPACT_OUTPUT=1.
+"""
+
+import json
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Union
+
+# Compact Schema Configuration
+CHARS_PER_TOKEN = 4        # rough tokenizer stand-in, same as fake_llm_server.py
+RECENT_REQUESTS = 100      # per-request usage records kept for snapshot_stats()
+
+WARNING_CODES = {
+    "EDU": "This is educational content, not financial advice.",
+    "TAX": "Tax rules and contribution limits change every year; confirm them with the IRS or a tax professional.",
+    "VEST": "Employer contributions may be subject to a vesting schedule.",
+    "FEES": "Check fund expense ratios and plan fees before investing.",
+    "RISK": "Investing involves risk",
+    "VOL": "Markets can be volatile",
+    "PAST": "Past performance doesn't guarantee future results",
+}
+
+# short key -> long key, or (long key, nested spec | "warnings" | "citations")
+Spec = Dict[str, Union[str, tuple]]
+
+SCHEMAS: Dict[str, Spec] = {
+    "plan": {
+        "g": "greeting",
+        "r": ("recommendations", {"t": "title", "s": "summary", "p": "steps", "c": "considerations",
+                                  "ci": ("citations", "citations")}),
+        "w": ("warnings", "warnings"),
+        "y": "as_of_year",
+    },
+    "coach": {
+        "g": "greeting",
+        "o": "strategy_overview",
+        "r": ("specific_recommendations", {"s": "symbol", "n": "name", "a": "allocation_percent", "y": "reasoning"}),
+        "a": "action_steps",
+        "k": ("risk_considerations", "warnings"),
+        "b": "rebalancing_schedule",
+    },
+    "insights": {
+        "g": "greeting",
+        "m": "main_insight",
+        "p": "portfolio_impact_explanation",
+        "h": ("whats_happening", {"e": "event", "x": "simple_explanation", "i": "impact_on_you"}),
+        "l": "looking_ahead",
+        "w": "should_i_worry",
+        "o": "opportunity",
+    },
+}
+
+
+def _legend(spec: Spec) -> str:
+    parts = []
+    for short, target in spec.items():
+        long, sub = target if isinstance(target, tuple) else (target, None)
+        nested = f" [{{{_legend(sub)}}}]" if isinstance(sub, dict) else ""
+        parts.append(f'"{short}"={long}{nested}')
+    return ", ".join(parts)
+
+
+def compact_instructions(kind: str, numbered_context: bool = False) -> str:
+    """Prompt lines asking for the compact form of a generator's JSON"""
+    lines = [
+        f"Output compact JSON (schema: {kind}): use these short keys instead of the key names above: "
+        f"{_legend(SCHEMAS[kind])}."
+    ]
+    if numbered_context:
+        lines.append("Citations are the numbers of the context chunks, e.g. [1, 3]; do not repeat URLs.")
+    if kind == "coach":
+        lines.append('"n" (name) may be omitted; it is filled in from the symbol.')
+    lines.append(
+        "Warnings that match one of these codes are written as the code alone: "
+        + "; ".join(f"{code} = {text}" for code, text in WARNING_CODES.items())
+        + "."
+    )
+    return "\n".join(lines) + "\n"
+
+
+def _expand_warnings(items: Any) -> Any:
+    if not isinstance(items, list):
+        return items
+    return [WARNING_CODES.get(w.strip().upper(), w) if isinstance(w, str) else w for w in items]
+
+
+def _expand_citations(items: Any, sources: Optional[List[str]]) -> Any:
+    if not isinstance(items, list) or sources is None:
+        return items
+    out = []
+    for c in items:
+        if isinstance(c, str) and c.strip().strip("[]").isdigit():
+            c = int(c.strip().strip("[]"))
+        if isinstance(c, int) and not isinstance(c, bool):
+            c = sources[c - 1] if 1 <= c <= len(sources) else None
+        if c and c not in out:
+            out.append(c)
+    return out
+
+
+def _targets(spec: Spec) -> Dict[str, tuple]:
+    """(long key, nested spec) by short key and by long key, so long keys also pass through"""
+    table = {}
+    for short, target in spec.items():
+        long, sub = target if isinstance(target, tuple) else (target, None)
+        table[short] = table[long] = (long, sub)
+    return table
+
+
+def _expand(value: Any, spec: Spec, sources: Optional[List[str]]) -> Any:
+    if isinstance(value, list):
+        return [_expand(v, spec, sources) for v in value]
+    if not isinstance(value, dict):
+        return value
+    table = _targets(spec)
+    out = {}
+    for key, v in value.items():
+        long, sub = table.get(key, (key, None))
+        if sub == "warnings":
+            v = _expand_warnings(v)
+        elif sub == "citations":
+            v = _expand_citations(v, sources)
+        elif isinstance(sub, dict):
+            v = _expand(v, sub, sources)
+        out[long] = v
+    return out
+
+
+def expand(kind: str, data: Any, sources: Optional[List[str]] = None) -> Any:
+    """
+    Long-key response from a compact completion. Citation numbers are 1-based indexes
+    into `sources` (the context chunks in prompt order); completions that already use
+    the long keys come back unchanged.
+    """
+    return _expand(data, SCHEMAS[kind], sources)
+
+
+def _compress(value: Any, spec: Spec) -> Any:
+    if isinstance(value, list):
+        return [_compress(v, spec) for v in value]
+    if not isinstance(value, dict):
+        return value
+    inverse = {}
+    for short, target in spec.items():
+        long, sub = target if isinstance(target, tuple) else (target, None)
+        inverse[long] = (short, sub)
+    codes = {text: code for code, text in WARNING_CODES.items()}
+    out = {}
+    for key, v in value.items():
+        short, sub = inverse.get(key, (key, None))
+        if sub == "warnings" and isinstance(v, list):
+            v = [codes.get(w, w) for w in v]
+        elif sub == "citations" and isinstance(v, list):
+            v = list(range(1, len(v) + 1))
+        elif isinstance(sub, dict):
+            v = _compress(v, sub)
+        out[short] = v
+    return out
+
+
+def compress(kind: str, data: Any) -> Any:
+    """Compact form of a long-key response (citations become chunk numbers 1..n)"""
+    return _compress(data, SCHEMAS[kind])
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
+
+
+class OutputUsage:
+    """Completion tokens of compact responses vs. their expanded (long-key) equivalent"""
+
+    def __init__(self, recent: int = RECENT_REQUESTS):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, int]] = {}
+        self._recent: deque = deque(maxlen=recent)
+
+    def record(self, kind: str, completion: str, expanded: Any) -> Dict[str, int]:
+        """Record one request; returns its completion, expanded-equivalent and saved token counts"""
+        compact_tokens = estimate_tokens(completion)
+        expanded_tokens = estimate_tokens(json.dumps(expanded, ensure_ascii=False))
+        row = {
+            "completion_tokens": compact_tokens,
+            "expanded_tokens": expanded_tokens,
+            "saved_tokens": expanded_tokens - compact_tokens,
+        }
+        with self._lock:
+            totals = self._totals.setdefault(kind, {"requests": 0, "completion_tokens": 0, "expanded_tokens": 0, "saved_tokens": 0})
+            totals["requests"] += 1
+            for k, v in row.items():
+                totals[k] += v
+            self._recent.append({"kind": kind, **row})
+        return row
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"totals": {k: dict(v) for k, v in self._totals.items()}, "recent": list(self._recent)}
+
+
+usage = OutputUsage()
+
+
+# Example usage
+if __name__ == "__main__":
+    from fake_llm_server import _fake_insights, _fake_investment, _fake_plan
+
+    for kind, full in (("plan", _fake_plan("")), ("coach", _fake_investment("")), ("insights", _fake_insights(""))):
+        wire = json.dumps(compress(kind, full), ensure_ascii=False)
+        sources = [f"https://example.com/doc{i}" for i in range(1, 4)]
+        print(kind, usage.record(kind, wire, expand(kind, json.loads(wire), sources)))
+    print(compact_instructions("plan", numbered_context=True))
@@ -6,4 +6,17 @@ load_dotenv(find_dotenv())
 MODEL_ID = os.getenv("MODEL_ID", "meta-llama/Llama-3.1-8B-Instruct")
 HF_TOKEN = os.getenv("HUGGINGFACEHUB_API_TOKEN")
 CHROMA_DIR = os.getenv("CHROMA_DIR", "chroma_db")  
-TOP_K = int(os.getenv("TOP_K", "4"))
\ No newline at end of file
+INDEX_ROOT = os.getenv("INDEX_ROOT", "indexes")  # versioned indexes; CURRENT there takes precedence over CHROMA_DIR
+TOP_K = int(os.getenv("TOP_K", "4"))
+RETRIEVAL_K_EACH = int(os.getenv("RETRIEVAL_K_EACH", "0")) or None  # hits per plan query; unset = TOP_K
+RETRIEVAL_K_TOTAL = int(os.getenv("RETRIEVAL_K_TOTAL", "8"))  # plan chunks after merging
+HNSW_SEARCH_EF = int(os.getenv("HNSW_SEARCH_EF", "0")) or None  # HNSW candidates per query the index should use (set offline, see retrieval_eval.py); unset = the collection's own
+INFERENCE_BASE_URL = os.getenv("INFERENCE_BASE_URL")  # e.g. http://127.0.0.1:8080 for fake_llm_server.py
+PLAN_STORE_PATH = os.getenv("PLAN_STORE_PATH", "plan_store.sqlite3")
+CORPUS_VERSION = os.getenv("CORPUS_VERSION")  # defaults to the active index version, else a content hash of CHROMA_DIR
+ETF_UNIVERSE_PATH = os.getenv("ETF_UNIVERSE_PATH", "data/etf_universe.csv")
+ETF_HOLDINGS_PATH = os.getenv("ETF_HOLDINGS_PATH", "data/etf_holdings.csv")
+HISTORICAL_RETURNS_PATH = os.getenv("HISTORICAL_RETURNS_PATH", "data/monthly_returns.csv")
+IRS_LIMITS_PATH = os.getenv("IRS_LIMITS_PATH", "data/irs_limits.csv")
+COMPACT_OUTPUT = os.getenv("COMPACT_OUTPUT", "0").lower() in ("1", "true", "yes")  # short-key LLM output, see compact_schema.py
+FRACTIONAL_SHARES = os.getenv("FRACTIONAL_SHARES", "1").lower() in ("1", "true", "yes")  # 0 = only recommend ETFs whose share price fits the allocation slice
@@ -0,0 +1,241 @@
+"""
+Contribution Optimizer
+Allocates a monthly savings budget across employer-match capture, HSA, Roth or
+traditional 401(k) and a taxable account using a local table of yearly IRS limits
+(data/irs_limits.csv), so the plan does not depend on the LLM finding limits in the
+retrieved documents. Many profiles are optimized per call as NumPy arrays.
+
+Order of the waterfall:
+  1. 401(k) up to the full employer match (the match is assumed dollar-for-dollar up to
+     employer_match_percent of salary)
+  2. HSA up to the yearly limit, when offered
+  3. 401(k) up to the elective deferral limit (plus catch-up by age)
+  4. Taxable brokerage account
+401(k) dollars go to Roth when it is offered and taxable income is within the 12%
+bracket, otherwise to traditional.
+"""
+
+import csv
+import hashlib
+import threading
+from datetime import date
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from schemas import MaritalStatus, PlanOption, UserProfile
+from config import IRS_LIMITS_PATH
+
+
+class YearLimits(NamedTuple):
+    """IRS limits for one tax year, in dollars per year"""
+    year: int
+    elective_deferral: float
+    catch_up_50: float
+    catch_up_60_63: float
+    hsa_self: float
+    hsa_family: float
+    hsa_catch_up_55: float
+    fsa_health: float
+    standard_deduction_single: float
+    standard_deduction_married: float
+    bracket_12_top_single: float
+    bracket_12_top_married: float
+
+
+class LimitsTable:
+    """Yearly limits keyed by tax year, with a content hash as the table version"""
+
+    def __init__(self, rows: Sequence[YearLimits], version: str):
+        if not rows:
+            raise ValueError("IRS limits table is empty")
+        self._by_year = {r.year: r for r in rows}
+        self.years = sorted(self._by_year)
+        self.version = version
+
+    @classmethod
+    def from_csv(cls, path: str = IRS_LIMITS_PATH) -> "LimitsTable":
+        with open(path, "rb") as f:
+            raw = f.read()
+        rows = []
+        for row in csv.DictReader(raw.decode("utf-8").splitlines()):
+            rows.append(YearLimits(int(row["year"]), *(float(row[k]) for k in YearLimits._fields[1:])))
+        return cls(rows, hashlib.sha256(raw).hexdigest()[:12])
+
+    def for_year(self, year: Optional[int] = None) -> YearLimits:
+        """Limits for a tax year; the latest known year at or before it (default: this year)"""
+        year = year or date.today().year
+        known = [y for y in self.years if y <= year]
+        return self._by_year[known[-1] if known else self.years[0]]
+
+
+_table: Optional[LimitsTable] = None
+_table_lock = threading.Lock()
+
+
+def get_limits_table() -> LimitsTable:
+    """Process-wide limits table, loaded on first use"""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = LimitsTable.from_csv(IRS_LIMITS_PATH)
+    return _table
+
+
+def optimize_contributions(
+    budget: np.ndarray,
+    salary: np.ndarray,
+    age: np.ndarray,
+    match_percent: np.ndarray,
+    has_traditional: np.ndarray,
+    has_roth: np.ndarray,
+    has_hsa: np.ndarray,
+    married: np.ndarray,
+    limits: YearLimits,
+) -> Dict[str, np.ndarray]:
+    """
+    Allocate monthly budgets for N profiles. All inputs are (N,) arrays.
+
+    Returns:
+        (N,) monthly dollars per account: traditional_401k, roth_401k, hsa, taxable,
+        plus employer_match (the employer's dollars), match_needed (employee dollars
+        for the full match) and the monthly 401(k) and HSA caps
+    """
+    budget = np.maximum(np.asarray(budget, dtype=np.float64), 0.0)
+    salary = np.asarray(salary, dtype=np.float64)
+    age = np.asarray(age)
+    married = np.asarray(married, dtype=bool)
+    has_401k = np.asarray(has_traditional, dtype=bool) | np.asarray(has_roth, dtype=bool)
+
+    catch_up = np.where((age >= 60) & (age <= 63) & (limits.catch_up_60_63 > 0), limits.catch_up_60_63,
+                        np.where(age >= 50, limits.catch_up_50, 0.0))
+    k_cap = np.where(has_401k, (limits.elective_deferral + catch_up) / 12.0, 0.0)
+    hsa_year = np.where(married, limits.hsa_family, limits.hsa_self) + np.where(age >= 55, limits.hsa_catch_up_55, 0.0)
+    hsa_cap = np.where(has_hsa, hsa_year / 12.0, 0.0)
+    match_needed = np.minimum(salary * np.nan_to_num(np.asarray(match_percent, dtype=np.float64)) / 1200.0, k_cap)
+
+    to_match = np.minimum(budget, match_needed)
+    rest = budget - to_match
+    to_hsa = np.minimum(rest, hsa_cap)
+    rest -= to_hsa
+    to_401k = np.minimum(rest, k_cap - to_match)
+    rest -= to_401k
+
+    taxable_income = salary - np.where(married, limits.standard_deduction_married, limits.standard_deduction_single)
+    low_bracket = taxable_income <= np.where(married, limits.bracket_12_top_married, limits.bracket_12_top_single)
+    roth = np.asarray(has_roth, dtype=bool) & (low_bracket | ~np.asarray(has_traditional, dtype=bool))
+    k_total = to_match + to_401k
+    return {
+        "traditional_401k": np.where(roth, 0.0, k_total),
+        "roth_401k": np.where(roth, k_total, 0.0),
+        "hsa": to_hsa,
+        "taxable": rest,
+        "employer_match": to_match,
+        "match_needed": match_needed,
+        "k_cap": k_cap,
+        "hsa_cap": hsa_cap,
+    }
+
+
+def default_budget(p: UserProfile, match_needed: float) -> float:
+    """The current contribution, raised to what the full match needs"""
+    return max(float(p.form.benefits.current_monthly_contribution or 0.0), match_needed)
+
+
+def optimize_profiles(
+    profiles: List[UserProfile],
+    budgets: Optional[Sequence[Optional[float]]] = None,
+    year: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Contribution plans for many profiles in one call; budgets default to default_budget()"""
+    limits = get_limits_table().for_year(year)
+    n = len(profiles)
+    options = [set(p.form.benefits.employer_plan_options) for p in profiles]
+    offers_plan = np.array([p.form.benefits.employer_offers_retirement_plan is not False for p in profiles])
+    columns = dict(
+        salary=np.array([p.salary for p in profiles], dtype=np.float64),
+        age=np.array([p.age for p in profiles]),
+        match_percent=np.array([p.form.benefits.employer_match_percent or 0.0 for p in profiles], dtype=np.float64),
+        has_traditional=np.array([PlanOption.k401 in o for o in options]) & offers_plan,
+        has_roth=np.array([PlanOption.roth_401k in o for o in options]) & offers_plan,
+        has_hsa=np.array([PlanOption.hsa in o for o in options]),
+        married=np.array([p.quiz.marital_status == MaritalStatus.married for p in profiles]),
+    )
+    if budgets is None:
+        budgets = [None] * n
+    if any(b is None for b in budgets):
+        needed = optimize_contributions(np.zeros(n), limits=limits, **columns)["match_needed"]
+        budgets = [default_budget(p, float(needed[i])) if b is None else b for i, (p, b) in enumerate(zip(profiles, budgets))]
+
+    out = optimize_contributions(np.asarray(budgets, dtype=np.float64), limits=limits, **columns)
+    plans = []
+    for i in range(n):
+        plans.append({
+            "year": limits.year,
+            "limits_version": get_limits_table().version,
+            "monthly_budget": round(float(budgets[i]), 2),
+            "allocation": {k: round(float(out[k][i]), 2) for k in ("traditional_401k", "roth_401k", "hsa", "taxable")},
+            "employer_match": round(float(out["employer_match"][i]), 2),
+            "match_needed": round(float(out["match_needed"][i]), 2),
+            "match_captured": bool(out["employer_match"][i] >= out["match_needed"][i] - 0.005),
+            "annual_limits": {
+                "401k": round(float(out["k_cap"][i]) * 12, 2),
+                "hsa": round(float(out["hsa_cap"][i]) * 12, 2),
+                "fsa_health": limits.fsa_health if PlanOption.fsa in options[i] else 0.0,
+            },
+        })
+    return plans
+
+
+def optimize_profile(p: UserProfile, budget: Optional[float] = None, year: Optional[int] = None) -> Dict[str, Any]:
+    return optimize_profiles([p], [budget], year)[0]
+
+
+_ACCOUNT_LABELS = {
+    "traditional_401k": "traditional 401(k)",
+    "roth_401k": "Roth 401(k)",
+    "hsa": "HSA",
+    "taxable": "taxable brokerage",
+}
+
+
+def contribution_facts(plan: Dict[str, Any]) -> str:
+    """Compact prompt lines for an optimize_profile() result"""
+    limits = plan["annual_limits"]
+    limit_parts = [f"401(k) ${limits['401k']:,.0f}" if limits["401k"] else "no 401(k) offered"]
+    if limits["hsa"]:
+        limit_parts.append(f"HSA ${limits['hsa']:,.0f}")
+    if limits["fsa_health"]:
+        limit_parts.append(f"health FSA ${limits['fsa_health']:,.0f}")
+    split = ", ".join(
+        f"${amount:,.0f} {_ACCOUNT_LABELS[k]}" for k, amount in plan["allocation"].items() if amount > 0
+    ) or "nothing"
+    lines = [
+        f"- {plan['year']} IRS limits: " + ", ".join(limit_parts),
+        f"- Monthly ${plan['monthly_budget']:,.0f}: {split}",
+    ]
+    if plan["match_needed"] > 0:
+        lines.append(
+            f"- Full employer match needs ${plan['match_needed']:,.0f}/mo "
+            f"({'captured' if plan['match_captured'] else 'not captured'}; employer adds ${plan['employer_match']:,.0f}/mo)"
+        )
+    return "\n".join(lines)
+
+
+# Example usage
+if __name__ == "__main__":
+    import json
+    import time
+    from pathlib import Path
+
+    with Path("sample_json").open("r", encoding="utf-8") as f:
+        profile = UserProfile.model_validate(json.load(f))
+
+    print(contribution_facts(optimize_profile(profile)))
+    print(contribution_facts(optimize_profile(profile, budget=1500)))
+
+    batch = [profile] * 10_000
+    t0 = time.perf_counter()
+    optimize_profiles(batch)
+    print(f"{len(batch)} profiles in {time.perf_counter() - t0:.2f}s")
@@ -1,14 +1,29 @@
-import tarfile, os
-
-ARCHIVE = "chroma_db.tar.gz"
-TARGET  = "chroma_db"
-
-if not os.path.isdir(TARGET):
-    if not os.path.isfile(ARCHIVE):
-        raise FileNotFoundError(f"Archive {ARCHIVE} not found in {os.getcwd()}")
-    print(f"Extracting {ARCHIVE} -> {TARGET}/ ...")
-    with tarfile.open(ARCHIVE, "r:gz") as t:
-        t.extractall(".")
-    print("Done.")
+"""
+Corpus Index Installer
+Installs chroma_db.tar.gz as a new checksummed index version under INDEX_ROOT (with
+HNSW_SEARCH_EF applied, when set), points CURRENT at it and removes versions no process
+has open anymore. Running servers pick the new version up without a restart (see
+index_versions.py).
+
+    python db_extraction.py [archive.tar.gz]
+"""
+
+import os
+import sys
+
+from config import HNSW_SEARCH_EF
+from index_versions import activate, collect_garbage, current_version, install
+
+ARCHIVE = sys.argv[1] if len(sys.argv) > 1 else "chroma_db.tar.gz"
+
+if not os.path.isfile(ARCHIVE):
+    raise FileNotFoundError(f"Archive {ARCHIVE} not found in {os.getcwd()}")
+previous = current_version()
+print(f"Installing {ARCHIVE} ...")
+version = install(ARCHIVE, search_ef=HNSW_SEARCH_EF)
+if version == previous:
+    print(f"{version} is already the active index version; nothing to do.")
 else:
-    print(f"{TARGET}/ already exists; nothing to extract.")
\ No newline at end of file
+    activate(version)
+    removed = collect_garbage()
+    print(f"Active index version: {version}" + (f" (removed {', '.join(removed)})" if removed else ""))
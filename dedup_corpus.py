@@ -0,0 +1,218 @@
+"""
+Near-Duplicate Chunk Elimination
+Offline pass over the Chroma collection that finds near-duplicate chunks with
+MinHash + LSH banding, keeps one representative per cluster with the merged source
+list in its metadata, and writes a compacted collection plus a report of the space
+saved. Stored embeddings are copied over, so nothing is re-embedded.
+
+    python dedup_corpus.py --src chroma_db --dst chroma_db_dedup --report dedup_report.json
+"""
+
+import json
+import os
+import re
+import zlib
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import CHROMA_DIR
+
+# Dedup Configuration
+COLLECTION_NAME = "langchain"   # langchain_chroma's default collection
+NUM_PERM = 128
+BANDS = 16                      # 16 bands x 8 rows: ~60% chance of pairing at Jaccard 0.7, ~99% at 0.85
+SHINGLE_WORDS = 5
+JACCARD_THRESHOLD = 0.8
+WRITE_BATCH = 256
+
+_PRIME = np.uint64(4294967291)  # largest prime below 2**32, so a * x fits in uint64
+_word = re.compile(r"\w+")
+
+
+def _shingles(text: str, k: int = SHINGLE_WORDS) -> np.ndarray:
+    """32-bit hashes of the document's overlapping k-word shingles"""
+    words = _word.findall(text.lower())
+    if len(words) < k:
+        grams = [" ".join(words)] if words else [""]
+    else:
+        grams = [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64))
+
+
+def _permutations(num_perm: int, seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, int(_PRIME), size=num_perm, dtype=np.int64).astype(np.uint64)
+    b = rng.randint(0, int(_PRIME), size=num_perm, dtype=np.int64).astype(np.uint64)
+    return a, b
+
+
+def minhash_signatures(texts: List[str], num_perm: int = NUM_PERM, seed: int = 1) -> np.ndarray:
+    """(n_docs, num_perm) MinHash signature matrix"""
+    a, b = _permutations(num_perm, seed)
+    sigs = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for i, text in enumerate(texts):
+        hv = _shingles(text)[:, None]
+        sigs[i] = ((hv * a + b) % _PRIME).min(axis=0)
+    return sigs
+
+
+def lsh_candidate_pairs(sigs: np.ndarray, bands: int = BANDS) -> set:
+    """Pairs of row indices that share at least one identical band"""
+    n, num_perm = sigs.shape
+    rows = num_perm // bands
+    pairs = set()
+    for band in range(bands):
+        buckets: Dict[bytes, List[int]] = {}
+        chunk = np.ascontiguousarray(sigs[:, band * rows:(band + 1) * rows])
+        for i in range(n):
+            buckets.setdefault(chunk[i].tobytes(), []).append(i)
+        for members in buckets.values():
+            if len(members) > 1:
+                pairs.update(combinations(members, 2))  # every pair; members are in ascending order
+    return pairs
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def cluster_near_duplicates(
+    texts: List[str],
+    threshold: float = JACCARD_THRESHOLD,
+    num_perm: int = NUM_PERM,
+    bands: int = BANDS,
+) -> List[List[int]]:
+    """Group documents whose estimated Jaccard similarity is at least `threshold`"""
+    sigs = minhash_signatures(texts, num_perm)
+    parent = list(range(len(texts)))
+    for i, j in lsh_candidate_pairs(sigs, bands):
+        if np.mean(sigs[i] == sigs[j]) >= threshold:
+            ri, rj = _find(parent, i), _find(parent, j)
+            if ri != rj:
+                parent[rj] = ri
+    clusters: Dict[int, List[int]] = {}
+    for i in range(len(texts)):
+        clusters.setdefault(_find(parent, i), []).append(i)
+    return list(clusters.values())
+
+
+def _merged_metadata(members: List[int], metadatas: List[Optional[Dict[str, Any]]], rep: int) -> Dict[str, Any]:
+    meta = dict(metadatas[rep] or {})
+    sources = []
+    for i in members:
+        s = (metadatas[i] or {}).get("source")
+        if s and s not in sources:
+            sources.append(s)
+    if len(members) > 1:
+        # Chroma metadata values must be scalars, so the merged list is stored as a string
+        meta["merged_sources"] = " | ".join(sources)
+        meta["duplicate_count"] = len(members)
+    return meta
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def dedup_collection(
+    src_dir: str = CHROMA_DIR,
+    dst_dir: str = CHROMA_DIR + "_dedup",
+    collection: str = COLLECTION_NAME,
+    threshold: float = JACCARD_THRESHOLD,
+    num_perm: int = NUM_PERM,
+    bands: int = BANDS,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """Read the source collection, cluster near-duplicates and write the compacted copy"""
+    import chromadb
+
+    if os.path.abspath(src_dir) == os.path.abspath(dst_dir):
+        raise ValueError("Destination must differ from the source collection directory")
+
+    src = chromadb.PersistentClient(path=src_dir).get_collection(collection)
+    data = src.get(include=["documents", "metadatas", "embeddings"])
+    ids, texts = data["ids"], [d or "" for d in data["documents"]]
+    metadatas, embeddings = data["metadatas"], data["embeddings"]
+
+    clusters = cluster_near_duplicates(texts, threshold, num_perm, bands)
+    keep, keep_meta = [], []
+    for members in clusters:
+        rep = max(members, key=lambda i: len(texts[i]))
+        keep.append(rep)
+        keep_meta.append(_merged_metadata(members, metadatas, rep))
+
+    dup_clusters = sorted((m for m in clusters if len(m) > 1), key=len, reverse=True)
+    report: Dict[str, Any] = {
+        "collection": collection,
+        "threshold": threshold,
+        "num_perm": num_perm,
+        "bands": bands,
+        "chunks_before": len(ids),
+        "chunks_after": len(keep),
+        "chunks_removed": len(ids) - len(keep),
+        "duplicate_clusters": len(dup_clusters),
+        "text_bytes_before": sum(len(t.encode("utf-8")) for t in texts),
+        "text_bytes_after": sum(len(texts[i].encode("utf-8")) for i in keep),
+        "largest_clusters": [
+            {
+                "size": len(m),
+                "sources": sorted({(metadatas[i] or {}).get("source", "") for i in m}),
+                "preview": texts[m[0]][:120],
+            }
+            for m in dup_clusters[:10]
+        ],
+    }
+
+    if not dry_run:
+        dst = chromadb.PersistentClient(path=dst_dir).get_or_create_collection(
+            collection, metadata=src.metadata or None
+        )
+        for start in range(0, len(keep), WRITE_BATCH):
+            batch = keep[start:start + WRITE_BATCH]
+            dst.add(
+                ids=[ids[i] for i in batch],
+                documents=[texts[i] for i in batch],
+                embeddings=[list(embeddings[i]) for i in batch],
+                metadatas=keep_meta[start:start + WRITE_BATCH],
+            )
+        report["dir_bytes_before"] = _dir_size(src_dir)
+        report["dir_bytes_after"] = _dir_size(dst_dir)
+        report["dst_dir"] = dst_dir
+
+    return report
+
+
+# Example usage
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Remove near-duplicate chunks from the Chroma collection")
+    parser.add_argument("--src", default=CHROMA_DIR)
+    parser.add_argument("--dst", default=CHROMA_DIR + "_dedup")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--threshold", type=float, default=JACCARD_THRESHOLD)
+    parser.add_argument("--num-perm", type=int, default=NUM_PERM)
+    parser.add_argument("--bands", type=int, default=BANDS)
+    parser.add_argument("--dry-run", action="store_true", help="only report, do not write a new collection")
+    parser.add_argument("--report", default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.num_perm % args.bands:
+        parser.error("--num-perm must be a multiple of --bands")
+
+    result = dedup_collection(
+        args.src, args.dst, args.collection, args.threshold, args.num_perm, args.bands, args.dry_run
+    )
+    print(json.dumps(result, indent=2))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,206 @@
+"""
+ETF Holdings Overlap
+Loads ETF constituent weights from a local file into a sparse fund x security matrix
+and computes pairwise holdings overlap and a portfolio's look-through exposure to
+single stocks and sectors. Results are cached per fund set, so the analysis is cheap
+enough to run inside every recommendation request.
+
+Weights only cover the holdings listed in the file; anything a fund holds beyond them
+is reported as "unlisted", and overlap pairs carry each fund's listed share, since the
+overlap of listed holdings understates the full one.
+"""
+
+import csv
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from config import ETF_HOLDINGS_PATH
+
+OVERLAP_WARNING = 0.30       # pairwise overlap above which two funds are flagged
+TOP_EXPOSURES = 10
+CACHE_SIZE = 2048
+
+
+class HoldingsMatrix:
+    """
+    Fund x security weights (fractions of each fund) plus a security x sector one-hot map
+    and each security's asset class (single stocks are "equity")
+    """
+
+    def __init__(self, funds: List[str], securities: List[str], sectors: List[str],
+                 weights: sparse.csr_matrix, security_sector: np.ndarray,
+                 security_asset_class: Optional[List[str]] = None):
+        self.funds = funds
+        self.securities = securities
+        self.sectors = sectors
+        self.asset_classes = list(security_asset_class or ["equity"] * len(securities))
+        self.equity = np.array([a == "equity" for a in self.asset_classes])
+        self.weights = weights.tocsr()
+        self.fund_index = {f: i for i, f in enumerate(funds)}
+        self.sector_map = sparse.csr_matrix(
+            (np.ones(len(securities)), (np.arange(len(securities)), security_sector)),
+            shape=(len(securities), len(sectors)),
+        )
+        self.listed = np.asarray(self.weights.sum(axis=1)).ravel()
+        self._overlap_cache: "OrderedDict[Tuple[str, ...], np.ndarray]" = OrderedDict()
+        self._exposure_cache: "OrderedDict[Tuple[Tuple[str, float], ...], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_csv(cls, path: str = ETF_HOLDINGS_PATH) -> "HoldingsMatrix":
+        """Load rows of fund,security,sector,asset_class,weight_percent (asset_class defaults to equity)"""
+        funds: Dict[str, int] = {}
+        securities: Dict[str, int] = {}
+        sectors: Dict[str, int] = {}
+        security_sector: Dict[int, int] = {}
+        security_asset_class: Dict[int, str] = {}
+        rows, cols, vals = [], [], []
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                fund = row["fund"].strip().upper()
+                security = row["security"].strip().upper()
+                sector = (row.get("sector") or "Unknown").strip() or "Unknown"
+                i = funds.setdefault(fund, len(funds))
+                j = securities.setdefault(security, len(securities))
+                security_sector.setdefault(j, sectors.setdefault(sector, len(sectors)))
+                security_asset_class.setdefault(j, (row.get("asset_class") or "equity").strip().lower() or "equity")
+                rows.append(i)
+                cols.append(j)
+                vals.append(float(row["weight_percent"]) / 100.0)
+        weights = sparse.csr_matrix((vals, (rows, cols)), shape=(len(funds), len(securities)))
+        sector_of = np.array([security_sector[j] for j in range(len(securities))], dtype=np.int64)
+        asset_class_of = [security_asset_class[j] for j in range(len(securities))]
+        return cls(list(funds), list(securities), list(sectors), weights, sector_of, asset_class_of)
+
+    def _cached(self, cache: OrderedDict, key, compute):
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        value = compute()
+        with self._lock:
+            cache[key] = value
+            if len(cache) > CACHE_SIZE:
+                cache.popitem(last=False)
+        return value
+
+    def overlap_matrix(self, symbols: List[str]) -> Tuple[List[str], np.ndarray]:
+        """
+        Pairwise overlap sum_j min(w_a[j], w_b[j]) over the listed holdings of the known
+        funds among `symbols` (a lower bound on the full overlap; the diagonal is each
+        fund's listed weight). Returns the known symbols (sorted) and the symmetric matrix.
+
+        Computed like a sparse product holdings @ holdings^T with min in place of the
+        multiply: only funds sharing a security meet, and with each security's holders
+        sorted by weight, every holder adds its weight to the pairs with heavier holders.
+        """
+        known = tuple(sorted({s for s in symbols if s in self.fund_index}))
+
+        def compute() -> np.ndarray:
+            k = len(known)
+            if not k:
+                return np.zeros((0, 0))
+            ptr = self.weights.indptr
+            spans = [(ptr[self.fund_index[s]], ptr[self.fund_index[s] + 1]) for s in known]
+            take = np.concatenate([np.arange(lo, hi) for lo, hi in spans])
+            row = np.repeat(np.arange(k), [hi - lo for lo, hi in spans])
+            col, w = self.weights.indices[take], self.weights.data[take]
+
+            order = np.lexsort((w, col))
+            row, col, w = row[order], col[order], w[order]
+            later = np.searchsorted(col, col, side="right") - np.arange(len(col)) - 1
+            lighter = np.repeat(np.arange(len(col)), later)
+            heavier = lighter + 1 + np.arange(later.sum()) - np.repeat(np.cumsum(later) - later, later)
+            pairs = np.bincount(row[lighter] * k + row[heavier], weights=w[lighter], minlength=k * k).reshape(k, k)
+            return pairs + pairs.T + np.diag(np.bincount(row, weights=w, minlength=k))
+
+        return list(known), self._cached(self._overlap_cache, known, compute)
+
+    def look_through(self, portfolio: Dict[str, float], top_n: int = TOP_EXPOSURES) -> Dict[str, Any]:
+        """
+        Effective exposure of a {symbol: percent} portfolio to single stocks and sectors.
+        Non-equity holdings (bond index positions) are left out of the stock concentration
+        figures and reported per asset class instead.
+        """
+        key = tuple(sorted((s, round(float(p), 4)) for s, p in portfolio.items() if p))
+
+        def compute() -> Dict[str, Any]:
+            x = np.zeros(len(self.funds))
+            uncovered = 0.0
+            for symbol, pct in key:
+                i = self.fund_index.get(symbol)
+                if i is None:
+                    uncovered += pct
+                else:
+                    x[i] = pct / 100.0
+            exposure = self.weights.T @ x                 # security exposure, fraction of portfolio
+            sector = self.sector_map.T @ exposure
+            unlisted = float(x @ (1.0 - self.listed))
+
+            stock = np.where(self.equity, exposure, 0.0)
+            other: Dict[str, float] = {}
+            for j in np.flatnonzero(~self.equity & (exposure > 0)):
+                other[self.asset_classes[j]] = other.get(self.asset_classes[j], 0.0) + float(exposure[j])
+            listed_total = stock.sum()
+            shares = stock / listed_total if listed_total else stock
+            top_stock = np.argsort(-stock)[:top_n]
+            top_sector = np.argsort(-sector)
+            return {
+                "top_holdings": [
+                    {"security": self.securities[j], "exposure_percent": round(stock[j] * 100, 2)}
+                    for j in top_stock if stock[j] > 0
+                ],
+                "other_asset_classes": [
+                    {"asset_class": a, "exposure_percent": round(v * 100, 2)}
+                    for a, v in sorted(other.items(), key=lambda kv: -kv[1])
+                ],
+                "sectors": [
+                    {"sector": self.sectors[k], "exposure_percent": round(sector[k] * 100, 2)}
+                    for k in top_sector if sector[k] > 0
+                ],
+                "unlisted_percent": round(unlisted * 100, 2),
+                "no_holdings_data_percent": round(uncovered, 2),
+                # Inverse Herfindahl index of the listed single stocks
+                "effective_holdings": round(1.0 / float(shares @ shares), 1) if listed_total else None,
+            }
+
+        return self._cached(self._exposure_cache, key, compute)
+
+
+def analyze_portfolio(portfolio: Dict[str, float], holdings: Optional[HoldingsMatrix] = None) -> Dict[str, Any]:
+    """
+    Overlap pairs above OVERLAP_WARNING plus look-through exposure for a {symbol: percent}
+    portfolio. A pair's overlap only counts listed holdings, so it comes with the share of
+    each fund the listed holdings cover.
+    """
+    holdings = holdings or get_holdings()
+    symbols, matrix = holdings.overlap_matrix(list(portfolio))
+    pairs = []
+    for a in range(len(symbols)):
+        for b in range(a + 1, len(symbols)):
+            if matrix[a, b] >= OVERLAP_WARNING:
+                pairs.append({
+                    "funds": [symbols[a], symbols[b]],
+                    "overlap_percent": round(float(matrix[a, b]) * 100, 1),
+                    "listed_percent": [round(float(matrix[i, i]) * 100, 1) for i in (a, b)],
+                })
+    pairs.sort(key=lambda p: p["overlap_percent"], reverse=True)
+    return {"overlapping_pairs": pairs, **holdings.look_through(portfolio)}
+
+
+_holdings: Optional[HoldingsMatrix] = None
+_holdings_lock = threading.Lock()
+
+
+def get_holdings() -> HoldingsMatrix:
+    """Process-wide holdings matrix, loaded on first use"""
+    global _holdings
+    if _holdings is None:
+        with _holdings_lock:
+            if _holdings is None:
+                _holdings = HoldingsMatrix.from_csv(ETF_HOLDINGS_PATH)
+    return _holdings
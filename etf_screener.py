@@ -0,0 +1,174 @@
+"""
+ETF Screener
+Filters and ranks the ETF universe by risk tier, asset class, sector, expense ratio, liquidity
+and minimum investment. Sort orders are precomputed once per universe and partitioned by
+risk tier, so a screen only touches the candidate slice and returns the top N without
+sorting at request time.
+"""
+
+import bisect
+import threading
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from etf_universe import ETFUniverse, RISK_TIERS, get_universe
+
+SORT_KEYS = ("curated", "score", "expense_ratio", "liquidity")
+DEFAULT_TOP_N = 5
+BATCH_CACHE_SIZE = 4096
+
+
+class Screen(NamedTuple):
+    """Screen criteria; None means 'no constraint'. Hashable so batch results can be shared."""
+    risk_tier: Optional[str] = None
+    asset_classes: Optional[Tuple[str, ...]] = None
+    sectors: Optional[Tuple[str, ...]] = None
+    max_expense_ratio: Optional[float] = None
+    min_avg_daily_volume: Optional[float] = None
+    max_min_investment: Optional[float] = None
+    exclude_symbols: Optional[Tuple[str, ...]] = None
+    sort_by: str = "curated"
+    top_n: int = DEFAULT_TOP_N
+
+
+class ETFScreener:
+    """
+    Precomputes, per sort key, the full ordering of the universe and its per-tier
+    partitions. Orders:
+      - curated: core picks first in file order, then everything else by score
+      - score: cheap and liquid first (expense-ratio rank blended with liquidity rank)
+      - expense_ratio: lowest expense first, ties broken by liquidity
+      - liquidity: highest average daily volume first
+    """
+
+    def __init__(self, universe: ETFUniverse):
+        self.universe = universe
+        n = len(universe)
+        expense = np.nan_to_num(universe.expense_ratio, nan=np.inf)
+        liquidity = universe.avg_daily_volume
+
+        # Rank-based score in [0, 1]: equal weight to low cost and high liquidity
+        exp_rank = np.argsort(np.argsort(expense, kind="stable"), kind="stable")
+        liq_rank = np.argsort(np.argsort(-liquidity, kind="stable"), kind="stable")
+        self.score = 1.0 - (exp_rank + liq_rank) / max(2 * (n - 1), 1)
+
+        score_order = np.argsort(-self.score, kind="stable")
+        score_pos = np.empty(n, dtype=np.int64)
+        score_pos[score_order] = np.arange(n)
+        curated_key = np.where(universe.core, np.arange(n), n + score_pos)
+
+        self.orders: Dict[str, np.ndarray] = {
+            "curated": np.argsort(curated_key, kind="stable"),
+            "score": score_order,
+            "expense_ratio": np.lexsort((-liquidity, expense)),
+            "liquidity": np.argsort(-liquidity, kind="stable"),
+        }
+
+        self._asset_codes, self._asset_names = self._encode(universe.asset_class)
+        self._sector_codes, self._sector_names = self._encode(universe.sector)
+        self._partitions: Dict[Tuple[str, Optional[str]], np.ndarray] = {}
+        self._partition_expense: Dict[Tuple[str, Optional[str]], np.ndarray] = {}
+        for key, order in self.orders.items():
+            self._partitions[(key, None)] = order
+            for t, tier in enumerate(RISK_TIERS):
+                self._partitions[(key, tier)] = order[universe.risk_tier[order] == t]
+        for tier in (None,) + RISK_TIERS:
+            part = self._partitions[("expense_ratio", tier)]
+            self._partition_expense[("expense_ratio", tier)] = expense[part]
+
+        self._expense = expense
+        self._min_investment_levels = np.unique(universe.min_investment).tolist()
+        self._cache: Dict[Screen, List[int]] = {}
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def _encode(values: np.ndarray) -> Tuple[np.ndarray, Dict[str, int]]:
+        names, codes = np.unique(values.astype(str), return_inverse=True)
+        return codes.astype(np.int32), {name: i for i, name in enumerate(names.tolist())}
+
+    def screen(self, s: Screen) -> np.ndarray:
+        """Row indices of the top-N funds matching the screen, best first"""
+        if s.sort_by not in self.orders:
+            raise ValueError(f"Unknown sort key: {s.sort_by}")
+        if s.risk_tier is not None and s.risk_tier not in RISK_TIERS:
+            raise ValueError(f"Unknown risk tier: {s.risk_tier}")
+
+        key = (s.sort_by, s.risk_tier)
+        candidates = self._partitions[key]
+        if s.max_expense_ratio is not None and s.sort_by == "expense_ratio":
+            # Partition is sorted by expense: the constraint is a prefix cut
+            stop = np.searchsorted(self._partition_expense[key], s.max_expense_ratio, side="right")
+            candidates = candidates[:stop]
+
+        u = self.universe
+        mask = np.ones(len(candidates), dtype=bool)
+        if s.max_expense_ratio is not None and s.sort_by != "expense_ratio":
+            mask &= self._expense[candidates] <= s.max_expense_ratio
+        if s.asset_classes is not None:
+            codes = [self._asset_names[a] for a in s.asset_classes if a in self._asset_names]
+            mask &= np.isin(self._asset_codes[candidates], codes)
+        if s.sectors is not None:
+            codes = [self._sector_names[x] for x in s.sectors if x in self._sector_names]
+            mask &= np.isin(self._sector_codes[candidates], codes)
+        if s.min_avg_daily_volume is not None:
+            mask &= u.avg_daily_volume[candidates] >= s.min_avg_daily_volume
+        if s.max_min_investment is not None:
+            mask &= u.min_investment[candidates] <= s.max_min_investment
+        if s.exclude_symbols:
+            excluded = [i for i in (u.index_of(sym) for sym in s.exclude_symbols) if i is not None]
+            if excluded:
+                mask &= ~np.isin(candidates, excluded)
+
+        hits = np.flatnonzero(mask)[: s.top_n]
+        return candidates[hits]
+
+    def screen_records(self, s: Screen) -> List[Dict]:
+        return self.universe.records(self.screen(s))
+
+    def _normalize(self, s: Screen) -> Screen:
+        """
+        Snap the budget down to the nearest distinct minimum investment in the universe;
+        the result is unchanged, but profiles with nearby budgets share a cache entry.
+        """
+        if s.max_min_investment is None:
+            return s
+        levels = self._min_investment_levels
+        pos = bisect.bisect_right(levels, s.max_min_investment) - 1
+        budget = levels[pos] if pos >= 0 else -1.0
+        return s._replace(max_min_investment=budget)
+
+    def screen_batch(self, screens: Sequence[Screen]) -> List[List[int]]:
+        """
+        Screens for many profiles as lists of row indices; identical criteria are computed
+        once and shared (treat the returned lists as read-only)
+        """
+        results = []
+        for s in screens:
+            s = self._normalize(s)
+            hit = self._cache.get(s)
+            if hit is None:
+                hit = self.screen(s).tolist()
+                with self._cache_lock:
+                    if len(self._cache) >= BATCH_CACHE_SIZE:
+                        self._cache.clear()
+                    self._cache[s] = hit
+            results.append(hit)
+        return results
+
+
+_screener: Optional[ETFScreener] = None
+_screener_lock = threading.Lock()
+
+
+def get_screener() -> ETFScreener:
+    """Screener over the process-wide universe, rebuilt if the universe was swapped"""
+    global _screener
+    universe = get_universe()
+    screener = _screener
+    if screener is None or screener.universe is not universe:
+        with _screener_lock:
+            if _screener is None or _screener.universe is not universe:
+                _screener = ETFScreener(universe)
+            screener = _screener
+    return screener
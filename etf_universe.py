@@ -0,0 +1,211 @@
+"""
+ETF Universe
+Single symbol table shared by the investment coach and market insights. ETF metadata
+is loaded once from a local CSV into array-backed columns (symbol, name, type, expense
+ratio, risk tier, sector, daily change, volume, asset class, liquidity, minimum
+investment) with O(1) symbol lookup and vectorized filtering, so it scales to the full
+listed-ETF universe.
+"""
+
+import csv
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from config import ETF_UNIVERSE_PATH
+
+RISK_TIERS = ("low", "medium", "high")
+NO_TIER = -1
+
+COLUMNS = (
+    "symbol", "name", "type", "expense_ratio", "risk_tier", "core", "sector", "change_percent", "volume",
+    "asset_class", "avg_daily_volume", "min_investment",
+)
+
+
+class ETFUniverse:
+    """
+    Column store of ETFs. Columns are NumPy arrays for vectorized screens; Python list
+    mirrors are kept for cheap scalar access on the per-request paths.
+    """
+
+    def __init__(
+        self,
+        symbol: Iterable[str],
+        name: Iterable[str],
+        type: Iterable[str],
+        expense_ratio: Iterable[float],
+        risk_tier: Iterable[int],
+        core: Iterable[bool],
+        sector: Iterable[str],
+        change_percent: Iterable[float],
+        volume: Iterable[str],
+        asset_class: Iterable[str],
+        avg_daily_volume: Iterable[float],
+        min_investment: Iterable[float],
+    ):
+        self.symbol = np.asarray(list(symbol), dtype=object)
+        self.name = np.asarray(list(name), dtype=object)
+        self.type = np.asarray(list(type), dtype=object)
+        self.expense_ratio = np.asarray(list(expense_ratio), dtype=np.float64)
+        self.risk_tier = np.asarray(list(risk_tier), dtype=np.int8)
+        self.core = np.asarray(list(core), dtype=bool)
+        self.sector = np.asarray(list(sector), dtype=object)
+        self.change_percent = np.asarray(list(change_percent), dtype=np.float64)
+        self.volume = np.asarray(list(volume), dtype=object)
+        self.asset_class = np.asarray(list(asset_class), dtype=object)
+        self.avg_daily_volume = np.asarray(list(avg_daily_volume), dtype=np.float64)
+        self.min_investment = np.asarray(list(min_investment), dtype=np.float64)
+
+        n = len(self.symbol)
+        for col in COLUMNS[1:]:
+            if len(getattr(self, col)) != n:
+                raise ValueError(f"Column {col} has {len(getattr(self, col))} rows, expected {n}")
+
+        self._index = {s: i for i, s in enumerate(self.symbol.tolist())}
+        if len(self._index) != n:
+            raise ValueError("Duplicate symbols in ETF universe")
+
+        self._symbols = self.symbol.tolist()
+        self._names = self.name.tolist()
+        self._types = self.type.tolist()
+        self._expense = self.expense_ratio.tolist()
+        self._change = self.change_percent.tolist()
+        self._core_by_tier: Dict[str, List[int]] = {}
+
+    @classmethod
+    def from_csv(cls, path: str = ETF_UNIVERSE_PATH) -> "ETFUniverse":
+        """Load from a CSV with a header row; blank change_percent means no performance data"""
+        cols: Dict[str, List[Any]] = {k: [] for k in COLUMNS}
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                symbol = (row.get("symbol") or "").strip().upper()
+                if not symbol:
+                    continue
+                tier = (row.get("risk_tier") or "").strip().lower()
+                change = (row.get("change_percent") or "").strip()
+                cols["symbol"].append(symbol)
+                cols["name"].append((row.get("name") or "").strip())
+                cols["type"].append((row.get("type") or "").strip())
+                cols["expense_ratio"].append(float(row.get("expense_ratio") or "nan"))
+                cols["risk_tier"].append(RISK_TIERS.index(tier) if tier in RISK_TIERS else NO_TIER)
+                cols["core"].append((row.get("core") or "").strip() in ("1", "true", "True", "yes"))
+                cols["sector"].append((row.get("sector") or "").strip())
+                cols["change_percent"].append(float(change) if change else float("nan"))
+                cols["volume"].append((row.get("volume") or "").strip())
+                cols["asset_class"].append((row.get("asset_class") or "").strip().lower())
+                cols["avg_daily_volume"].append(float(row.get("avg_daily_volume") or 0))
+                cols["min_investment"].append(float(row.get("min_investment") or 0))
+        return cls(**cols)
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._index
+
+    def index_of(self, symbol: str) -> Optional[int]:
+        """Row index for a symbol, or None"""
+        return self._index.get(symbol)
+
+    def indices_of(self, symbols: Iterable[str]) -> np.ndarray:
+        """Row indices for many symbols, -1 where unknown"""
+        get = self._index.get
+        return np.fromiter((get(s, -1) for s in symbols), dtype=np.int64)
+
+    def record(self, i: int) -> Dict[str, Any]:
+        """ETF record in the shape the coach returns: symbol, name, type, expense_ratio"""
+        return {
+            "symbol": self._symbols[i],
+            "name": self._names[i],
+            "type": self._types[i],
+            "expense_ratio": self._expense[i],
+        }
+
+    def records(self, indices: Iterable[int]) -> List[Dict[str, Any]]:
+        return [self.record(int(i)) for i in indices]
+
+    def get(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Full row for a symbol, or None"""
+        i = self._index.get(symbol)
+        if i is None:
+            return None
+        tier = int(self.risk_tier[i])
+        change = self._change[i]
+        return {
+            **self.record(i),
+            "risk_tier": RISK_TIERS[tier] if tier != NO_TIER else None,
+            "sector": self.sector[i],
+            "change_percent": None if change != change else change,
+            "volume": self.volume[i],
+            "asset_class": self.asset_class[i],
+            "avg_daily_volume": float(self.avg_daily_volume[i]),
+            "min_investment": float(self.min_investment[i]),
+        }
+
+    def name_of(self, i: int) -> str:
+        return self._names[i]
+
+    def change_of(self, i: int) -> Optional[float]:
+        """Daily change for a row, or None when there is no performance data"""
+        change = self._change[i]
+        return None if change != change else change
+
+    def core_picks(self, risk_tier: str) -> List[int]:
+        """Row indices of the curated picks for a risk tier, in file order (cached)"""
+        picks = self._core_by_tier.get(risk_tier)
+        if picks is None:
+            picks = self.filter(risk_tier=risk_tier, core=True).tolist()
+            self._core_by_tier[risk_tier] = picks
+        return picks
+
+    def sector_funds(self) -> List[int]:
+        """Row indices of the sector ETFs (no risk tier), in file order"""
+        return np.flatnonzero((self.risk_tier == NO_TIER) & (self.type == "Sector")).tolist()
+
+    def filter(
+        self,
+        risk_tier: Optional[str] = None,
+        core: Optional[bool] = None,
+        max_expense_ratio: Optional[float] = None,
+        sectors: Optional[Iterable[str]] = None,
+        types: Optional[Iterable[str]] = None,
+        has_performance: Optional[bool] = None,
+    ) -> np.ndarray:
+        """Vectorized screen; returns matching row indices in file order"""
+        mask = np.ones(len(self), dtype=bool)
+        if risk_tier is not None:
+            mask &= self.risk_tier == RISK_TIERS.index(risk_tier)
+        if core is not None:
+            mask &= self.core == core
+        if max_expense_ratio is not None:
+            mask &= self.expense_ratio <= max_expense_ratio
+        if sectors is not None:
+            mask &= np.isin(self.sector, list(sectors))
+        if types is not None:
+            mask &= np.isin(self.type, list(types))
+        if has_performance is not None:
+            mask &= ~np.isnan(self.change_percent) == has_performance
+        return np.flatnonzero(mask)
+
+
+_universe: Optional[ETFUniverse] = None
+_universe_lock = threading.Lock()
+
+
+def get_universe() -> ETFUniverse:
+    """Process-wide universe, loaded on first use"""
+    global _universe
+    if _universe is None:
+        with _universe_lock:
+            if _universe is None:
+                _universe = ETFUniverse.from_csv(ETF_UNIVERSE_PATH)
+    return _universe
+
+
+def set_universe(universe: Optional[ETFUniverse]) -> None:
+    """Swap in a different universe (None reloads from ETF_UNIVERSE_PATH on next use)"""
+    global _universe
+    with _universe_lock:
+        _universe = universe
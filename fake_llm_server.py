@@ -0,0 +1,376 @@
+"""
+Fake LLM Inference Server
+Local stand-in for the HuggingFace / OpenAI-compatible inference endpoints used by
+rag.py, investment_coach.py and market_insights.py. Returns schema-valid JSON
+completions with configurable latency, token rate, error rate and streaming, so the
+generators can be load-tested offline without paid inference. Prompt prefixes are
+cached in blocks like a prefix-caching (KV cache reuse) server: cached prompt tokens
+are reported in usage.prompt_tokens_details and skip the modelled prefill time.
+
+Point the generators at it with:
+    INFERENCE_BASE_URL=http://127.0.0.1:8080
+"""
+
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Fake Server Configuration
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+TTFT_MEDIAN_S = 0.35       # median time-to-first-token
+TTFT_SIGMA = 0.5           # lognormal shape of time-to-first-token
+TOKENS_PER_S = 60.0        # decode rate
+ERROR_RATE = 0.0           # fraction of requests answered with an error status
+ERROR_STATUS = 503
+CHARS_PER_TOKEN = 4        # rough tokenizer stand-in
+PREFILL_TOKENS_PER_S = 0.0 # prompt processing rate for uncached tokens; 0 = prefill not modelled
+PREFIX_BLOCK_TOKENS = 16   # prefix cache granularity
+PREFIX_CACHE_BLOCKS = 8192 # LRU capacity of the prefix cache; 0 disables it
+
+
+def _fake_plan(prompt: str) -> Dict[str, Any]:
+    """Completion matching the rag.generate_plan schema"""
+    return {
+        "greeting": "Hi there, here's your personalized plan.",
+        "recommendations": [
+            {
+                "title": "Capture the full employer match",
+                "summary": "Contribute at least enough to your 401(k) to receive the full match.",
+                "steps": ["Check your match formula", "Set your contribution rate"],
+                "considerations": ["Vesting schedules may apply"],
+                "citations": ["https://www.irs.gov/retirement-plans"],
+            },
+            {
+                "title": "Build an emergency fund",
+                "summary": "Keep three to six months of expenses in a high-yield savings account.",
+                "steps": ["Automate a monthly transfer"],
+                "considerations": ["Keep it liquid"],
+                "citations": [],
+            },
+        ],
+        "warnings": ["This is educational content, not financial advice."],
+        "as_of_year": 2025,
+    }
+
+
+def _fake_investment(prompt: str) -> Dict[str, Any]:
+    """Completion matching the investment_coach schema"""
+    return {
+        "greeting": "Welcome to your personalized investment plan!",
+        "strategy_overview": "A low-cost, diversified ETF portfolio funded by monthly dollar-cost averaging.",
+        "specific_recommendations": [
+            {"symbol": "VTI", "name": "Vanguard Total Stock Market ETF", "allocation_percent": 50,
+             "reasoning": "Broad US equity exposure at a very low cost."},
+            {"symbol": "VEA", "name": "Vanguard FTSE Developed Markets ETF", "allocation_percent": 20,
+             "reasoning": "Adds international diversification."},
+            {"symbol": "BND", "name": "Vanguard Total Bond Market ETF", "allocation_percent": 30,
+             "reasoning": "Dampens volatility."},
+        ],
+        "action_steps": ["Open a brokerage account", "Set up automatic monthly investments", "Review quarterly"],
+        "risk_considerations": ["Markets can be volatile", "Past performance doesn't guarantee future results"],
+        "rebalancing_schedule": "Review quarterly, rebalance if allocation drifts 5%+",
+    }
+
+
+def _fake_insights(prompt: str) -> Dict[str, Any]:
+    """Completion matching the market_insights schema"""
+    return {
+        "greeting": "Here's your market update!",
+        "main_insight": "Technology stocks led the market higher today.",
+        "portfolio_impact_explanation": "Your equity ETFs rose with the broad market while bonds dipped slightly.",
+        "whats_happening": [
+            {"event": "Tech stocks rallied", "simple_explanation": "Strong AI chip demand lifted tech earnings expectations.",
+             "impact_on_you": "Your large-cap ETFs hold many of these companies."},
+        ],
+        "looking_ahead": "Watch the next Federal Reserve meeting.",
+        "should_i_worry": False,
+        "opportunity": "Stay the course with your regular contributions.",
+    }
+
+
+def fake_completion(prompt: str) -> str:
+    """Pick a schema-valid completion for whichever generator built the prompt"""
+    if '"main_insight"' in prompt:
+        kind, data = "insights", _fake_insights(prompt)
+    elif '"strategy_overview"' in prompt:
+        kind, data = "coach", _fake_investment(prompt)
+    else:
+        kind, data = "plan", _fake_plan(prompt)
+    if f"Output compact JSON (schema: {kind})" in prompt:
+        from compact_schema import compress
+        return json.dumps(compress(kind, data), ensure_ascii=False)
+    return json.dumps(data, indent=2)
+
+
+def _split_tokens(text: str) -> List[str]:
+    """Chop text into pseudo-tokens of CHARS_PER_TOKEN characters"""
+    return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """Serves /v1/chat/completions (OpenAI) and text-generation (HF TGI) requests"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeLLM/1.0"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") in ("/health", "/v1/models"):
+            self._send_json(200, {"status": "ok", "stats": self.server.snapshot_stats()})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON body"})
+            return
+
+        server = self.server
+        if server.should_fail():
+            server.record(error=True)
+            self._send_json(server.error_status, {"error": "Service temporarily unavailable (injected)"})
+            return
+
+        if self.path.rstrip("/").endswith("chat/completions"):
+            messages = body.get("messages") or []
+            prompt = "\n".join(str(m.get("content", "")) for m in messages)
+            max_tokens = body.get("max_tokens")
+            chat = True
+        else:
+            prompt = str(body.get("inputs", ""))
+            max_tokens = (body.get("parameters") or {}).get("max_new_tokens")
+            chat = False
+
+        tokens = _split_tokens(fake_completion(prompt))
+        finish_reason = "stop"
+        if max_tokens and len(tokens) > int(max_tokens):
+            tokens = tokens[:int(max_tokens)]
+            finish_reason = "length"
+        prompt_tokens = max(1, len(prompt) // CHARS_PER_TOKEN)
+        cached_tokens = server.match_prefix(prompt)
+
+        time.sleep(server.sample_ttft() + server.prefill_s(prompt_tokens - cached_tokens))
+        if body.get("stream"):
+            self._stream(tokens, chat, finish_reason, body.get("model"))
+        else:
+            time.sleep(len(tokens) / server.tokens_per_s)
+            text = "".join(tokens)
+            if chat:
+                self._send_json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model") or "fake-llm",
+                    "system_fingerprint": "fake-llm",
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": finish_reason,
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": len(tokens),
+                        "total_tokens": prompt_tokens + len(tokens),
+                        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                    },
+                })
+            else:
+                self._send_json(200, [{"generated_text": text}])
+        server.record(prompt_tokens=prompt_tokens, completion_tokens=len(tokens), cached_tokens=cached_tokens)
+
+    def _stream(self, tokens: List[str], chat: bool, finish_reason: str, model: Optional[str]) -> None:
+        """Send tokens as server-sent events at the configured decode rate"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        delay = 1.0 / self.server.tokens_per_s
+        for i, tok in enumerate(tokens):
+            last = i == len(tokens) - 1
+            if chat:
+                event = {
+                    "id": chunk_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model or "fake-llm",
+                    "system_fingerprint": "fake-llm",
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": tok},
+                        "finish_reason": finish_reason if last else None,
+                    }],
+                }
+            else:
+                event = {
+                    "index": i,
+                    "token": {"id": i, "text": tok, "logprob": 0.0, "special": False},
+                    "generated_text": "".join(tokens) if last else None,
+                    "details": None,
+                }
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(delay)
+        if chat:
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    def _send_json(self, status: int, payload: Any) -> None:
+        raw = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the latency/error configuration and counters"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=(DEFAULT_HOST, DEFAULT_PORT),
+        ttft_median_s: float = TTFT_MEDIAN_S,
+        ttft_sigma: float = TTFT_SIGMA,
+        tokens_per_s: float = TOKENS_PER_S,
+        error_rate: float = ERROR_RATE,
+        error_status: int = ERROR_STATUS,
+        prefill_tokens_per_s: float = PREFILL_TOKENS_PER_S,
+        prefix_cache_blocks: int = PREFIX_CACHE_BLOCKS,
+        seed: Optional[int] = None,
+        verbose: bool = False,
+    ):
+        super().__init__(address, FakeLLMHandler)
+        self.ttft_median_s = ttft_median_s
+        self.ttft_sigma = ttft_sigma
+        self.tokens_per_s = max(tokens_per_s, 1e-3)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.prefill_tokens_per_s = prefill_tokens_per_s
+        self.prefix_cache_blocks = prefix_cache_blocks
+        self.verbose = verbose
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._prefix_blocks: "OrderedDict[bytes, None]" = OrderedDict()
+        self._stats = {"requests": 0, "errors": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0}
+
+    def sample_ttft(self) -> float:
+        """Draw a lognormal time-to-first-token"""
+        if self.ttft_median_s <= 0:
+            return 0.0
+        with self._lock:
+            return self._rng.lognormvariate(math.log(self.ttft_median_s), self.ttft_sigma)
+
+    def should_fail(self) -> bool:
+        """Decide whether to inject an error for this request"""
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def match_prefix(self, prompt: str) -> int:
+        """
+        Prompt tokens served from the prefix cache: whole blocks of the prompt whose chained
+        hash (this block and everything before it) was seen before. All blocks are then cached.
+        """
+        if self.prefix_cache_blocks <= 0:
+            return 0
+        block_chars = PREFIX_BLOCK_TOKENS * CHARS_PER_TOKEN
+        keys, h = [], b""
+        for i in range(0, len(prompt) - block_chars + 1, block_chars):
+            h = hashlib.blake2b(h + prompt[i:i + block_chars].encode("utf-8"), digest_size=16).digest()
+            keys.append(h)
+        hits = 0
+        with self._lock:
+            for key in keys:
+                if key not in self._prefix_blocks:
+                    break
+                hits += 1
+            for key in keys:
+                self._prefix_blocks[key] = None
+                self._prefix_blocks.move_to_end(key)
+            while len(self._prefix_blocks) > self.prefix_cache_blocks:
+                self._prefix_blocks.popitem(last=False)
+        return hits * PREFIX_BLOCK_TOKENS
+
+    def prefill_s(self, uncached_tokens: int) -> float:
+        """Modelled prompt processing time for the tokens the prefix cache did not cover"""
+        if self.prefill_tokens_per_s <= 0:
+            return 0.0
+        return max(uncached_tokens, 0) / self.prefill_tokens_per_s
+
+    def record(self, error: bool = False, prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0) -> None:
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["errors"] += int(error)
+            self._stats["prompt_tokens"] += prompt_tokens
+            self._stats["cached_prompt_tokens"] += cached_tokens
+            self._stats["completion_tokens"] += completion_tokens
+
+    def snapshot_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+
+def start_server(port: int = DEFAULT_PORT, host: str = DEFAULT_HOST, **kwargs: Any) -> FakeLLMServer:
+    """Start a fake server on a background thread and return it (call .shutdown() to stop)"""
+    server = FakeLLMServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+
+# Example usage
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline stand-in for the LLM inference endpoint")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--ttft-median", type=float, default=TTFT_MEDIAN_S, help="median time-to-first-token (s)")
+    parser.add_argument("--ttft-sigma", type=float, default=TTFT_SIGMA, help="lognormal sigma of time-to-first-token")
+    parser.add_argument("--tokens-per-s", type=float, default=TOKENS_PER_S)
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE)
+    parser.add_argument("--error-status", type=int, default=ERROR_STATUS)
+    parser.add_argument("--prefill-tokens-per-s", type=float, default=PREFILL_TOKENS_PER_S,
+                        help="prefill rate for uncached prompt tokens (0 = not modelled)")
+    parser.add_argument("--prefix-cache-blocks", type=int, default=PREFIX_CACHE_BLOCKS, help="0 disables prefix caching")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(
+        (args.host, args.port),
+        ttft_median_s=args.ttft_median,
+        ttft_sigma=args.ttft_sigma,
+        tokens_per_s=args.tokens_per_s,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        prefill_tokens_per_s=args.prefill_tokens_per_s,
+        prefix_cache_blocks=args.prefix_cache_blocks,
+        seed=args.seed,
+        verbose=args.verbose,
+    )
+    print(f"Fake LLM server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
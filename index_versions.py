@@ -0,0 +1,651 @@
+"""
+Versioned Vector Index
+Corpus archives are installed as immutable, checksummed versions under INDEX_ROOT:
+
+    indexes/
+      CURRENT              name of the active version, replaced atomically
+      versions/<version>/  extracted Chroma directory plus MANIFEST.json; never opened by Chroma
+      work/<version>-*/    per-process working copies that Chroma serves from
+      staging/             extractions and copies in progress, never read by servers
+
+install() streams a tar.gz archive into staging while hashing the archive and every
+file it writes, optionally sets the HNSW search breadth, records the checksums in the
+manifest and renames the directory into versions/. activate() verifies the files and
+swaps CURRENT with os.replace.
+
+Chroma writes to its directory even when only queried, so a process serves a private
+working copy of a version (checkout()); the version itself stays byte-identical to its
+manifest and can be re-activated for a rollback at any time.
+
+Servers read through IndexManager: when CURRENT changes it loads and warms the new
+version in a background thread and then swaps it in. Requests already running keep
+the version they started with. Every process holds a shared flock on each version and
+working copy it has open, so collect_garbage() only deletes versions that are not
+current and copies that no process still has open.
+
+    python index_versions.py install chroma_db.tar.gz --activate --search-ef 40
+    python index_versions.py list
+    python index_versions.py gc
+"""
+
+import atexit
+import fcntl
+import hashlib
+import json
+import os
+import posixpath
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from config import CHROMA_DIR, HNSW_SEARCH_EF, INDEX_ROOT
+
+# Index Version Configuration
+ARCHIVE_ROOT = "chroma_db"     # top-level directory inside the archives; stripped on install
+MANIFEST = "MANIFEST.json"
+POINTER = "CURRENT"
+LOCK_FILE = ".lock"            # flocked by every process that has the version open
+POLL_INTERVAL_S = 5.0          # how often servers look at CURRENT
+STALE_STAGING_S = 3600         # abandoned extractions older than this are removed by gc
+CHUNK = 1 << 20
+
+
+def _versions_dir(root: str) -> str:
+    return os.path.join(root, "versions")
+
+
+def _work_dir(root: str) -> str:
+    return os.path.join(root, "work")
+
+
+def _staging_dir(root: str) -> str:
+    return os.path.join(root, "staging")
+
+
+def version_dir(version: str, root: str = INDEX_ROOT) -> str:
+    return os.path.join(_versions_dir(root), version)
+
+
+def current_version(root: str = INDEX_ROOT) -> Optional[str]:
+    """Version CURRENT points at, or None before the first activation"""
+    try:
+        with open(os.path.join(root, POINTER), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_dir(root: str = INDEX_ROOT) -> str:
+    """Directory of the active version, or CHROMA_DIR when no version was activated"""
+    version = current_version(root)
+    return version_dir(version, root) if version else CHROMA_DIR
+
+
+class _HashingReader:
+    """File wrapper that hashes everything read through it"""
+
+    def __init__(self, f):
+        self._f = f
+        self._h = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._f.read(size)
+        self._h.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self._h.hexdigest()
+
+
+def _member_path(name: str) -> Optional[str]:
+    """Relative destination of an archive member, without the ARCHIVE_ROOT prefix"""
+    path = posixpath.normpath(name)
+    parts = [] if path == "." else path.split("/")
+    if name.startswith("/") or ".." in parts:
+        raise ValueError(f"Unsafe path in archive: {name}")
+    if parts and parts[0] == ARCHIVE_ROOT:
+        parts = parts[1:]
+    return "/".join(parts) or None
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _hash_tree(base: str) -> Dict[str, Dict[str, Any]]:
+    """Checksums of every file under base except the manifest and lock file"""
+    files = {}
+    for dirpath, dirs, names in os.walk(base):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, base).replace(os.sep, "/")
+            if rel not in (MANIFEST, LOCK_FILE):
+                files[rel] = {"sha256": _file_sha256(path), "size": os.path.getsize(path)}
+    return files
+
+
+def install(archive: str, root: str = INDEX_ROOT, version: Optional[str] = None,
+            expected_sha256: Optional[str] = None, search_ef: Optional[int] = None) -> str:
+    """
+    Stream-extract a tar.gz corpus archive into a new version directory, optionally
+    setting its HNSW search breadth before the files are checksummed. The version
+    defaults to the first 12 hex digits of the archive's SHA-256 (plus the search
+    breadth); installing the same archive twice returns the existing version.
+    """
+    os.makedirs(_staging_dir(root), exist_ok=True)
+    os.makedirs(_versions_dir(root), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix="install-", dir=_staging_dir(root))
+    os.chmod(staging, 0o755)
+    try:
+        files: Dict[str, Dict[str, Any]] = {}
+        with open(archive, "rb") as raw:
+            reader = _HashingReader(raw)
+            with tarfile.open(fileobj=reader, mode="r|gz") as tar:
+                for member in tar:
+                    rel = _member_path(member.name)
+                    if rel is None or member.isdir():
+                        continue
+                    if not member.isfile():
+                        raise ValueError(f"Unsupported archive member (links are not allowed): {member.name}")
+                    dest = os.path.join(staging, *rel.split("/"))
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    h = hashlib.sha256()
+                    src = tar.extractfile(member)
+                    with open(dest, "wb") as out:
+                        for block in iter(lambda: src.read(CHUNK), b""):
+                            h.update(block)
+                            out.write(block)
+                    files[rel] = {"sha256": h.hexdigest(), "size": member.size}
+            while reader.read(CHUNK):  # trailing padding, so the hash covers the whole file
+                pass
+        archive_sha256 = reader.hexdigest()
+        if expected_sha256 and archive_sha256 != expected_sha256.lower():
+            raise ValueError(f"Archive checksum mismatch: expected {expected_sha256}, got {archive_sha256}")
+        if not files:
+            raise ValueError(f"Archive {archive} contains no files")
+        if search_ef:
+            from vectorstore import set_search_ef
+            set_search_ef(staging, search_ef)
+            files = _hash_tree(staging)  # Chroma rewrites its files when it opens them
+
+        version = version or archive_sha256[:12] + (f"-ef{search_ef}" if search_ef else "")
+        manifest = {
+            "version": version,
+            "archive": os.path.basename(archive),
+            "archive_sha256": archive_sha256,
+            "search_ef": search_ef,
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "files": files,
+        }
+        with open(os.path.join(staging, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        open(os.path.join(staging, LOCK_FILE), "a").close()
+
+        final = version_dir(version, root)
+        if os.path.isdir(final):
+            existing = read_manifest(version, root)
+            if (existing.get("archive_sha256"), existing.get("search_ef")) != (archive_sha256, search_ef):
+                raise ValueError(f"Version {version} already exists with different contents")
+            shutil.rmtree(staging, ignore_errors=True)
+            return version
+        os.rename(staging, final)
+        return version
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def read_manifest(version: str, root: str = INDEX_ROOT) -> Dict[str, Any]:
+    with open(os.path.join(version_dir(version, root), MANIFEST), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def verify(version: str, root: str = INDEX_ROOT) -> List[str]:
+    """Files that are missing or do not match the manifest (empty when the version is intact)"""
+    base = version_dir(version, root)
+    problems = []
+    for rel, info in read_manifest(version, root)["files"].items():
+        path = os.path.join(base, *rel.split("/"))
+        if not os.path.isfile(path):
+            problems.append(f"missing: {rel}")
+        elif os.path.getsize(path) != info["size"] or _file_sha256(path) != info["sha256"]:
+            problems.append(f"checksum mismatch: {rel}")
+    return problems
+
+
+def activate(version: str, root: str = INDEX_ROOT) -> None:
+    """Verify a version and atomically point CURRENT at it"""
+    problems = verify(version, root)
+    if problems:
+        raise ValueError(f"Version {version} failed verification: {'; '.join(problems[:5])}")
+    tmp = os.path.join(root, f".{POINTER}.{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, POINTER))
+
+
+def list_versions(root: str = INDEX_ROOT) -> List[Dict[str, Any]]:
+    """Installed versions, oldest first"""
+    rows = []
+    if os.path.isdir(_versions_dir(root)):
+        current = current_version(root)
+        for version in os.listdir(_versions_dir(root)):
+            try:
+                manifest = read_manifest(version, root)
+            except (OSError, ValueError):
+                continue
+            rows.append({
+                "version": version,
+                "created": manifest.get("created", ""),
+                "archive": manifest.get("archive", ""),
+                "files": len(manifest.get("files", {})),
+                "current": version == current,
+            })
+    return sorted(rows, key=lambda r: r["created"])
+
+
+class _Lease:
+    """Shared flock on the lock file of a version or working copy, held while a process has it open"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = os.open(os.path.join(path, LOCK_FILE), os.O_RDONLY | os.O_CREAT)
+        fcntl.flock(self._fd, fcntl.LOCK_SH)
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)  # siblings forked with the same descriptor keep the lock until they close theirs
+            self._fd = None
+
+
+def _remove_if_unused(path: str, root: str) -> bool:
+    """Delete a version or working copy unless some process holds its lease"""
+    try:
+        fd = os.open(os.path.join(path, LOCK_FILE), os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False  # still open somewhere
+        # move out first so nothing can open a half-deleted directory
+        os.makedirs(_staging_dir(root), exist_ok=True)
+        trash = tempfile.mkdtemp(prefix=f"gc-{os.path.basename(path)}-", dir=_staging_dir(root))
+        os.rename(path, os.path.join(trash, os.path.basename(path)))
+    finally:
+        os.close(fd)
+    shutil.rmtree(trash, ignore_errors=True)
+    return True
+
+
+def checkout(version: str, root: str = INDEX_ROOT) -> _Lease:
+    """
+    Private writable copy of a version for one process (and the workers it forks) to
+    serve from. The returned lease keeps it alive; gc removes it once no process holds it.
+    """
+    os.makedirs(_work_dir(root), exist_ok=True)
+    os.makedirs(_staging_dir(root), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f"checkout-{version}-", dir=_staging_dir(root))
+    os.chmod(staging, 0o755)
+    lease = _Lease(staging)  # taken before the copy is visible in work/, so gc never sees it unleased
+    try:
+        src = version_dir(version, root)
+        for rel in read_manifest(version, root)["files"]:
+            dest = os.path.join(staging, *rel.split("/"))
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copyfile(os.path.join(src, *rel.split("/")), dest)
+        path = os.path.join(_work_dir(root), os.path.basename(staging)[len("checkout-"):])
+        os.rename(staging, path)
+        lease.path = path
+        return lease
+    except BaseException:
+        lease.close()
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def collect_garbage(root: str = INDEX_ROOT, keep: int = 0) -> List[str]:
+    """
+    Delete versions that are not current, not among the `keep` newest others and not
+    open in any process, plus working copies no process has open and abandoned staging
+    directories. Returns removed versions.
+    """
+    current = current_version(root)
+    candidates = [r["version"] for r in list_versions(root) if r["version"] != current]
+    if keep > 0:
+        candidates = candidates[:-keep]
+    removed = [v for v in candidates if _remove_if_unused(version_dir(v, root), root)]
+
+    if os.path.isdir(_work_dir(root)):
+        for name in os.listdir(_work_dir(root)):
+            _remove_if_unused(os.path.join(_work_dir(root), name), root)
+    if os.path.isdir(_staging_dir(root)):
+        cutoff = time.time() - STALE_STAGING_S
+        for name in os.listdir(_staging_dir(root)):
+            path = os.path.join(_staging_dir(root), name)
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+    return removed
+
+
+def load_index(path: str):
+    """Default loader: the Chroma index at `path` as a retriever"""
+    from vectorstore import load_vectordb
+    from config import TOP_K
+    return load_vectordb(persist_directory=path).as_retriever(search_kwargs={"k": TOP_K})
+
+
+def warm_index(retriever) -> None:
+    """Default warm-up: every plan retrieval query"""
+    from rag import K_EACH, _search, all_retrieval_queries
+    for q in all_retrieval_queries():
+        _search(retriever, q, K_EACH)
+
+
+class _Checkout:
+    """Leases on a version and on this process's working copy of it"""
+
+    def __init__(self, version: str, root: str = INDEX_ROOT):
+        self.version = version
+        self.root = root
+        self.work: Optional[_Lease] = None
+        self.lease: Optional[_Lease] = _Lease(version_dir(version, root))  # gc must not remove it mid-copy
+        try:
+            self.work = checkout(version, root)
+        except BaseException:
+            self.close()
+            raise
+        self.path = self.work.path
+
+    def close(self) -> None:
+        if self.work is not None:
+            self.work.close()
+            self.work = None
+            _remove_if_unused(self.path, self.root)  # forked siblings still holding it keep it
+        if self.lease is not None:
+            self.lease.close()
+            self.lease = None
+
+
+class LoadedIndex:
+    """One open version and the number of requests using it"""
+
+    def __init__(self, version: str, retriever, lease: Optional[_Checkout]):
+        self.version = version
+        self.retriever = retriever
+        self.lease = lease
+        self.refs = 0
+        self.retired = False
+
+    def release(self) -> None:
+        self.retriever = None
+        if self.lease is not None:
+            self.lease.close()
+            self.lease = None
+
+
+class IndexManager:
+    """
+    The active index version of this process. acquire() pins a version for the duration
+    of a request; a new CURRENT is loaded and warmed off the request path, then swapped
+    in, and the old version is released once its last request finishes.
+    """
+
+    def __init__(
+        self,
+        root: str = INDEX_ROOT,
+        loader: Callable[[str], Any] = load_index,
+        warm: Optional[Callable[[Any], None]] = warm_index,
+        poll_interval_s: float = POLL_INTERVAL_S,
+    ):
+        self.root = root
+        self.loader = loader
+        self.warm = warm
+        self.poll_interval_s = poll_interval_s
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._active: Optional[LoadedIndex] = None
+        self._loading: Optional[str] = None
+        self._checked_at = 0.0
+        self.swaps = 0
+        self.last_error: Optional[str] = None
+
+    def _load(self, version: Optional[str]) -> LoadedIndex:
+        lease = _Checkout(version, self.root) if version else None
+        try:
+            path = lease.path if lease is not None else CHROMA_DIR
+            retriever = self.loader(path)
+            if self.warm is not None:
+                self.warm(retriever)
+        except BaseException:
+            if lease is not None:
+                lease.close()
+            raise
+        return LoadedIndex(version or "", retriever, lease)
+
+    def _swap(self, loaded: LoadedIndex) -> None:
+        with self._lock:
+            old, self._active = self._active, loaded
+            self.swaps += 1
+            if old is not None:
+                old.retired = True
+                if old.refs == 0:
+                    old.release()
+
+    def _load_and_swap(self, version: str) -> None:
+        try:
+            self._swap(self._load(version))
+            self.last_error = None
+        except Exception as e:
+            self.last_error = f"{version}: {type(e).__name__}: {e}"
+            print(f"Index version {version} was not loaded: {e}", file=sys.stderr, flush=True)
+        finally:
+            with self._lock:
+                self._loading = None
+
+    def start(self) -> "IndexManager":
+        """Load and warm the current version synchronously (before serving)"""
+        self._checked_at = time.monotonic()
+        self._swap(self._load(current_version(self.root)))
+        return self
+
+    def poll(self) -> None:
+        """Start loading CURRENT in the background if it changed since the last check"""
+        now = time.monotonic()
+        if now - self._checked_at < self.poll_interval_s:
+            return
+        self._checked_at = now
+        version = current_version(self.root)
+        with self._lock:
+            active = self._active.version if self._active is not None else None
+            if not version or version == active or self._loading:
+                return
+            self._loading = version
+        threading.Thread(target=self._load_and_swap, args=(version,), name=f"index-{version}", daemon=True).start()
+
+    @contextmanager
+    def acquire(self) -> Iterator[Any]:
+        """The active retriever, pinned until the block exits"""
+        self.poll()
+        with self._lock:
+            loaded = self._active
+            if loaded is not None:
+                loaded.refs += 1
+        if loaded is None:
+            with self._start_lock:
+                if self._active is None:
+                    self.start()
+            with self._lock:
+                loaded = self._active
+                loaded.refs += 1
+        try:
+            yield loaded.retriever
+        finally:
+            with self._lock:
+                loaded.refs -= 1
+                if loaded.retired and loaded.refs == 0:
+                    loaded.release()
+
+    def detach(self) -> None:
+        """Drop this process's open version (a pre-fork parent after forking its workers)"""
+        with self._lock:
+            old, self._active = self._active, None
+        if old is not None:
+            old.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = self._active
+            return {
+                "version": active.version if active is not None else None,
+                "in_flight": active.refs if active is not None else 0,
+                "loading": self._loading,
+                "swaps": self.swaps,
+                "last_error": self.last_error,
+            }
+
+
+class SwappableRetriever:
+    """Retriever facade over an IndexManager; each search runs on one pinned version"""
+
+    search_type = "similarity"
+
+    def __init__(self, manager: IndexManager, k: Optional[int] = None):
+        from config import TOP_K
+        self.manager = manager
+        self.search_kwargs = {"k": k or TOP_K}
+
+    @property
+    def vectorstore(self) -> "SwappableRetriever":
+        return self
+
+    def pinned(self):
+        """Pin one version for a whole request (several searches)"""
+        return self.manager.acquire()
+
+    def invoke(self, query: str):
+        with self.manager.acquire() as retriever:
+            return retriever.invoke(query)
+
+    def similarity_search(self, query: str, k: Optional[int] = None, **kwargs: Any):
+        k = k or self.search_kwargs["k"]
+        with self.manager.acquire() as retriever:
+            store = getattr(retriever, "vectorstore", None)
+            if store is not None:
+                return store.similarity_search(query, k=k, **kwargs)
+            return retriever.invoke(query)[:k]
+
+
+_manager: Optional[IndexManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_index_manager() -> IndexManager:
+    """Process-wide index manager, started on first use"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = IndexManager().start()
+    return _manager
+
+
+_opened: Dict[Any, _Checkout] = {}  # (root, version) -> working copy held until exit
+_opened_version: Optional[str] = None
+_opened_lock = threading.Lock()
+
+
+def open_current(root: str = INDEX_ROOT) -> str:
+    """
+    Directory for loading the active index outside an IndexManager: a working copy of
+    the current version, held until the process exits, or CHROMA_DIR without versions
+    """
+    global _opened_version
+    version = current_version(root)
+    if not version:
+        return CHROMA_DIR
+    with _opened_lock:
+        held = _opened.get((root, version))
+        if held is None:
+            if not _opened:
+                atexit.register(_close_opened)
+            held = _opened[(root, version)] = _Checkout(version, root)
+        _opened_version = version
+        return held.path
+
+
+def _close_opened() -> None:
+    with _opened_lock:
+        for held in _opened.values():
+            held.close()
+        _opened.clear()
+
+
+def serving_version() -> Optional[str]:
+    """
+    Index version this process serves: the manager's active one, else the one
+    load_vectordb() last opened, else CURRENT (what a first load would open)
+    """
+    if _manager is not None:
+        version = _manager.stats()["version"]
+        if version:
+            return version
+    return _opened_version or current_version()
+
+
+# Example usage
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Install, activate and garbage-collect vector index versions")
+    parser.add_argument("--root", default=INDEX_ROOT)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_install = sub.add_parser("install", help="stream-extract an archive into a new version")
+    p_install.add_argument("archive")
+    p_install.add_argument("--version", default=None)
+    p_install.add_argument("--sha256", default=None, help="expected SHA-256 of the archive")
+    p_install.add_argument("--activate", action="store_true")
+    p_install.add_argument("--search-ef", type=int, default=HNSW_SEARCH_EF, help="HNSW search breadth to set on the index")
+    p_activate = sub.add_parser("activate", help="verify a version and point CURRENT at it")
+    p_activate.add_argument("version")
+    p_verify = sub.add_parser("verify", help="check a version against its manifest")
+    p_verify.add_argument("version")
+    sub.add_parser("list", help="installed versions")
+    p_gc = sub.add_parser("gc", help="remove versions no process has open")
+    p_gc.add_argument("--keep", type=int, default=0, help="previous versions to keep for rollback")
+    args = parser.parse_args()
+
+    if args.command == "install":
+        t0 = time.perf_counter()
+        version = install(args.archive, args.root, args.version, args.sha256, args.search_ef)
+        print(f"Installed {version} in {time.perf_counter() - t0:.1f}s")
+        if args.activate:
+            activate(version, args.root)
+            print(f"Activated {version}")
+    elif args.command == "activate":
+        activate(args.version, args.root)
+        print(f"Activated {args.version}")
+    elif args.command == "verify":
+        problems = verify(args.version, args.root)
+        print("\n".join(problems) or "OK")
+        sys.exit(1 if problems else 0)
+    elif args.command == "list":
+        for r in list_versions(args.root):
+            print(f"{'*' if r['current'] else ' '} {r['version']:<16} {r['created']:<26} {r['files']:>5} files  {r['archive']}")
+    elif args.command == "gc":
+        removed = collect_garbage(args.root, args.keep)
+        print(f"Removed {', '.join(removed)}" if removed else "Nothing to remove")
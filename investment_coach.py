@@ -5,12 +5,19 @@ risk tolerance, goals, and real-time market data.
 """
 
 import json
+import math
+import sys
 import time
-from typing import List, Dict, Any, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
 from huggingface_hub import InferenceClient
 from schemas import UserProfile, RiskTolerance
-from config import MODEL_ID, HF_TOKEN
+from config import MODEL_ID, HF_TOKEN, INFERENCE_BASE_URL, COMPACT_OUTPUT, FRACTIONAL_SHARES
+from etf_universe import get_universe, RISK_TIERS
+from etf_screener import Screen, get_screener
+from etf_overlap import analyze_portfolio
+from prompt_layout import PromptTemplate
+from compact_schema import compact_instructions, expand, usage
 
 # Investment Coach Configuration
 MAX_NEW_TOKENS = 512
@@ -18,61 +25,150 @@ TEMPERATURE = 0.3
 TIMEOUT_SECS = 30
 TOP_P = 0.9
 
-client = InferenceClient(token=HF_TOKEN, timeout=TIMEOUT_SECS)
-
-# Popular ETFs by category and risk level
-ETF_DATABASE = {
-    "low_risk": [
-        {"symbol": "AGG", "name": "iShares Core U.S. Aggregate Bond ETF", "type": "Bond", "expense_ratio": 0.03},
-        {"symbol": "BND", "name": "Vanguard Total Bond Market ETF", "type": "Bond", "expense_ratio": 0.03},
-        {"symbol": "SCHZ", "name": "Schwab U.S. Aggregate Bond ETF", "type": "Bond", "expense_ratio": 0.03},
-        {"symbol": "TIP", "name": "iShares TIPS Bond ETF", "type": "Inflation-Protected", "expense_ratio": 0.19},
-    ],
-    "medium_risk": [
-        {"symbol": "VOO", "name": "Vanguard S&P 500 ETF", "type": "Large Cap Equity", "expense_ratio": 0.03},
-        {"symbol": "VTI", "name": "Vanguard Total Stock Market ETF", "type": "Total Market", "expense_ratio": 0.03},
-        {"symbol": "SCHD", "name": "Schwab U.S. Dividend Equity ETF", "type": "Dividend", "expense_ratio": 0.06},
-        {"symbol": "QQQ", "name": "Invesco QQQ Trust", "type": "Tech/Growth", "expense_ratio": 0.20},
-        {"symbol": "VEA", "name": "Vanguard FTSE Developed Markets ETF", "type": "International", "expense_ratio": 0.05},
-    ],
-    "high_risk": [
-        {"symbol": "VUG", "name": "Vanguard Growth ETF", "type": "Growth", "expense_ratio": 0.04},
-        {"symbol": "VGT", "name": "Vanguard Information Technology ETF", "type": "Technology", "expense_ratio": 0.10},
-        {"symbol": "VWO", "name": "Vanguard FTSE Emerging Markets ETF", "type": "Emerging Markets", "expense_ratio": 0.08},
-        {"symbol": "ARKK", "name": "ARK Innovation ETF", "type": "Disruptive Innovation", "expense_ratio": 0.75},
-        {"symbol": "IWM", "name": "iShares Russell 2000 ETF", "type": "Small Cap", "expense_ratio": 0.19},
-    ]
+client = InferenceClient(base_url=INFERENCE_BASE_URL, token=HF_TOKEN, timeout=TIMEOUT_SECS)
+
+# Recommendation Screen Configuration
+MAX_EXPENSE_RATIO = 0.50          # funds above this are only used when nothing else fills a category
+MIN_AVG_DAILY_VOLUME = 1_000_000  # shares per day
+RECOMMENDATIONS = 5               # category picks first, then the best other funds of the user's tier
+DEFAULT_AGE = 35                  # allocation assumed when the caller passes none
+
+# Allocation category of a fund, by its sector in the ETF universe
+CATEGORY_BY_SECTOR = {
+    "broad": "us_large_cap",
+    "dividend": "us_large_cap",
+    "small_cap": "us_small_mid",
+    "international": "international",
+    "emerging": "emerging_growth",
+    "growth": "emerging_growth",
+    "tech": "emerging_growth",
+    "bonds": "bonds",
+}
+ALLOCATION_CATEGORIES = ("us_large_cap", "us_small_mid", "international", "emerging_growth", "bonds")
+SECTORS_BY_CATEGORY = {
+    c: tuple(sector for sector, cat in CATEGORY_BY_SECTOR.items() if cat == c) for c in ALLOCATION_CATEGORIES
 }
 
-# Sector-specific ETFs for diversification
-SECTOR_ETFS = [
-    {"symbol": "XLK", "name": "Technology Select Sector SPDR", "sector": "Technology"},
-    {"symbol": "XLV", "name": "Health Care Select Sector SPDR", "sector": "Healthcare"},
-    {"symbol": "XLF", "name": "Financial Select Sector SPDR", "sector": "Financials"},
-    {"symbol": "XLE", "name": "Energy Select Sector SPDR", "sector": "Energy"},
-    {"symbol": "XLY", "name": "Consumer Discretionary Select Sector SPDR", "sector": "Consumer"},
-]
+
+def allocation_category(symbol: str) -> Optional[str]:
+    """Allocation breakdown category a fund fills, or None for an unknown symbol"""
+    u = get_universe()
+    i = u.index_of(symbol)
+    if i is None:
+        return None
+    category = CATEGORY_BY_SECTOR.get(u.sector[i])
+    if category is None:
+        category = "bonds" if u.asset_class[i] == "bond" else "us_large_cap"
+    return category
+
+
+def _tier_preference(risk_tolerance: str) -> List[str]:
+    """Risk tiers nearest to the user's first; ties go to the lower-risk tier"""
+    risk_key = risk_tolerance.lower()
+    t = RISK_TIERS.index(risk_key if risk_key in RISK_TIERS else "medium")
+    return sorted(RISK_TIERS, key=lambda tier: (abs(RISK_TIERS.index(tier) - t), RISK_TIERS.index(tier)))
 
 
-def get_recommended_etfs(risk_tolerance: str, investment_amount: float) -> List[Dict[str, Any]]:
+def _category_screens(tiers: List[str], category: str, budget: Optional[float]) -> List[Screen]:
     """
-    Get ETF recommendations based on risk tolerance
+    Screens tried in order to fill one allocation category: the user's tier and then the
+    nearest tiers, ranked by score; then any tier without the cost and liquidity filters;
+    then, when no whole share fits the slice, without the budget
     """
-    risk_key = f"{risk_tolerance.lower()}_risk"
+    sectors = SECTORS_BY_CATEGORY[category]
+    screens = [
+        Screen(risk_tier=tier, sectors=sectors, max_expense_ratio=MAX_EXPENSE_RATIO,
+               min_avg_daily_volume=MIN_AVG_DAILY_VOLUME, max_min_investment=budget, sort_by="score", top_n=1)
+        for tier in tiers
+    ]
+    screens.append(Screen(sectors=sectors, max_min_investment=budget, sort_by="score", top_n=1))
+    if budget is not None:
+        screens.append(Screen(sectors=sectors, sort_by="score", top_n=1))
+    return screens
 
-    # Get base recommendations
-    base_etfs = ETF_DATABASE.get(risk_key, ETF_DATABASE["medium_risk"])
 
-    # Add some diversification with other risk levels
-    recommendations = base_etfs.copy()
+def _recommendation_plan(
+    risk_tolerance: str,
+    investment_amount: float,
+    allocation: Optional[Dict],
+) -> List[Tuple[Optional[str], List[Screen]]]:
+    """
+    (category, screens to try) for every funded allocation category, largest slice first,
+    then (None, [screen for the best other funds of the user's tier]). With FRACTIONAL_SHARES
+    off, a fund's share price must fit the monthly slice it would get.
+    """
+    if allocation is None:
+        allocation = calculate_allocation(risk_tolerance.lower(), DEFAULT_AGE, investment_amount, 60)
+    whole_shares = not FRACTIONAL_SHARES and investment_amount and investment_amount > 0
+    breakdown = allocation["breakdown"]
+    tiers = _tier_preference(risk_tolerance)
+
+    plan: List[Tuple[Optional[str], List[Screen]]] = []
+    for category in sorted(ALLOCATION_CATEGORIES, key=lambda c: -breakdown.get(c, 0)):
+        percent = breakdown.get(category, 0)
+        if percent > 0:
+            budget = percent / 100 * investment_amount if whole_shares else None
+            plan.append((category, _category_screens(tiers, category, budget)))
+    plan.append((None, [Screen(
+        risk_tier=tiers[0], max_expense_ratio=MAX_EXPENSE_RATIO, min_avg_daily_volume=MIN_AVG_DAILY_VOLUME,
+        max_min_investment=investment_amount if whole_shares else None, sort_by="score", top_n=RECOMMENDATIONS,
+    )]))
+    return plan
+
+
+def _pick(plan: List[Tuple[Optional[str], List[Screen]]], hits: List[List[int]]) -> List[int]:
+    """One fund per category (the first screen with a hit), then other funds up to RECOMMENDATIONS"""
+    picks: List[int] = []
+    pos = 0
+    for category, screens in plan:
+        results = hits[pos:pos + len(screens)]
+        pos += len(screens)
+        if category is not None:
+            fund = next((idx[0] for idx in results if idx), None)
+            if fund is not None and fund not in picks:
+                picks.append(fund)
+        else:
+            for i in results[0]:
+                if len(picks) >= RECOMMENDATIONS:
+                    break
+                if i not in picks:
+                    picks.append(i)
+    return picks
 
-    if risk_tolerance == "medium":
-        recommendations.append(ETF_DATABASE["low_risk"][0])  # Add some bonds
-        recommendations.append(ETF_DATABASE["high_risk"][0])  # Add some growth
-    elif risk_tolerance == "low":
-        recommendations.append(ETF_DATABASE["medium_risk"][0])  # Add some equity exposure
 
-    return recommendations
+def get_recommended_etfs(
+    risk_tolerance: str,
+    investment_amount: float,
+    allocation: Optional[Dict] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Get ETF recommendations: the best-scoring fund (low cost, liquid) for every category of
+    the allocation, preferring the user's risk tier, followed by other funds of that tier
+    """
+    plan = _recommendation_plan(risk_tolerance, investment_amount, allocation)
+    hits = get_screener().screen_batch([s for _, screens in plan for s in screens])
+    return get_universe().records(_pick(plan, hits))
+
+
+def get_recommended_etfs_batch(
+    requests: List[Tuple[str, float]],
+    allocations: Optional[List[Optional[Dict]]] = None,
+) -> List[List[Dict[str, Any]]]:
+    """
+    get_recommended_etfs for many (risk_tolerance, investment_amount) pairs in one call
+    """
+    allocations = allocations or [None] * len(requests)
+    plans = [_recommendation_plan(risk, amount, a) for (risk, amount), a in zip(requests, allocations)]
+    flat = [s for plan in plans for _, screens in plan for s in screens]
+    hits = get_screener().screen_batch(flat)
+
+    universe = get_universe()
+    results, pos = [], 0
+    for plan in plans:
+        n = sum(len(screens) for _, screens in plan)
+        results.append(universe.records(_pick(plan, hits[pos:pos + n])))
+        pos += n
+    return results
 
 
 def calculate_allocation(
@@ -142,7 +238,7 @@ def generate_investment_recommendations(
     )
 
     # Get ETF recommendations
-    recommended_etfs = get_recommended_etfs(risk_str, monthly_capacity)
+    recommended_etfs = get_recommended_etfs(risk_str, monthly_capacity, allocation)
 
     # Build context for AI
     market_context = _build_market_context(recommended_etfs, allocation)
@@ -157,6 +253,9 @@ def generate_investment_recommendations(
         market_context
     )
 
+    monthly_breakdown = _calculate_monthly_breakdown(monthly_capacity, allocation, recommended_etfs)
+    diversification = _diversification(monthly_breakdown)
+
     # Get AI recommendations
     try:
         ai_response = _call_chat(prompt)
@@ -164,15 +263,17 @@ def generate_investment_recommendations(
 
         # Parse AI response
         recommendations = _parse_ai_recommendations(ai_response)
+        if COMPACT_OUTPUT:
+            recommendations = _fill_etf_names(expand("coach", recommendations))
+            usage.record("coach", ai_response, recommendations)
 
         return {
             "success": True,
             "allocation": allocation,
             "recommended_etfs": recommended_etfs[:5],  # Top 5 recommendations
             "ai_insights": recommendations,
-            "monthly_investment_breakdown": _calculate_monthly_breakdown(
-                monthly_capacity, allocation, recommended_etfs[:5]
-            ),
+            "monthly_investment_breakdown": monthly_breakdown,
+            **({"diversification": diversification} if diversification is not None else {}),
             "rebalancing_suggestions": _generate_rebalancing_tips(allocation, profile.age),
             "risk_level": risk_str,
             "timing": {
@@ -188,6 +289,15 @@ def generate_investment_recommendations(
         }
 
 
+def _diversification(monthly_breakdown: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Overlap and look-through exposure of the breakdown; None when the holdings data is unavailable"""
+    try:
+        return analyze_portfolio({row["etf"]: row["allocation_percent"] for row in monthly_breakdown})
+    except Exception as e:
+        print(f"Diversification analysis skipped: {type(e).__name__}: {e}", file=sys.stderr, flush=True)
+        return None
+
+
 def _build_market_context(etfs: List[Dict], allocation: Dict) -> str:
     """Build market context for AI prompt"""
     etf_list = "\n".join([
@@ -205,33 +315,23 @@ Suggested allocation:
 """
 
 
-def _create_investment_prompt(
-    profile: UserProfile,
-    monthly_capacity: float,
-    goal_amount: float,
-    goal_timeline_months: int,
-    allocation: Dict,
-    market_context: str
-) -> str:
-    """Create prompt for AI investment coach"""
-
-    timeline_years = goal_timeline_months / 12 if goal_timeline_months else 5
-    risk_str = profile.quiz.risk_tolerance.value if profile.quiz.risk_tolerance else "medium"
-
-    return f"""You are an expert investment advisor. Provide personalized investment recommendations.
-
+_INVESTMENT_SUFFIX = """{market_context}
 USER PROFILE:
-- Name: {profile.name}
-- Age: {profile.age}
-- Risk Tolerance: {risk_str}
-- Monthly Investment Capacity: ${monthly_capacity:,.2f}
-- Savings Goal: ${goal_amount:,.2f} in {timeline_years:.1f} years
-- Current Concerns: {', '.join([c.value for c in profile.quiz.top_concerns]) if profile.quiz.top_concerns else 'General investing'}
+- Name: {name}
+- Age: {age}
+- Risk Tolerance: {risk}
+- Monthly Investment Capacity: {capacity}
+- Savings Goal: {goal}
+- Current Concerns: {concerns}
+
+Output ONLY valid JSON, no additional text."""
 
-{market_context}
+# Shared prefix first (role, output schema, focus), then the ETF shortlist and the user's profile
+_INVESTMENT_PROMPT = PromptTemplate(
+    prefix="""You are an expert investment advisor. Provide personalized investment recommendations.
 
 TASK:
-Provide specific, actionable investment recommendations in JSON format with these keys:
+Provide specific, actionable investment recommendations for the user profile below in JSON format with these keys:
 1. "greeting": A personalized greeting
 2. "strategy_overview": Brief overview of the recommended strategy (2-3 sentences)
 3. "specific_recommendations": Array of 3-5 specific ETF/fund recommendations with:
@@ -249,8 +349,38 @@ Focus on:
 - Dollar-cost averaging strategy
 - Matching their risk tolerance
 - Clear explanations for every recommendation
+""",
+    suffix=_INVESTMENT_SUFFIX,
+)
+_INVESTMENT_PROMPT_COMPACT = PromptTemplate(
+    prefix=_INVESTMENT_PROMPT.prefix + "\n" + compact_instructions("coach"),
+    suffix=_INVESTMENT_SUFFIX,
+)
 
-Output ONLY valid JSON, no additional text."""
+
+def _create_investment_prompt(
+    profile: UserProfile,
+    monthly_capacity: float,
+    goal_amount: float,
+    goal_timeline_months: int,
+    allocation: Dict,
+    market_context: str
+) -> str:
+    """Create prompt for AI investment coach"""
+
+    timeline_years = goal_timeline_months / 12 if goal_timeline_months else 5
+    risk_str = profile.quiz.risk_tolerance.value if profile.quiz.risk_tolerance else "medium"
+
+    template = _INVESTMENT_PROMPT_COMPACT if COMPACT_OUTPUT else _INVESTMENT_PROMPT
+    return template.render(
+        market_context=market_context,
+        name=profile.name,
+        age=profile.age,
+        risk=risk_str,
+        capacity=f"${monthly_capacity:,.2f}",
+        goal=f"${goal_amount:,.2f} in {timeline_years:.1f} years",
+        concerns=', '.join([c.value for c in profile.quiz.top_concerns]) if profile.quiz.top_concerns else 'General investing',
+    )
 
 
 def _call_chat(prompt: str) -> str:
@@ -301,12 +431,26 @@ def _parse_ai_recommendations(ai_response: str) -> Dict[str, Any]:
         }
 
 
+def _fill_etf_names(recommendations: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill in ETF names the compact schema lets the model leave out"""
+    universe = get_universe()
+    for rec in recommendations.get("specific_recommendations") or []:
+        if isinstance(rec, dict) and not rec.get("name") and rec.get("symbol"):
+            i = universe.index_of(str(rec["symbol"]).upper())
+            if i is not None:
+                rec["name"] = universe.name_of(i)
+    return recommendations
+
+
 def _calculate_monthly_breakdown(
     monthly_capacity: float,
     allocation: Dict,
     etfs: List[Dict]
 ) -> List[Dict[str, Any]]:
-    """Calculate dollar amounts for each ETF based on allocation"""
+    """
+    Calculate dollar amounts for each ETF: each category's slice goes to the first fund of
+    that category in `etfs` (get_recommended_etfs returns one for every funded category)
+    """
     breakdown = allocation["breakdown"]
 
     investment_map = []
@@ -314,23 +458,28 @@ def _calculate_monthly_breakdown(
     if monthly_capacity <= 0:
         return investment_map
 
-    # Map allocation to specific ETFs
-    allocations = [
-        ("us_large_cap", breakdown.get("us_large_cap", 0)),
-        ("international", breakdown.get("international", 0)),
-        ("emerging_growth", breakdown.get("emerging_growth", 0)),
-        ("bonds", breakdown.get("bonds", 0)),
-    ]
+    # Map allocation to specific ETFs by category, not by list position
+    by_category: Dict[str, Dict] = {}
+    for etf in etfs:
+        by_category.setdefault(allocation_category(etf["symbol"]), etf)
 
-    for i, (category, percent) in enumerate(allocations):
-        if i < len(etfs) and percent > 0:
+    universe = get_universe()
+    for category in ALLOCATION_CATEGORIES:
+        percent = breakdown.get(category, 0)
+        etf = by_category.get(category)
+        if etf is not None and percent > 0:
             dollar_amount = (percent / 100) * monthly_capacity
-            investment_map.append({
-                "etf": etfs[i]["symbol"],
-                "name": etfs[i]["name"],
+            row = {
+                "etf": etf["symbol"],
+                "name": etf["name"],
+                "category": category,
                 "allocation_percent": percent,
                 "monthly_amount": round(dollar_amount, 2)
-            })
+            }
+            price = universe.get(etf["symbol"])["min_investment"]
+            if not FRACTIONAL_SHARES and price > dollar_amount:
+                row["buy_every_months"] = math.ceil(price / dollar_amount)  # save up for one whole share
+            investment_map.append(row)
 
     return investment_map
 
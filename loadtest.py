@@ -0,0 +1,299 @@
+"""
+End-to-End Load Test
+Replays user profiles at a target request rate against the three generators
+(rag.generate_plan, investment_coach.generate_investment_recommendations and
+market_insights.generate_market_insights) and reports throughput and
+p50/p95/p99 latency per stage.
+
+Runs fully offline when paired with fake_llm_server.py:
+    python loadtest.py --profiles profiles.jsonl --rps 5 --duration 60 --fake-server
+"""
+
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from schemas import UserProfile
+
+# Load Test Configuration
+DEFAULT_RPS = 2.0
+DEFAULT_DURATION_S = 30.0
+DEFAULT_CONCURRENCY = 32
+GENERATORS = ("plan", "coach", "insights")
+PERCENTILES = (50, 95, 99)
+
+
+def load_profiles(path: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Load profile payloads from a JSONL file (one UserProfile JSON per line, optionally
+    wrapped as {"profile": ...} or {"user_profile": ...}). Falls back to sample_json.
+    """
+    payloads = []  # (source, payload)
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                obj = json.loads(line)
+                payloads.append((f"{path}:{lineno}", obj.get("profile") or obj.get("user_profile") or obj))
+    else:
+        with Path("sample_json").open("r", encoding="utf-8") as f:
+            payloads.append(("sample_json", json.load(f)))
+
+    valid = []
+    for source, payload in payloads:
+        try:
+            UserProfile.model_validate(payload)
+            valid.append(payload)
+        except ValidationError as e:
+            print(f"Skipping invalid profile at {source}: {e.error_count()} errors; "
+                  f"first: {e.errors()[0]['loc']} {e.errors()[0]['msg']}", file=sys.stderr)
+    if len(valid) < len(payloads):
+        print(f"Loaded {len(valid)} of {len(payloads)} profiles ({len(payloads) - len(valid)} invalid skipped)",
+              file=sys.stderr)
+    if not valid:
+        raise ValueError(f"No valid profiles found in {path or 'sample_json'}")
+    return valid
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class _TimedRetriever:
+    """Wraps a retriever and records how long each retrieval call takes"""
+
+    def __init__(self, retriever):
+        self._retriever = retriever
+        self.elapsed = 0.0
+
+    def invoke(self, query: str):
+        t0 = time.perf_counter()
+        try:
+            if hasattr(self._retriever, "invoke"):
+                return self._retriever.invoke(query)
+            return self._retriever.similarity_search(query)
+        finally:
+            self.elapsed += time.perf_counter() - t0
+
+
+class _EmptyRetriever:
+    """Retriever returning no documents, for load-testing the LLM path alone"""
+
+    def invoke(self, query: str):
+        return []
+
+
+def _monthly_capacity(profile: UserProfile) -> float:
+    cashflow = profile.form.cashflow
+    if cashflow.monthly_take_home_pay and cashflow.monthly_expenses is not None:
+        return max(cashflow.monthly_take_home_pay - cashflow.monthly_expenses, 0.0) or 100.0
+    return 500.0
+
+
+def _portfolio_for(profile: UserProfile, monthly_capacity: float) -> Dict[str, float]:
+    """Derive an {ETF: percent} portfolio the same way the coach would"""
+    from investment_coach import calculate_allocation, get_recommended_etfs, _calculate_monthly_breakdown
+
+    risk = profile.quiz.risk_tolerance.value if profile.quiz.risk_tolerance else "medium"
+    goal_months = profile.form.savings_goal.timeline_months or 60
+    allocation = calculate_allocation(risk, profile.age, monthly_capacity, goal_months)
+    etfs = get_recommended_etfs(risk, monthly_capacity, allocation)
+    return {
+        row["etf"]: row["allocation_percent"]
+        for row in _calculate_monthly_breakdown(max(monthly_capacity, 1.0), allocation, etfs)
+    }
+
+
+def run_one(generator: str, payload: Dict[str, Any], retriever) -> Dict[str, Any]:
+    """Run one generator for one profile and return per-stage timings in seconds"""
+    profile = UserProfile.model_validate(payload)
+    t0 = time.perf_counter()
+
+    if generator == "plan":
+        from rag import generate_plan
+
+        timed = _TimedRetriever(retriever)
+        result = generate_plan(timed, profile)
+        total = time.perf_counter() - t0
+        return {
+            "ok": isinstance(result, dict) and "error" not in result,
+            "stages": {"retrieve": timed.elapsed, "llm": total - timed.elapsed, "total": total},
+        }
+
+    capacity = _monthly_capacity(profile)
+    if generator == "coach":
+        from investment_coach import generate_investment_recommendations
+
+        result = generate_investment_recommendations(
+            profile,
+            monthly_capacity=capacity,
+            goal_amount=profile.form.savings_goal.target_amount or 50000,
+            goal_timeline_months=profile.form.savings_goal.timeline_months or 60,
+        )
+    elif generator == "insights":
+        from market_insights import generate_market_insights
+
+        user_profile = dict(payload, name=profile.name, age=profile.age)
+        result = generate_market_insights(user_profile, _portfolio_for(profile, capacity), "daily")
+    else:
+        raise ValueError(f"Unknown generator: {generator}")
+
+    total = time.perf_counter() - t0
+    return {"ok": bool(result.get("success")), "stages": {"total": total}}
+
+
+def run_load(
+    payloads: List[Dict[str, Any]],
+    generators: List[str],
+    rps: float = DEFAULT_RPS,
+    duration_s: float = DEFAULT_DURATION_S,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    retriever=None,
+    runner: Callable[[str, Dict[str, Any], Any], Dict[str, Any]] = run_one,
+) -> Dict[str, Any]:
+    """
+    Open-loop load: requests are issued on a fixed schedule of `rps` per second
+    (round-robin over profiles and generators) regardless of how fast earlier
+    requests complete, so queueing shows up in the latency percentiles.
+    """
+    retriever = retriever or _EmptyRetriever()
+    results: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+
+    def _task(generator: str, payload: Dict[str, Any], scheduled: float) -> None:
+        try:
+            out = runner(generator, payload, retriever)
+        except Exception as e:
+            out = {"ok": False, "stages": {}, "exception": f"{type(e).__name__}: {e}"}
+        out["generator"] = generator
+        out["stages"]["e2e"] = time.perf_counter() - scheduled
+        with lock:
+            results.append(out)
+
+    n_requests = max(1, int(rps * duration_s))
+    interval = 1.0 / rps if rps > 0 else 0.0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(n_requests):
+            scheduled = start + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            generator = generators[i % len(generators)]
+            payload = payloads[(i // len(generators)) % len(payloads)]
+            pool.submit(_task, generator, payload, scheduled)
+    wall = time.perf_counter() - start
+
+    return summarize(results, wall, rps)
+
+
+def summarize(results: List[Dict[str, Any]], wall_s: float, target_rps: float) -> Dict[str, Any]:
+    """Aggregate raw results into throughput and latency percentiles per generator and stage"""
+    report: Dict[str, Any] = {
+        "target_rps": target_rps,
+        "wall_s": round(wall_s, 3),
+        "requests": len(results),
+        "achieved_rps": round(len(results) / wall_s, 3) if wall_s else 0.0,
+        "generators": {},
+    }
+    by_gen: Dict[str, List[Dict[str, Any]]] = {}
+    for r in results:
+        by_gen.setdefault(r["generator"], []).append(r)
+
+    for generator, rows in by_gen.items():
+        stages: Dict[str, List[float]] = {}
+        for r in rows:
+            for stage, value in r["stages"].items():
+                stages.setdefault(stage, []).append(value)
+        report["generators"][generator] = {
+            "requests": len(rows),
+            "errors": sum(1 for r in rows if not r.get("ok")),
+            "throughput_rps": round(len(rows) / wall_s, 3) if wall_s else 0.0,
+            "stages_ms": {
+                stage: {f"p{p}": round(percentile(values, p) * 1000, 2) for p in PERCENTILES}
+                for stage, values in stages.items()
+            },
+        }
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Human-readable table of the summary"""
+    lines = [
+        f"Requests: {report['requests']}  wall: {report['wall_s']}s  "
+        f"target: {report['target_rps']} rps  achieved: {report['achieved_rps']} rps",
+        f"{'generator':<10} {'stage':<9} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}",
+    ]
+    for generator, data in report["generators"].items():
+        lines.append(
+            f"{generator:<10} {'(n/err)':<9} {data['requests']:>10} {data['errors']:>10} "
+            f"{data['throughput_rps']:>8}/s"
+        )
+        for stage, pct in data["stages_ms"].items():
+            lines.append(f"{'':<10} {stage:<9} {pct['p50']:>10} {pct['p95']:>10} {pct['p99']:>10}")
+    return "\n".join(lines)
+
+
+# Example usage
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay profiles against the generators at a target RPS")
+    parser.add_argument("--profiles", default=None, help="JSONL file of profile payloads (default: sample_json)")
+    parser.add_argument("--rps", type=float, default=DEFAULT_RPS)
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION_S)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--generators", default=",".join(GENERATORS), help="comma-separated subset of plan,coach,insights")
+    parser.add_argument("--with-retrieval", action="store_true", help="query the local chroma_db for the plan generator")
+    parser.add_argument("--fake-server", action="store_true", help="start fake_llm_server.py in-process")
+    parser.add_argument("--fake-port", type=int, default=8080)
+    parser.add_argument("--json", dest="json_out", default=None, help="write the report to this file")
+    args = parser.parse_args()
+
+    fake = None
+    if args.fake_server:
+        from fake_llm_server import start_server
+
+        fake = start_server(port=args.fake_port)
+        os.environ["INFERENCE_BASE_URL"] = f"http://127.0.0.1:{args.fake_port}"
+    elif not os.getenv("INFERENCE_BASE_URL"):
+        print("Warning: INFERENCE_BASE_URL is not set; requests will go to the hosted inference API.")
+
+    retriever = None
+    if args.with_retrieval:
+        from vectorstore import load_vectordb
+        from config import TOP_K
+
+        retriever = load_vectordb().as_retriever(search_kwargs={"k": TOP_K})
+
+    report = run_load(
+        load_profiles(args.profiles),
+        [g.strip() for g in args.generators.split(",") if g.strip()],
+        rps=args.rps,
+        duration_s=args.duration,
+        concurrency=args.concurrency,
+        retriever=retriever,
+    )
+    if fake is not None:
+        report["fake_server"] = fake.snapshot_stats()
+        fake.shutdown()
+
+    print(format_report(report))
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -7,14 +7,18 @@ Explains market movements in simple, easy-to-understand language.
 import json
 import time
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 from huggingface_hub import InferenceClient
-from config import MODEL_ID, HF_TOKEN
+from config import MODEL_ID, HF_TOKEN, INFERENCE_BASE_URL, COMPACT_OUTPUT
+from etf_universe import get_universe
+from prompt_layout import PromptTemplate
+from compact_schema import compact_instructions, expand, usage
 
 # Market Insights Configuration
 MAX_NEW_TOKENS = 400
 TEMPERATURE = 0.4
-client = InferenceClient(token=HF_TOKEN, timeout=30)
+client = InferenceClient(base_url=INFERENCE_BASE_URL, token=HF_TOKEN, timeout=30)
 
 # Mock market data (in production, would fetch from real APIs like Alpha Vantage, Yahoo Finance, etc.)
 MARKET_DATA = {
@@ -49,19 +53,6 @@ MARKET_DATA = {
     ]
 }
 
-# ETF-specific data
-ETF_PERFORMANCE = {
-    "VOO": {"name": "Vanguard S&P 500", "change_percent": 1.2, "volume": "high", "sector_exposure": "broad"},
-    "VTI": {"name": "Vanguard Total Market", "change_percent": 1.1, "volume": "high", "sector_exposure": "broad"},
-    "VEA": {"name": "Vanguard International", "change_percent": 0.6, "volume": "moderate", "sector_exposure": "international"},
-    "VWO": {"name": "Vanguard Emerging Markets", "change_percent": -0.3, "volume": "moderate", "sector_exposure": "emerging"},
-    "BND": {"name": "Vanguard Total Bond", "change_percent": -0.2, "volume": "moderate", "sector_exposure": "bonds"},
-    "AGG": {"name": "iShares Aggregate Bond", "change_percent": -0.15, "volume": "high", "sector_exposure": "bonds"},
-    "QQQ": {"name": "Invesco QQQ", "change_percent": 2.4, "volume": "very_high", "sector_exposure": "tech"},
-    "SCHD": {"name": "Schwab Dividend", "change_percent": 0.9, "volume": "moderate", "sector_exposure": "dividend"}
-}
-
-
 def calculate_portfolio_impact(portfolio_allocation: Dict[str, float]) -> Dict[str, Any]:
     """
     Calculate how market movements impact the user's specific portfolio
@@ -72,20 +63,22 @@ def calculate_portfolio_impact(portfolio_allocation: Dict[str, float]) -> Dict[s
     Returns:
         Portfolio performance and impact data
     """
+    universe = get_universe()
     total_change = 0.0
     etf_impacts = []
 
     for symbol, allocation in portfolio_allocation.items():
-        if symbol in ETF_PERFORMANCE:
-            etf_data = ETF_PERFORMANCE[symbol]
-            weighted_change = etf_data["change_percent"] * (allocation / 100)
+        i = universe.index_of(symbol)
+        change = universe.change_of(i) if i is not None else None
+        if change is not None:
+            weighted_change = change * (allocation / 100)
             total_change += weighted_change
 
             etf_impacts.append({
                 "symbol": symbol,
-                "name": etf_data["name"],
+                "name": universe.name_of(i),
                 "allocation": allocation,
-                "change_percent": etf_data["change_percent"],
+                "change_percent": change,
                 "contribution_to_portfolio": weighted_change
             })
 
@@ -137,6 +130,9 @@ def generate_market_insights(
 
         # Parse AI response
         insights = _parse_insights(ai_response)
+        if COMPACT_OUTPUT:
+            insights = expand("insights", insights)
+            usage.record("insights", ai_response, insights)
 
         return {
             "success": True,
@@ -161,77 +157,83 @@ def generate_market_insights(
         }
 
 
-def _build_market_context(portfolio: Dict[str, float], impact: Dict[str, Any]) -> str:
-    """Build comprehensive market context"""
+def market_snapshot_version() -> str:
+    """Identifier of the current market data snapshot; it changes at each market close"""
+    return _calculate_next_update("daily")
 
-    # Market indices summary
-    indices_text = "\n".join([
-        f"- {name}: {data['change_percent']:+.1f}% ({data['trend']})"
-        for name, data in MARKET_DATA["indices"].items()
-    ])
-
-    # Sector performance
-    sectors_text = "\n".join([
-        f"- {sector}: {data['change_percent']:+.1f}% ({data['trend']})"
-        for sector, data in MARKET_DATA["sectors"].items()
-    ])
 
-    # Portfolio ETF performance
-    etfs_text = "\n".join([
-        f"- {etf['symbol']} ({etf['name']}): {etf['change_percent']:+.1f}% (your allocation: {etf['allocation']:.0f}%)"
-        for etf in impact["etf_impacts"]
-    ])
+@lru_cache(maxsize=2)
+def _market_sections(version: str) -> Dict[str, str]:
+    """Portfolio-independent parts of the market context, built once per snapshot"""
+    indicators = MARKET_DATA["economic_indicators"]
+    return {
+        "indices": "\n".join([
+            f"- {name}: {data['change_percent']:+.1f}% ({data['trend']})"
+            for name, data in MARKET_DATA["indices"].items()
+        ]),
+        "sectors": "\n".join([
+            f"- {sector}: {data['change_percent']:+.1f}% ({data['trend']})"
+            for sector, data in MARKET_DATA["sectors"].items()
+        ]),
+        "indicators": (
+            f"- Fed Rate: {indicators['Fed Interest Rate']['value']}%\n"
+            f"- Inflation: {indicators['Inflation (CPI)']['value']}% (trending {indicators['Inflation (CPI)']['trend']})\n"
+            f"- Unemployment: {indicators['Unemployment']['value']}%"
+        ),
+        "news": "\n".join([f"- {headline}" for headline in MARKET_DATA["news_headlines"][:3]]),
+    }
 
-    # Economic news
-    news_text = "\n".join([f"- {headline}" for headline in MARKET_DATA["news_headlines"][:3]])
 
-    return f"""
-CURRENT MARKET DATA:
+@lru_cache(maxsize=2)
+def _shared_market_context(version: str) -> str:
+    """Market data every user sees for a snapshot; sits in the shared prompt prefix"""
+    sections = _market_sections(version)
+    return f"""CURRENT MARKET DATA:
 
 Major Indices Performance:
-{indices_text}
+{sections['indices']}
 
 Sector Performance:
-{sectors_text}
-
-Your Portfolio ETFs:
-{etfs_text}
+{sections['sectors']}
 
 Economic Indicators:
-- Fed Rate: {MARKET_DATA['economic_indicators']['Fed Interest Rate']['value']}%
-- Inflation: {MARKET_DATA['economic_indicators']['Inflation (CPI)']['value']}% (trending {MARKET_DATA['economic_indicators']['Inflation (CPI)']['trend']})
-- Unemployment: {MARKET_DATA['economic_indicators']['Unemployment']['value']}%
+{sections['indicators']}
 
 Recent News:
-{news_text}
+{sections['news']}
+
 """
 
 
-def _create_insights_prompt(
-    user_profile: Dict[str, Any],
-    portfolio: Dict[str, float],
-    impact: Dict[str, Any],
-    market_context: str,
-    insight_type: str
-) -> str:
-    """Create prompt for AI market insights"""
+def _build_market_context(portfolio: Dict[str, float], impact: Dict[str, Any]) -> str:
+    """Per-user part of the market context; the snapshot-wide part is _shared_market_context"""
+    etfs_text = "\n".join([
+        f"- {etf['symbol']} ({etf['name']}): {etf['change_percent']:+.1f}% (your allocation: {etf['allocation']:.0f}%)"
+        for etf in impact["etf_impacts"]
+    ])
 
-    name = user_profile.get("name", "there")
-    age = user_profile.get("age", 25)
-    risk_tolerance = user_profile.get("quiz", {}).get("risk_tolerance", "medium")
+    return f"""Your Portfolio ETFs:
+{etfs_text}
+"""
 
-    return f"""You are an expert financial analyst providing personalized market insights. Explain market movements in SIMPLE, EASY-TO-UNDERSTAND language.
 
-USER PROFILE:
+_INSIGHTS_SUFFIX = """USER PROFILE:
 - Name: {name}
 - Age: {age}
 - Risk Tolerance: {risk_tolerance}
-- Portfolio Change Today: {impact['total_portfolio_change']:+.2f}%
+- Portfolio Change Today: {change}
 
 {market_context}
+UPDATE TYPE: {insight_type}
+
+Output ONLY valid JSON, no additional text."""
+
+# Shared prefix first (role, output schema, rules, then the snapshot's market data), then the user's part
+_INSIGHTS_PROMPT = PromptTemplate(
+    prefix="""You are an expert financial analyst providing personalized market insights. Explain market movements in SIMPLE, EASY-TO-UNDERSTAND language.
 
 TASK:
-Generate a personalized {insight_type} market update in JSON format with these keys:
+Generate a personalized market update of the UPDATE TYPE given at the end, in JSON format with these keys:
 
 1. "greeting": Personalized greeting mentioning their portfolio performance
 2. "main_insight": THE most important market movement that affected their portfolio (2-3 sentences, simple language)
@@ -252,7 +254,36 @@ RULES:
 - Avoid jargon - if you must use a term, explain it
 - Keep each point concise but informative
 
-Output ONLY valid JSON, no additional text."""
+""",
+    suffix=_INSIGHTS_SUFFIX,
+)
+
+
+_INSIGHTS_PROMPT_COMPACT = PromptTemplate(
+    prefix=_INSIGHTS_PROMPT.prefix + compact_instructions("insights") + "\n",
+    suffix=_INSIGHTS_SUFFIX,
+)
+
+
+def _create_insights_prompt(
+    user_profile: Dict[str, Any],
+    portfolio: Dict[str, float],
+    impact: Dict[str, Any],
+    market_context: str,
+    insight_type: str
+) -> str:
+    """Create prompt for AI market insights"""
+
+    template = _INSIGHTS_PROMPT_COMPACT if COMPACT_OUTPUT else _INSIGHTS_PROMPT
+    return template.render(
+        shared=_shared_market_context(market_snapshot_version()),
+        name=user_profile.get("name", "there"),
+        age=user_profile.get("age", 25),
+        risk_tolerance=user_profile.get("quiz", {}).get("risk_tolerance", "medium"),
+        change=f"{impact['total_portfolio_change']:+.2f}%",
+        market_context=market_context,
+        insight_type=insight_type,
+    )
 
 
 def _call_chat(prompt: str) -> str:
@@ -307,6 +338,11 @@ def _parse_insights(ai_response: str) -> Dict[str, Any]:
 
 def _generate_market_summary() -> Dict[str, Any]:
     """Generate quick market summary"""
+    return dict(_market_summary(market_snapshot_version()))
+
+
+@lru_cache(maxsize=2)
+def _market_summary(version: str) -> Dict[str, Any]:
     sp500 = MARKET_DATA["indices"]["S&P 500"]
     nasdaq = MARKET_DATA["indices"]["NASDAQ"]
     bonds = MARKET_DATA["bonds"]["10-Year Treasury"]
@@ -0,0 +1,299 @@
+"""
+Persistent Plan Store
+SQLite (WAL mode) store for generated plans, coach recommendations and market
+insights, keyed by response id. Each entry carries the profile hash and a version
+stamp (model id + corpus version) so it is only regenerated when the profile, the
+model or the retrieval corpus actually changed.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from schemas import UserProfile
+from config import MODEL_ID, CHROMA_DIR, CORPUS_VERSION, PLAN_STORE_PATH, HNSW_SEARCH_EF
+
+KINDS = ("plan", "coach", "insights")
+WRITE_BATCH_SIZE = 32
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    response_id  TEXT NOT NULL,
+    kind         TEXT NOT NULL,
+    profile_hash TEXT NOT NULL,
+    version      TEXT NOT NULL,
+    payload      TEXT NOT NULL,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL,
+    PRIMARY KEY (response_id, kind)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_profile ON entries (profile_hash, kind);
+"""
+
+
+def profile_hash(profile: Any) -> str:
+    """Stable hash of a profile (UserProfile or plain dict) plus any extra request inputs"""
+    if isinstance(profile, UserProfile):
+        profile = profile.model_dump(mode="json")
+    raw = json.dumps(profile, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def corpus_version(chroma_dir: Optional[str] = None) -> str:
+    """
+    CORPUS_VERSION if set, else the index version this process serves (see
+    index_versions.py), else a content hash of the index directory
+    """
+    if CORPUS_VERSION:
+        return CORPUS_VERSION
+    if chroma_dir is None:
+        from index_versions import serving_version
+        version = serving_version()
+        if version:
+            return version
+    return _directory_hash(chroma_dir or CHROMA_DIR)
+
+
+@lru_cache(maxsize=8)
+def _directory_hash(chroma_dir: str) -> str:
+    h = hashlib.sha256()
+    if os.path.isdir(chroma_dir):
+        for root, dirs, files in os.walk(chroma_dir):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                h.update(os.path.relpath(path, chroma_dir).encode("utf-8"))
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        h.update(block)
+    return h.hexdigest()[:16]
+
+
+def current_version(kind: str) -> str:
+    """Version stamp for a kind of entry; only the plan depends on the corpus, retrieval settings and IRS limits table"""
+    if kind == "plan":
+        import rag
+        from contributions import get_limits_table
+        retrieval = f"{rag.K_EACH or 'default'}/{rag.K_TOTAL}/ef:{HNSW_SEARCH_EF or 'default'}"
+        return f"{MODEL_ID}|corpus:{corpus_version()}|retrieval:{retrieval}|limits:{get_limits_table().version}"
+    return MODEL_ID
+
+
+class PlanStore:
+    """
+    Thread-safe store with one SQLite connection per thread. Writes can be queued with
+    put(..., defer=True) and are committed in batches of WRITE_BATCH_SIZE (or on flush()).
+    """
+
+    def __init__(self, path: str = PLAN_STORE_PATH, batch_size: int = WRITE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._pending: List[Tuple] = []  # oldest first; rows leave only after their commit succeeds
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, response_id: str, kind: str) -> Optional[Dict[str, Any]]:
+        """Return the raw entry (payload decoded) or None; queued writes win over committed rows"""
+        self._check_kind(kind)
+        row = None
+        with self._pending_lock:
+            for pending in reversed(self._pending):
+                if pending[0] == response_id and pending[1] == kind:
+                    row = (pending[2], pending[3], pending[4], pending[5], pending[6])
+                    break
+        if row is None:
+            row = self._conn().execute(
+                "SELECT profile_hash, version, payload, created_at, updated_at FROM entries "
+                "WHERE response_id = ? AND kind = ?",
+                (response_id, kind),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "response_id": response_id,
+            "kind": kind,
+            "profile_hash": row[0],
+            "version": row[1],
+            "payload": json.loads(row[2]),
+            "created_at": row[3],
+            "updated_at": row[4],
+        }
+
+    def get_fresh(self, response_id: str, kind: str, p_hash: str) -> Optional[Dict[str, Any]]:
+        """Return the stored payload only if it matches the profile hash and current version"""
+        entry = self.get(response_id, kind)
+        if entry and entry["profile_hash"] == p_hash and entry["version"] == current_version(kind):
+            return entry["payload"]
+        return None
+
+    def put(self, response_id: str, kind: str, p_hash: str, payload: Dict[str, Any], defer: bool = False) -> None:
+        """Insert or replace an entry; with defer=True the write joins the next batch"""
+        self._check_kind(kind)
+        now = time.time()
+        row = (response_id, kind, p_hash, current_version(kind), json.dumps(payload), now, now)
+        with self._pending_lock:
+            self._pending.append(row)
+            should_flush = not defer or len(self._pending) >= self.batch_size
+        if should_flush:
+            self.flush()
+
+    def put_many(self, rows: Iterable[Tuple[str, str, str, Dict[str, Any]]]) -> None:
+        """Write many (response_id, kind, profile_hash, payload) entries in one transaction"""
+        for response_id, kind, p_hash, payload in rows:
+            self.put(response_id, kind, p_hash, payload, defer=True)
+        self.flush()
+
+    def flush(self) -> int:
+        """
+        Commit all queued writes; returns how many rows were written. Rows stay queued (and
+        visible to get()) until the commit succeeds, so a failed commit loses nothing.
+        """
+        with self._flush_lock:
+            with self._pending_lock:
+                rows = list(self._pending)
+            if not rows:
+                return 0
+            self._write(rows)
+            with self._pending_lock:
+                del self._pending[:len(rows)]  # only flush removes rows, and flushes are serialized
+            return len(rows)
+
+    def _write(self, rows: List[Tuple]) -> None:
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO entries (response_id, kind, profile_hash, version, payload, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (response_id, kind) DO UPDATE SET "
+                "profile_hash = excluded.profile_hash, version = excluded.version, "
+                "payload = excluded.payload, updated_at = excluded.updated_at",
+                rows,
+            )
+
+    def get_or_create(
+        self,
+        response_id: str,
+        kind: str,
+        profile: Any,
+        produce: Callable[[], Dict[str, Any]],
+        is_ok: Callable[[Dict[str, Any]], bool] = lambda r: True,
+        defer: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Read-through lookup: serve the stored payload when it is still fresh, otherwise
+        call produce(), persist the result if is_ok(result) and return it.
+        """
+        p_hash = profile_hash(profile)
+        cached = self.get_fresh(response_id, kind, p_hash)
+        if cached is not None:
+            return cached
+        result = produce()
+        if isinstance(result, dict) and is_ok(result):
+            self.put(response_id, kind, p_hash, result, defer=defer)
+        return result
+
+    def delete(self, response_id: str, kind: Optional[str] = None) -> None:
+        with self._flush_lock:
+            with self._pending_lock:
+                self._pending = [
+                    r for r in self._pending if not (r[0] == response_id and (kind is None or r[1] == kind))
+                ]
+            self._delete(response_id, kind)
+
+    def _delete(self, response_id: str, kind: Optional[str]) -> None:
+        conn = self._conn()
+        with conn:
+            if kind is None:
+                conn.execute("DELETE FROM entries WHERE response_id = ?", (response_id,))
+            else:
+                conn.execute("DELETE FROM entries WHERE response_id = ? AND kind = ?", (response_id, kind))
+
+    def close(self) -> None:
+        self.flush()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _check_kind(kind: str) -> None:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown entry kind: {kind}")
+
+
+def stored_plan(store: PlanStore, response_id: str, retriever, profile: UserProfile) -> Dict[str, Any]:
+    """rag.generate_plan, persisted per response id; reuses retrieval prefetched for the id"""
+    from rag import generate_plan
+    from prefetch import take_prefetched
+
+    return store.get_or_create(
+        response_id, "plan", profile,
+        lambda: generate_plan(retriever, profile, prefetched=take_prefetched(retriever, response_id, profile)),
+        is_ok=lambda r: "error" not in r,
+    )
+
+
+def stored_investment_recommendations(
+    store: PlanStore,
+    response_id: str,
+    profile: UserProfile,
+    monthly_capacity: float,
+    goal_amount: float,
+    goal_timeline_months: int,
+) -> Dict[str, Any]:
+    """investment_coach.generate_investment_recommendations, persisted per response id"""
+    from investment_coach import generate_investment_recommendations
+
+    key = {
+        "profile": profile.model_dump(mode="json"),
+        "monthly_capacity": monthly_capacity,
+        "goal_amount": goal_amount,
+        "goal_timeline_months": goal_timeline_months,
+    }
+    return store.get_or_create(
+        response_id, "coach", key,
+        lambda: generate_investment_recommendations(profile, monthly_capacity, goal_amount, goal_timeline_months),
+        is_ok=lambda r: bool(r.get("success")),
+    )
+
+
+def stored_market_insights(
+    store: PlanStore,
+    response_id: str,
+    user_profile: Dict[str, Any],
+    portfolio_allocation: Dict[str, float],
+    insight_type: str = "daily",
+) -> Dict[str, Any]:
+    """
+    market_insights.generate_market_insights, persisted per response id. Insights go
+    stale at the next market update, so an entry past its next_update is regenerated.
+    """
+    from market_insights import generate_market_insights
+
+    key = {"profile": user_profile, "portfolio": portfolio_allocation, "type": insight_type}
+    p_hash = profile_hash(key)
+    cached = store.get_fresh(response_id, "insights", p_hash)
+    if cached is not None and cached.get("next_update", "") > time.strftime("%Y-%m-%d %H:%M:%S"):
+        return cached
+    result = generate_market_insights(user_profile, portfolio_allocation, insight_type)
+    if result.get("success"):
+        store.put(response_id, "insights", p_hash, result)
+    return result
@@ -0,0 +1,170 @@
+"""
+Speculative Retrieval Prefetch
+Plan retrieval queries only depend on the help type, the employer plan options and
+whether there is a savings goal, so they can run as soon as the Quiz step is submitted.
+A partial QuizAnswers payload starts the searches in the background under the response
+id; when the form arrives, generate_plan reuses the hits and only waits on the LLM.
+Answers the form has not given yet are speculated on (every query they could add is
+prefetched), and entries of abandoned sessions expire after PREFETCH_TTL_S.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from schemas import HelpType, PlanOption, UserProfile
+import rag
+from rag import FALLBACK_QUERY, _merge_hits, _retrieval_queries, _search
+
+# Prefetch Configuration
+PREFETCH_TTL_S = 30 * 60
+MAX_ENTRIES = 10_000
+PREFETCH_WORKERS = 4
+WAIT_S = 5.0          # how long a plan waits on an in-flight search before running it itself
+
+
+def speculative_queries(partial: Dict[str, Any]) -> List[str]:
+    """
+    Every query the final profile could need, from a partial payload: quiz fields (at
+    least help_type, top level or under "quiz") plus whatever "form" answers exist
+    """
+    quiz = partial.get("quiz") or partial
+    if not quiz.get("help_type"):
+        raise ValueError("Prefetch payload needs quiz.help_type")
+    help_type = HelpType(quiz["help_type"])
+    form = partial.get("form") or {}
+    benefits = form.get("benefits") or {}
+    goal = form.get("savings_goal") or {}
+
+    if "employer_plan_options" in benefits:
+        options = [PlanOption(o) for o in benefits["employer_plan_options"] or []]
+    else:
+        options = [PlanOption.hsa]
+    has_goal = bool(goal.get("what_are_you_saving_for")) if "what_are_you_saving_for" in goal else True
+
+    queries = _retrieval_queries(help_type, options, has_goal, limit=None)
+    if not help_type.value.startswith("employer") and FALLBACK_QUERY not in queries:
+        queries.append(FALLBACK_QUERY)
+    return queries
+
+
+class PrefetchEntry:
+    """In-flight or finished searches for one response id, keyed by query"""
+
+    def __init__(self, response_id: str):
+        self.response_id = response_id
+        self.searches: Dict[str, Future] = {}
+        self.created = self.last_active = time.time()
+
+
+class PrefetchStore:
+    """Background retrieval keyed by response id, with idle expiry"""
+
+    def __init__(self, ttl_s: float = PREFETCH_TTL_S, max_entries: int = MAX_ENTRIES, workers: int = PREFETCH_WORKERS):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: Dict[str, PrefetchEntry] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    def prefetch(self, retriever, response_id: str, partial: Dict[str, Any]) -> List[str]:
+        """Start the searches for a partial payload; returns the queries being prefetched"""
+        queries = speculative_queries(partial)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(response_id)
+            if entry is None:
+                entry = self._entries[response_id] = PrefetchEntry(response_id)
+            entry.last_active = now
+            for q in queries:
+                if q not in entry.searches:
+                    entry.searches[q] = self._executor.submit(_search, retriever, q, rag.K_EACH)
+        return queries
+
+    def take(self, retriever, response_id: str, p: UserProfile, wait_s: float = WAIT_S) -> Optional[Tuple[List[str], List[str]]]:
+        """
+        (contexts, sources) for the final profile, identical to rag._retrieve_contexts.
+        Queries that were not prefetched, or whose search failed or is still running
+        after wait_s, are searched inline. None when nothing was prefetched.
+        """
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(response_id)
+            if entry is None:
+                return None
+            entry.last_active = now
+            searches = dict(entry.searches)
+
+        queries = _retrieval_queries(
+            p.help_type, p.form.benefits.employer_plan_options, bool(p.form.savings_goal.what_are_you_saving_for)
+        )
+        deadline = time.monotonic() + wait_s
+
+        def hits():
+            for q in queries:
+                search = searches.get(q)
+                if search is not None:
+                    try:
+                        yield search.result(timeout=max(0.0, deadline - time.monotonic()))
+                        continue
+                    except Exception:
+                        pass
+                yield _search(retriever, q, rag.K_EACH)
+
+        return _merge_hits(hits(), rag.K_TOTAL)
+
+    def discard(self, response_id: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(response_id, None)
+        if entry is not None:
+            for search in entry.searches.values():
+                search.cancel()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expire(self, now: float) -> None:
+        stale = [rid for rid, e in self._entries.items() if now - e.last_active > self.ttl_s]
+        if len(self._entries) - len(stale) >= self.max_entries:
+            live = sorted((e for e in self._entries.values() if e.response_id not in stale), key=lambda e: e.last_active)
+            stale += [e.response_id for e in live[: len(live) - self.max_entries + 1]]
+        for rid in stale:
+            for search in self._entries.pop(rid).searches.values():
+                search.cancel()
+
+
+prefetches = PrefetchStore()
+
+
+def take_prefetched(retriever, response_id: Optional[str], p: UserProfile) -> Optional[Tuple[List[str], List[str]]]:
+    """Prefetched (contexts, sources) for a response id from the shared store, or None"""
+    if not response_id:
+        return None
+    return prefetches.take(retriever, response_id, p)
+
+
+# Example usage
+if __name__ == "__main__":
+    import json
+    from vectorstore import load_vectordb
+    from rag import _retrieve_contexts
+    from config import TOP_K
+
+    retriever = load_vectordb().as_retriever(search_kwargs={"k": TOP_K})
+    with open("sample_json", "r", encoding="utf-8") as f:
+        profile = UserProfile.model_validate(json.load(f))
+
+    started = prefetches.prefetch(retriever, "demo", {"quiz": profile.quiz.model_dump(mode="json")})
+    print(f"Prefetching {len(started)} queries: {started}")
+    time.sleep(2.0)  # user filling in the form
+
+    t1 = time.perf_counter()
+    contexts, sources = take_prefetched(retriever, "demo", profile)
+    t2 = time.perf_counter()
+    baseline = _retrieve_contexts(retriever, profile)
+    t3 = time.perf_counter()
+    print(f"take: {1000 * (t2 - t1):.1f} ms, inline retrieval: {1000 * (t3 - t2):.1f} ms")
+    print(f"Same contexts as inline retrieval: {(contexts, sources) == baseline}")
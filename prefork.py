@@ -0,0 +1,381 @@
+"""
+Pre-Fork Serving Mode
+Loads the MiniLM embedder and the Chroma index once in a parent process, warms them
+with representative retrieval queries, moves every live object into the GC's permanent
+generation (gc.freeze) and forks worker processes that serve on the shared listening
+socket. Workers inherit the model weights, index and lookup tables copy-on-write, so
+memory per extra worker stays near the size of its own request state.
+
+Workers serve the cached market/ETF endpoints of api_server.py plus:
+
+    POST /api/plan        {"profile": {...}, "response_id": "optional"}
+    POST /api/chat        {"message": "...", "session_id": "optional", "profile": {...}}
+    POST /api/prefetch    {"response_id": "...", "quiz": {...}, "form": {...partial}}
+
+Per-worker memory (RSS, PSS and unique/private RSS from /proc/<pid>/smaps_rollup) is
+printed after start-up and on SIGUSR1, and each worker's /health includes its own.
+Chat sessions live in worker memory (chat.sessions), so they are per-worker in this mode:
+a turn that lands on another worker starts a new session under the same id, and clients
+should send the profile with every turn. /api/prefetch (sent when the Quiz step is
+submitted) starts the plan's searches under the response id; prefetches are per-worker
+too, and a plan request served by another worker simply retrieves inline.
+With versioned indexes (index_versions.py) each worker follows CURRENT on its own; a
+new version is loaded per worker and is not shared copy-on-write.
+
+    python prefork.py --workers 4 --port 8000
+"""
+
+import gc
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional
+
+from compact_schema import usage
+from api_server import CachedAPIHandler, CachedAPIServer, DEFAULT_HOST, DEFAULT_PORT
+from schemas import UserProfile
+
+# Pre-Fork Configuration
+DEFAULT_WORKERS = 4
+TORCH_THREADS = 1             # per worker; also keeps the parent from starting an OpenMP pool before fork
+REPORT_DELAY_S = 5.0          # let workers finish booting before the first memory report
+RESPAWN_BACKOFF_S = 1.0
+MAX_BODY_BYTES = 1 << 20
+
+CHAT_WARMUP_QUERIES = [
+    "How much should I keep in an emergency fund?",
+    "Should I pick the Roth 401(k) or the traditional 401(k)?",
+]
+
+
+def load_retriever():
+    """
+    Embedder + Chroma index as a retriever, the same way the generators load it; through
+    the index manager when versioned indexes are installed, so workers follow CURRENT
+    """
+    try:
+        import torch
+        torch.set_num_threads(TORCH_THREADS)
+    except ImportError:
+        pass
+    from index_versions import SwappableRetriever, current_version, get_index_manager
+    if current_version():
+        return SwappableRetriever(get_index_manager())
+    from vectorstore import load_vectordb
+    from config import TOP_K
+    return load_vectordb().as_retriever(search_kwargs={"k": TOP_K})
+
+
+def warmup_queries() -> List[str]:
+    """Every plan retrieval query plus a few chat-style questions"""
+    from rag import all_retrieval_queries
+    return all_retrieval_queries() + CHAT_WARMUP_QUERIES
+
+
+def warm_up(retriever, queries: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Touch everything workers would otherwise load lazily (and privately): index pages,
+    embedder, tokenizer caches and the module-level tables
+    """
+    from rag import K_EACH, _search
+    from etf_universe import get_universe
+    from etf_screener import get_screener
+    from etf_overlap import get_holdings
+    from contributions import get_limits_table
+    import investment_coach, market_insights, projections, plan_store, chat, prefetch  # noqa: F401
+
+    t0 = time.perf_counter()
+    queries = queries or warmup_queries()
+    if retriever is not None:
+        for q in queries:
+            _search(retriever, q, K_EACH)
+    get_universe()
+    get_screener()
+    get_holdings()
+    get_limits_table()
+    plan_store.corpus_version()
+    return {"queries": len(queries), "warmup_s": round(time.perf_counter() - t0, 2)}
+
+
+def freeze_heap() -> int:
+    """Collect, then move all surviving objects to the permanent generation"""
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+def memory_usage(pid: int) -> Dict[str, int]:
+    """RSS, PSS, unique (private) and shared memory of a process in KiB"""
+    fields: Dict[str, int] = {}
+    path = f"/proc/{pid}/smaps_rollup"
+    if not os.path.exists(path):
+        path = f"/proc/{pid}/smaps"
+    with open(path, "r") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            parts = rest.split()
+            if len(parts) == 2 and parts[1] == "kB":
+                fields[name] = fields.get(name, 0) + int(parts[0])
+    return {
+        "rss_kb": fields.get("Rss", 0),
+        "pss_kb": fields.get("Pss", 0),
+        "uss_kb": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared_kb": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+    }
+
+
+def format_memory_report(rows: List[Dict[str, Any]]) -> str:
+    lines = [f"{'process':<10}{'pid':>8}{'rss MiB':>10}{'pss MiB':>10}{'unique MiB':>12}{'shared MiB':>12}"]
+    for r in rows:
+        lines.append(
+            f"{r['role']:<10}{r['pid']:>8}{r['rss_kb'] / 1024:>10.1f}{r['pss_kb'] / 1024:>10.1f}"
+            f"{r['uss_kb'] / 1024:>12.1f}{r['shared_kb'] / 1024:>12.1f}"
+        )
+    workers = [r for r in rows if r["role"] == "worker"]
+    if workers:
+        naive = sum(r["rss_kb"] for r in workers) / 1024
+        actual = sum(r["pss_kb"] for r in rows) / 1024
+        lines.append(f"workers' summed RSS {naive:.1f} MiB vs total PSS {actual:.1f} MiB (parent included)")
+    return "\n".join(lines)
+
+
+class PreforkHandler(CachedAPIHandler):
+    """Cached GET endpoints plus plan generation and chat on the shared retriever"""
+
+    server: "PreforkServer"
+
+    def do_OPTIONS(self) -> None:
+        self.send_response(204)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", "GET, HEAD, POST, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, If-None-Match, If-Modified-Since")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0].rstrip("/") == "/health":
+            self._send_json(200, {
+                "status": "ok",
+                "pid": os.getpid(),
+                "memory": memory_usage(os.getpid()),
+                "cache": self.server.cache.snapshot_stats(),
+                "compact_output": usage.snapshot_stats()["totals"],
+                "index": self.server.index_stats(),
+            })
+            return
+        super().do_GET()
+
+    def _read_json(self) -> Optional[Dict[str, Any]]:
+        """Request body as a JSON object, or None after sending the error response"""
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self._send_json(413, {"success": False, "error": "Request body too large"})
+            return None
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("body must be a JSON object")
+        except Exception as e:
+            self._send_json(400, {"success": False, "error": f"Invalid request: {e}"})
+            return None
+        return body
+
+    def do_POST(self) -> None:
+        routes = {"/api/plan": self._post_plan, "/api/chat": self._post_chat, "/api/prefetch": self._post_prefetch}
+        route = routes.get(self.path.split("?", 1)[0].rstrip("/"))
+        if route is None:
+            self._send_json(404, {"success": False, "error": "Not found"})
+            return
+        body = self._read_json()
+        if body is not None:
+            route(body)
+
+    def _post_plan(self, body: Dict[str, Any]) -> None:
+        from rag import generate_plan
+        from plan_store import stored_plan
+        from prefetch import take_prefetched
+
+        try:
+            profile = UserProfile.model_validate(body.get("profile") or {})
+        except Exception as e:
+            self._send_json(400, {"success": False, "error": f"Invalid request: {e}"})
+            return
+
+        response_id = body.get("response_id")
+        retriever = self.server.retriever
+        pin = retriever.pinned() if hasattr(retriever, "pinned") else nullcontext(retriever)
+        with pin as retriever:  # one index version for the whole request, even across a swap
+            if response_id and self.server.store is not None:
+                result = stored_plan(self.server.store, response_id, retriever, profile)
+            else:
+                result = generate_plan(retriever, profile, prefetched=take_prefetched(retriever, response_id, profile))
+        self._send_json(502 if "error" in result else 200, result)
+
+    def _post_chat(self, body: Dict[str, Any]) -> None:
+        from chat import chat_turn
+
+        message = body.get("message")
+        if not isinstance(message, str) or not message.strip():
+            self._send_json(400, {"success": False, "error": "Invalid request: message is required"})
+            return
+        try:
+            profile = UserProfile.model_validate(body["profile"]) if body.get("profile") else None
+        except Exception as e:
+            self._send_json(400, {"success": False, "error": f"Invalid request: {e}"})
+            return
+
+        retriever = self.server.retriever
+        pin = retriever.pinned() if hasattr(retriever, "pinned") else nullcontext(retriever)
+        with pin as retriever:
+            result = chat_turn(retriever, message.strip(), session_id=body.get("session_id"), profile=profile)
+        self._send_json(200 if result["success"] else 502, result)
+
+    def _post_prefetch(self, body: Dict[str, Any]) -> None:
+        from prefetch import prefetches
+
+        response_id = body.get("response_id")
+        if not isinstance(response_id, str) or not response_id:
+            self._send_json(400, {"success": False, "error": "Invalid request: response_id is required"})
+            return
+        try:
+            # Searches run after this returns, so they go through the unpinned retriever
+            queries = prefetches.prefetch(self.server.retriever, response_id, body)
+        except (AttributeError, TypeError, ValueError) as e:
+            self._send_json(400, {"success": False, "error": f"Invalid request: {e}"})
+            return
+        self._send_json(202, {"success": True, "response_id": response_id, "queries": len(queries)})
+
+
+class PreforkServer(CachedAPIServer):
+    """Listening socket and shared state created in the parent, served by forked workers"""
+
+    def __init__(self, address, retriever, store=None, verbose: bool = False):
+        super().__init__(address, verbose=verbose, handler_class=PreforkHandler)
+        self.retriever = retriever
+        self.store = store
+
+    def index_stats(self) -> Optional[Dict[str, Any]]:
+        manager = getattr(self.retriever, "manager", None)
+        return manager.stats() if manager is not None else None
+
+
+class Supervisor:
+    """Forks workers on a bound server and restarts any that exit"""
+
+    def __init__(self, server: PreforkServer, workers: int = DEFAULT_WORKERS):
+        self.server = server
+        self.workers = workers
+        self.pids: List[int] = []
+        self._stopping = False
+
+    def _spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+            code = 0
+            try:
+                self.server.serve_forever()
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.pids.append(pid)
+        return pid
+
+    def memory_report(self) -> List[Dict[str, Any]]:
+        rows = [{"role": "parent", "pid": os.getpid(), **memory_usage(os.getpid())}]
+        for pid in list(self.pids):
+            try:
+                rows.append({"role": "worker", "pid": pid, **memory_usage(pid)})
+            except OSError:
+                pass
+        return rows
+
+    def _print_report(self, *_: Any) -> None:
+        print(format_memory_report(self.memory_report()), flush=True)
+
+    def _stop(self, *_: Any) -> None:
+        self._stopping = True
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self, report_delay_s: float = REPORT_DELAY_S) -> None:
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGUSR1, self._print_report)
+        for _ in range(self.workers):
+            self._spawn()
+        manager = getattr(self.server.retriever, "manager", None)
+        if manager is not None:
+            manager.detach()  # workers keep their version open; the parent must not pin it forever
+
+        if report_delay_s > 0:
+            signal.signal(signal.SIGALRM, self._print_report)
+            signal.setitimer(signal.ITIMER_REAL, report_delay_s)
+
+        while self.pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            if pid in self.pids:
+                self.pids.remove(pid)
+            if not self._stopping:
+                print(f"worker {pid} exited with status {status}; restarting", file=sys.stderr, flush=True)
+                time.sleep(RESPAWN_BACKOFF_S)
+                self._spawn()
+        self.server.server_close()
+
+
+def serve(
+    workers: int = DEFAULT_WORKERS,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    loader: Callable[[], Any] = load_retriever,
+    use_store: bool = True,
+    verbose: bool = False,
+) -> None:
+    """Load and warm in this process, freeze the heap, then fork and supervise workers"""
+    t0 = time.perf_counter()
+    retriever = loader()
+    warm = warm_up(retriever)
+    store = None
+    if use_store:
+        from plan_store import PlanStore
+        store = PlanStore()  # connections are opened per thread, so each worker gets its own
+    server = PreforkServer((host, port), retriever, store=store, verbose=verbose)
+    server.cache.get("market-analysis")
+    frozen = freeze_heap()
+    print(
+        f"Loaded and warmed in {time.perf_counter() - t0:.1f}s ({warm['queries']} queries); "
+        f"{frozen} objects frozen; forking {workers} workers on http://{host}:{port}",
+        flush=True,
+    )
+    Supervisor(server, workers).run()
+
+
+# Example usage
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve with pre-forked workers sharing one loaded index")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--no-store", action="store_true", help="do not persist plans in the plan store")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    serve(args.workers, args.host, args.port, use_store=not args.no_store, verbose=args.verbose)
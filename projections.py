@@ -0,0 +1,353 @@
+"""
+Cashflow Projections
+Deterministic month-by-month projections of debt payoff (avalanche or snowball),
+emergency-fund build-up and savings-goal progress from the profile's take-home pay,
+expenses, savings and debts. Scenarios (profiles x strategies) are simulated together
+as NumPy arrays, and the results are condensed into a few prompt lines so the LLM
+explains the numbers instead of computing them.
+
+Each month's surplus goes through a waterfall: a starter emergency fund, then extra
+payments on high-interest debt, then the full emergency fund, then extra payments on the
+remaining debt, then the savings goal. Extra payments follow the strategy's order
+(highest APR or smallest balance first) within each debt tier.
+Monthly expenses are taken to include the debts' minimum payments, so a minimum freed
+by a paid-off debt joins the surplus; it first offsets any deficit. A deficit is not
+drawn from savings, and nothing is projected to grow while net cashflow is <= 0.
+A scenario in which no debt shrinks and nothing reaches the emergency fund stays that way
+(payments at or below the interest): it is stopped there and its remaining debts are
+reported as not paid off, with no interest total.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from schemas import UserProfile
+
+# Projection Configuration
+STRATEGIES = ("avalanche", "snowball")
+STARTER_FUND_MONTHS = 1.0       # emergency fund built before extra debt payments
+EMERGENCY_FUND_MONTHS = 6.0     # full emergency fund, as on the Form page
+HIGH_INTEREST_APR = 7.0         # debts at or above this APR get extra payments before the full emergency fund
+MAX_MONTHS = 600
+PAID_OFF = 0.005                # dollars
+
+
+def _payoff_order(balances: np.ndarray, aprs: np.ndarray, strategies: Sequence[str]) -> np.ndarray:
+    """(S, D) debt order for extra payments: highest APR first, or smallest balance first"""
+    avalanche = np.lexsort((balances, -aprs))
+    snowball = np.lexsort((-aprs, balances))
+    is_snowball = np.array([s == "snowball" for s in strategies])[:, None]
+    return np.where(is_snowball, snowball, avalanche)
+
+
+def _allocate(balances: np.ndarray, amount: np.ndarray, order: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Spread `amount` (S,) over debts (S, D) in priority order, filling each in turn"""
+    ordered = balances[rows, order]
+    before = np.cumsum(ordered, axis=1) - ordered
+    paid = np.empty_like(balances)
+    paid[rows, order] = np.clip(amount[:, None] - before, 0.0, ordered)
+    return paid
+
+
+def _first_month(done: np.ndarray, months: np.ndarray, current: np.ndarray) -> np.ndarray:
+    """Update 'first month reached' markers from an (S, K) condition over `months`"""
+    first = months[done.argmax(axis=1)]
+    return np.where((current < 0) & done.any(axis=1), first, current)
+
+
+def simulate(
+    surplus: np.ndarray,
+    expenses: np.ndarray,
+    savings: np.ndarray,
+    goal_amount: np.ndarray,
+    balances: np.ndarray,
+    aprs: np.ndarray,
+    min_payments: np.ndarray,
+    strategies: Sequence[str],
+    max_months: int = MAX_MONTHS,
+) -> Dict[str, np.ndarray]:
+    """
+    Simulate S scenarios month by month.
+
+    Args:
+        surplus, expenses, savings, goal_amount: (S,) monthly take-home minus expenses
+            (negative for a deficit), monthly expenses, current savings and goal target
+            (0 for no goal)
+        balances, aprs, min_payments: (S, D) debts, zero-padded; APRs in percent
+        strategies: (S,) "avalanche" or "snowball"
+
+    Returns:
+        (S,) months until the starter fund, full emergency fund, high-interest debt paid,
+        debt freedom and goal (0 = already there, -1 = not within max_months), total
+        interest paid, (S, D) debts never paid off because their payments do not cover
+        the interest, and (S, M+1) month-end schedules for total debt, emergency fund and
+        goal savings.
+    """
+    n = len(surplus)
+    bal = np.array(balances, dtype=np.float64, copy=True).reshape(n, -1)
+    rates = np.asarray(aprs, dtype=np.float64).reshape(n, -1) / 1200.0
+    mins = np.asarray(min_payments, dtype=np.float64).reshape(n, -1)
+    high = np.asarray(aprs, dtype=np.float64).reshape(n, -1) >= HIGH_INTEREST_APR
+    order = _payoff_order(bal, rates, strategies)
+    income = np.asarray(surplus, dtype=np.float64)
+    goal_amount = np.asarray(goal_amount, dtype=np.float64)
+
+    starter = STARTER_FUND_MONTHS * np.asarray(expenses, dtype=np.float64)
+    target = EMERGENCY_FUND_MONTHS * np.asarray(expenses, dtype=np.float64)
+    ef = np.minimum(savings, target)
+    goal = np.asarray(savings, dtype=np.float64) - ef
+    interest_paid = np.zeros(n)
+    stuck = np.zeros(bal.shape, dtype=bool)
+
+    def reached(done: np.ndarray) -> np.ndarray:
+        return np.where(done, 0, -1)
+
+    starter_month = reached(ef >= starter - PAID_OFF)
+    fund_month = reached(ef >= target - PAID_OFF)
+    debt_month = reached(bal.sum(axis=1) <= PAID_OFF)
+    high_month = reached((bal * high).sum(axis=1) <= PAID_OFF)
+    goal_month = np.where(goal_amount > 0, reached(goal >= goal_amount), 0)
+    debt_sched, ef_sched, goal_sched = [bal.sum(axis=1)], [ef.copy()], [goal.copy()]
+
+    rows = np.arange(n)[:, None]
+    for month in range(1, max_months + 1):
+        frozen = stuck.any(axis=1)
+        if (frozen | ((fund_month >= 0) & (debt_month >= 0) & (goal_month >= 0))).all():
+            break
+        if not bal.any():
+            # Debt-free from here on: the surplus is constant, so the rest is closed form
+            avail = np.maximum(income + mins.sum(axis=1), 0.0)
+            need = np.maximum(target - ef, 0.0) + np.maximum(goal_amount - goal, 0.0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                months_left = np.where(avail > 0, np.ceil(need / avail), np.inf)
+            k = np.arange(1, int(min(max_months - month + 1, max(months_left.max(), 1))) + 1)
+            added = avail[:, None] * k
+            ef_t = np.minimum(ef[:, None] + added, target[:, None])
+            goal_t = goal[:, None] + added - (ef_t - ef[:, None])
+            months = month - 1 + k
+            starter_month = _first_month(ef_t >= starter[:, None] - PAID_OFF, months, starter_month)
+            fund_month = _first_month(ef_t >= target[:, None] - PAID_OFF, months, fund_month)
+            debt_month = np.where(debt_month < 0, month, debt_month)
+            high_month = np.where(high_month < 0, month, high_month)
+            goal_month = _first_month(goal_t >= goal_amount[:, None], months, goal_month)
+            debt_sched.extend(np.zeros((len(k), n)))
+            ef_sched.extend(ef_t.T)
+            goal_sched.extend(goal_t.T)
+            break
+
+        prev_bal, prev_ef = bal.copy(), ef.copy()
+        interest = bal * rates
+        bal += interest
+        interest_paid += np.where(frozen, 0.0, interest.sum(axis=1))
+        paid_min = np.minimum(mins, bal)
+        bal -= paid_min
+        avail = np.maximum(income + (mins - paid_min).sum(axis=1), 0.0)
+
+        x = np.minimum(avail, np.maximum(starter - ef, 0.0))
+        ef += x
+        avail -= x
+        paid = _allocate(np.where(high, bal, 0.0), avail, order, rows)
+        bal -= paid
+        avail -= paid.sum(axis=1)
+        x = np.minimum(avail, np.maximum(target - ef, 0.0))
+        ef += x
+        avail -= x
+        paid = _allocate(bal, avail, order, rows)
+        bal -= paid
+        goal += avail - paid.sum(axis=1)
+        bal[bal <= PAID_OFF] = 0.0
+
+        # Negative amortization: with no debt shrinking and nothing saved, next month repeats
+        # this one with larger balances, so the remaining debts are never paid off
+        shrank = (bal < prev_bal - PAID_OFF).any(axis=1)
+        stuck |= (~frozen & ~shrank & (ef <= prev_ef))[:, None] & (bal > 0)
+
+        total_debt = bal.sum(axis=1)
+        starter_month = np.where((starter_month < 0) & (ef >= starter - PAID_OFF), month, starter_month)
+        fund_month = np.where((fund_month < 0) & (ef >= target - PAID_OFF), month, fund_month)
+        debt_month = np.where((debt_month < 0) & (total_debt <= PAID_OFF), month, debt_month)
+        high_month = np.where((high_month < 0) & ((bal * high).sum(axis=1) <= PAID_OFF), month, high_month)
+        goal_month = np.where((goal_month < 0) & (goal >= goal_amount), month, goal_month)
+        debt_sched.append(total_debt)
+        ef_sched.append(ef.copy())
+        goal_sched.append(goal.copy())
+
+    return {
+        "starter_fund_month": starter_month,
+        "emergency_fund_month": fund_month,
+        "debt_free_month": debt_month,
+        "high_interest_free_month": high_month,
+        "goal_month": goal_month,
+        "total_interest": interest_paid,
+        "stuck": stuck,
+        "debt": np.stack(debt_sched, axis=1),
+        "emergency_fund": np.stack(ef_sched, axis=1),
+        "goal": np.stack(goal_sched, axis=1),
+    }
+
+
+def _month(value: Any) -> Optional[int]:
+    value = int(value)
+    return None if value < 0 else value
+
+
+def project_profiles(profiles: List[UserProfile], strategies: Sequence[str] = STRATEGIES) -> List[Optional[Dict[str, Any]]]:
+    """
+    Projections for many profiles in one simulation (profiles x strategies); None for a
+    profile without take-home pay and expenses
+    """
+    rows, owners = [], []
+    for i, p in enumerate(profiles):
+        cf = p.form.cashflow
+        if cf.monthly_take_home_pay is None or cf.monthly_expenses is None:
+            continue
+        for s in (strategies if p.form.debts else strategies[:1]):
+            rows.append((p, s))
+            owners.append(i)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(profiles)
+    if not rows:
+        return results
+
+    n_debts = max(1, max(len(p.form.debts) for p, _ in rows))
+    balances = np.zeros((len(rows), n_debts))
+    aprs = np.zeros((len(rows), n_debts))
+    mins = np.zeros((len(rows), n_debts))
+    for r, (p, _) in enumerate(rows):
+        for d, debt in enumerate(p.form.debts):
+            balances[r, d], aprs[r, d], mins[r, d] = debt.balance, debt.apr_percent, debt.min_payment
+    take_home = np.array([p.form.cashflow.monthly_take_home_pay for p, _ in rows], dtype=np.float64)
+    expenses = np.array([p.form.cashflow.monthly_expenses for p, _ in rows], dtype=np.float64)
+    savings = np.array([p.form.cashflow.current_savings or 0.0 for p, _ in rows], dtype=np.float64)
+    goals = np.array([p.form.savings_goal.target_amount or 0.0 for p, _ in rows], dtype=np.float64)
+
+    sim = simulate(take_home - expenses, expenses, savings, goals, balances, aprs, mins, [s for _, s in rows])
+
+    by_profile: Dict[int, List[int]] = {}
+    for r, owner in enumerate(owners):
+        by_profile.setdefault(owner, []).append(r)
+    for owner, idx in by_profile.items():
+        p = profiles[owner]
+        debts = p.form.debts
+        debt_options = {
+            rows[r][1]: {
+                "high_interest_free_month": _month(sim["high_interest_free_month"][r]),
+                "debt_free_month": _month(sim["debt_free_month"][r]),
+                # Only a debt-free scenario has a finite interest total
+                "total_interest": round(float(sim["total_interest"][r]), 2) if sim["debt_free_month"][r] >= 0 else None,
+                "not_paid_off": [debts[d].name or f"debt {d + 1}" for d in np.flatnonzero(sim["stuck"][r, :len(debts)])],
+            }
+            for r in idx
+        }
+        # Debt-free first, then least interest, then fewest months to clear high-interest debt
+        best_r = min(idx, key=lambda r: (
+            sim["debt_free_month"][r] < 0,
+            round(float(sim["total_interest"][r]), 2),
+            sim["high_interest_free_month"][r] < 0, sim["high_interest_free_month"][r],
+        ))
+        goal = p.form.savings_goal
+        timeline = goal.timeline_months
+        target = float(goal.target_amount or 0.0)
+        surplus = float(take_home[best_r] - expenses[best_r])
+        debt_free_surplus = surplus + float(mins[best_r].sum())
+        goal_month = _month(sim["goal_month"][best_r])
+        results[owner] = {
+            "monthly_surplus": round(surplus, 2),
+            "debt_free_surplus": round(debt_free_surplus, 2),
+            "emergency_fund": {
+                "target": round(float(EMERGENCY_FUND_MONTHS * expenses[best_r]), 2),
+                "current": round(float(sim["emergency_fund"][best_r, 0]), 2),
+                "starter_month": _month(sim["starter_fund_month"][best_r]),
+                "funded_month": _month(sim["emergency_fund_month"][best_r]),
+            },
+            "debt": {
+                "total": round(float(balances[best_r].sum()), 2),
+                "recommended": rows[best_r][1],
+                "strategies": debt_options,
+            } if p.form.debts else None,
+            "goal": {
+                "name": goal.what_are_you_saving_for,
+                "target": round(target, 2),
+                "timeline_months": timeline,
+                "reached_month": goal_month,
+                "on_track": goal_month is not None and (timeline is None or goal_month <= timeline),
+                "required_monthly": round(max(target - float(sim["goal"][best_r, 0]), 0.0) / timeline, 2) if timeline else None,
+            } if target > 0 else None,
+            "schedule": {
+                "debt": np.round(sim["debt"][best_r], 2).tolist(),
+                "emergency_fund": np.round(sim["emergency_fund"][best_r], 2).tolist(),
+                "goal": np.round(sim["goal"][best_r], 2).tolist(),
+            },
+        }
+    return results
+
+
+def project_profile(p: UserProfile, strategies: Sequence[str] = STRATEGIES) -> Optional[Dict[str, Any]]:
+    return project_profiles([p], strategies)[0]
+
+
+def _when(month: Optional[int], never: bool = False, horizon: int = MAX_MONTHS) -> str:
+    if month is None:
+        return "never (expenses exceed take-home pay)" if never else f"not within {horizon // 12} years"
+    return "already" if month == 0 else f"month {month}"
+
+
+def projection_facts(proj: Dict[str, Any]) -> str:
+    """Compact prompt lines for a project_profile() result"""
+    ef = proj["emergency_fund"]
+    never = proj["debt_free_surplus"] <= 0  # not even freed minimums turn cashflow positive
+    lines = [
+        f"- Monthly surplus: {'-' if proj['monthly_surplus'] < 0 else ''}${abs(proj['monthly_surplus']):,.0f}",
+        f"- Emergency fund ({EMERGENCY_FUND_MONTHS:g} mo expenses): ${ef['current']:,.0f} of ${ef['target']:,.0f}; "
+        f"starter ({STARTER_FUND_MONTHS:g} mo) {_when(ef['starter_month'], never)}, "
+        f"fully funded {_when(ef['funded_month'], never)}",
+    ]
+    debt = proj["debt"]
+    if debt:
+        def outcome(o: Dict[str, Any]) -> str:
+            if o["not_paid_off"]:
+                return f"{', '.join(o['not_paid_off'])} not paid off at the minimum payment (payments do not cover the interest)"
+            if o["total_interest"] is None:
+                return f"high-interest paid {_when(o['high_interest_free_month'])}, debt-free {_when(None)}"
+            return (f"high-interest paid {_when(o['high_interest_free_month'])}, "
+                    f"debt-free {_when(o['debt_free_month'])}, ${o['total_interest']:,.0f} interest")
+
+        options = list(debt["strategies"].items())
+        if len({outcome(o) for _, o in options}) == 1:
+            names = " and ".join(name for name, _ in options)
+            lines.append(f"- Debt ${debt['total']:,.0f} ({outcome(options[0][1])}; {names} give the same result)")
+        else:
+            detail = "; ".join(f"{name}: {outcome(o)}" for name, o in options)
+            lines.append(f"- Debt ${debt['total']:,.0f} ({detail}); recommended: {debt['recommended']}")
+    goal = proj["goal"]
+    if goal:
+        line = f"- Goal '{goal['name'] or 'savings'}' ${goal['target']:,.0f}: reached {_when(goal['reached_month'], never)}"
+        if goal["timeline_months"]:
+            line += f" vs {goal['timeline_months']} mo timeline ({'on track' if goal['on_track'] else 'behind'}"
+            line += f", needs ${goal['required_monthly']:,.0f}/mo)"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# Example usage
+if __name__ == "__main__":
+    import json
+    import time
+    from pathlib import Path
+
+    with Path("sample_json").open("r", encoding="utf-8") as f:
+        payload = json.load(f)
+    payload["form"].setdefault("debts", [
+        {"name": "Credit card", "balance": 3200, "apr_percent": 22.9, "min_payment": 90},
+        {"name": "Store card", "balance": 900, "apr_percent": 18.0, "min_payment": 35},
+        {"name": "Student loan", "balance": 18000, "apr_percent": 5.5, "min_payment": 200},
+    ])
+    profile = UserProfile.model_validate(payload)
+
+    projection = project_profile(profile)
+    print(projection_facts(projection))
+
+    batch = [profile] * 1000
+    t0 = time.perf_counter()
+    project_profiles(batch)
+    print(f"{len(batch)} profiles x {len(STRATEGIES)} strategies in {time.perf_counter() - t0:.2f}s")
@@ -0,0 +1,138 @@
+"""
+Prefix-Stable Prompt Layout
+The generators lay out their prompts as a byte-identical shared prefix (system rules,
+output schema, then context shared by many users such as the market snapshot) followed
+by a per-user suffix. Inference servers with prefix (KV) caching, including
+fake_llm_server.py, then reuse the prefill of the prefix across requests.
+Templates are built once at import.
+
+    python prompt_layout.py       # shared-prefix fraction per prompt
+"""
+
+import json
+import os
+from string import Formatter
+from typing import Any, Dict, List, Tuple
+
+# Prompt Layout Configuration
+CHARS_PER_TOKEN = 4        # rough tokenizer stand-in, same as fake_llm_server.py
+
+
+class PromptTemplate:
+    """A fixed prefix plus a suffix template with {field} slots, both parsed once"""
+
+    def __init__(self, prefix: str, suffix: str):
+        self.prefix = prefix
+        self._parts: List[Tuple[str, Any]] = []
+        for literal, field, spec, conversion in Formatter().parse(suffix):
+            if spec or conversion:
+                raise ValueError(f"Format field {{{field}}} must be pre-formatted by the caller")
+            self._parts.append((literal, field))
+
+    def render(self, shared: str = "", **fields: Any) -> str:
+        """prefix + shared (context identical for many users) + the filled-in suffix"""
+        out = [self.prefix, shared]
+        for literal, field in self._parts:
+            out.append(literal)
+            if field is not None:
+                out.append(str(fields[field]))
+        return "".join(out)
+
+
+def _sample_payloads() -> List[Dict[str, Any]]:
+    """sample_json plus variants that differ in the per-user fields"""
+    with open("sample_json", "r", encoding="utf-8") as f:
+        base = json.load(f)
+    variants = [base]
+    for i, (age, salary, risk) in enumerate([(29, 54_000, "low"), (47, 140_000, "high"), (61, 88_000, "medium")]):
+        v = json.loads(json.dumps(base))
+        v["quiz"].update(name=f"Sample User {i + 1}", age=age, salary=salary, risk_tolerance=risk)
+        variants.append(v)
+    return variants
+
+
+def _plan_prompts(payloads: List[Dict[str, Any]]) -> List[str]:
+    from rag import _build_question, _create_prompt, _retrieval_queries
+    from schemas import UserProfile
+
+    prompts = []
+    for payload in payloads:
+        p = UserProfile.model_validate(payload)
+        queries = _retrieval_queries(
+            p.help_type, p.form.benefits.employer_plan_options, bool(p.form.savings_goal.what_are_you_saving_for)
+        )
+        contexts = [f"[retrieved chunk for: {q}] " + "Plan rules and limits. " * 40 for q in queries]
+        prompts.append(_create_prompt(_build_question(p), contexts))
+    return prompts
+
+
+def _coach_prompts(payloads: List[Dict[str, Any]]) -> List[str]:
+    from investment_coach import _build_market_context, _create_investment_prompt, calculate_allocation, get_recommended_etfs
+    from schemas import UserProfile
+
+    prompts = []
+    for payload in payloads:
+        p = UserProfile.model_validate(payload)
+        risk = p.quiz.risk_tolerance.value if p.quiz.risk_tolerance else "medium"
+        allocation = calculate_allocation(risk, p.age, 500.0, 60)
+        context = _build_market_context(get_recommended_etfs(risk, 500.0), allocation)
+        prompts.append(_create_investment_prompt(p, 500.0, 25_000.0, 60, allocation, context))
+    return prompts
+
+
+def _insights_prompts(payloads: List[Dict[str, Any]]) -> List[str]:
+    from market_insights import _build_market_context, _create_insights_prompt, calculate_portfolio_impact
+
+    portfolios = [{"VTI": 60, "BND": 40}, {"QQQ": 50, "VXUS": 30, "BND": 20}, {"VOO": 80, "AGG": 20}, {"VTI": 100}]
+    prompts = []
+    for payload, portfolio in zip(payloads, portfolios * len(payloads)):
+        impact = calculate_portfolio_impact(portfolio)
+        context = _build_market_context(portfolio, impact)
+        quiz = payload["quiz"]
+        user = {"name": quiz["name"], "age": quiz["age"], "quiz": {"risk_tolerance": quiz.get("risk_tolerance")}}
+        prompts.append(_create_insights_prompt(user, portfolio, impact, context, "daily"))
+    return prompts
+
+
+def prefix_report() -> List[Dict[str, Any]]:
+    """
+    Per generator: the static template prefix and the prefix actually shared by the sample
+    users' prompts (static prefix plus shared context), as ~tokens and share of the prompt
+    """
+    import investment_coach
+    import market_insights
+    import rag
+
+    payloads = _sample_payloads()
+    rows = []
+    for name, template, prompts in (
+        ("plan", rag._PLAN_PROMPT, _plan_prompts(payloads)),
+        ("coach", investment_coach._INVESTMENT_PROMPT, _coach_prompts(payloads)),
+        ("insights", market_insights._INSIGHTS_PROMPT, _insights_prompts(payloads)),
+    ):
+        shared = len(os.path.commonprefix(prompts))
+        mean_len = sum(len(p) for p in prompts) / len(prompts)
+        rows.append({
+            "prompt": name,
+            "prompt_tokens": round(mean_len / CHARS_PER_TOKEN),
+            "static_prefix_tokens": len(template.prefix) // CHARS_PER_TOKEN,
+            "shared_prefix_tokens": shared // CHARS_PER_TOKEN,
+            "static_fraction": round(len(template.prefix) / mean_len, 3),
+            "shared_fraction": round(shared / mean_len, 3),
+        })
+    return rows
+
+
+def format_report(rows: List[Dict[str, Any]]) -> str:
+    lines = [f"{'prompt':<10}{'~tokens':>9}{'static':>9}{'shared':>9}{'static %':>10}{'shared %':>10}"]
+    for r in rows:
+        lines.append(
+            f"{r['prompt']:<10}{r['prompt_tokens']:>9}{r['static_prefix_tokens']:>9}{r['shared_prefix_tokens']:>9}"
+            f"{r['static_fraction'] * 100:>9.1f}%{r['shared_fraction'] * 100:>9.1f}%"
+        )
+    return "\n".join(lines)
+
+
+# Example usage
+if __name__ == "__main__":
+    print(format_report(prefix_report()))
@@ -1,8 +1,12 @@
 import time, json, re
-from typing import List, Tuple
+from typing import Iterable, List, Optional, Tuple
 from huggingface_hub import InferenceClient
-from schemas import UserProfile
-from config import MODEL_ID, HF_TOKEN
+from schemas import HelpType, PlanOption, UserProfile
+from projections import project_profile, projection_facts
+from contributions import contribution_facts, optimize_profile
+from prompt_layout import PromptTemplate
+from compact_schema import compact_instructions, expand, usage
+from config import MODEL_ID, HF_TOKEN, INFERENCE_BASE_URL, TOP_K, RETRIEVAL_K_EACH, RETRIEVAL_K_TOTAL, COMPACT_OUTPUT
 
 MAX_CTX_CHARS = 3500
 MAX_NEW_TOKENS = 256
@@ -11,32 +15,67 @@ TIMEOUT_SECS = 30
 TOP_P = 0.9
 REPETITION_PENALTY = 1.05
 
-client = InferenceClient(token=HF_TOKEN, timeout=30)
+client = InferenceClient(base_url=INFERENCE_BASE_URL, token=HF_TOKEN, timeout=30)
 
 _json_block = re.compile(r"\{[\s\S]*\}\s*$")
 
-def _create_prompt(question: str, contexts: List[str], max_ctx_chars: int = MAX_CTX_CHARS) -> str:
-    ctx = ("\n\n".join(contexts) if contexts else "")[:max_ctx_chars]
-    system = (
+_PLAN_SUFFIX = "Context:\n{context}\n\nUser profile:\n{question}\n\nAnswer (JSON only):"
+
+# Shared prefix first (rules, schema, task), then the retrieved context and the user's profile
+_PLAN_PROMPT = PromptTemplate(
+    prefix=(
         "You are a question-answering assistant that must use ONLY the provided context.\n"
         "If the answer cannot be found in the context, reply exactly: \"I don't know.\" "
         "Do NOT make up facts.\n"
-    )
-    instr = (
+        "\n"
         "Guidelines:\n"
         "1) Keep outputs concise but clear.\n"
         "2) Cite phrases and include source tags/URLs when helpful.\n"
         "3) If the question asks for something not in the context, say: I don't know.\n"
         '4) Output valid JSON with keys: "greeting", "recommendations", "warnings", "as_of_year". '
         'Each recommendation = {"title","summary","steps","considerations","citations"}.\n'
+        "\n"
+        "Task: create a personalized plan based ONLY on the context and the user profile below. "
+        "Explain options (401k/Roth/HSA if present), the precomputed contribution limits and match strategy, "
+        "and actionable steps. If facts are not in the context, answer: I don't know.\n"
+        "\n"
+    ),
+    suffix=_PLAN_SUFFIX,
+)
+_PLAN_PROMPT_COMPACT = PromptTemplate(
+    prefix=_PLAN_PROMPT.prefix + compact_instructions("plan", numbered_context=True) + "\n",
+    suffix=_PLAN_SUFFIX,
+)
+
+def _create_prompt(question: str, contexts: List[str], max_ctx_chars: int = MAX_CTX_CHARS, compact: Optional[bool] = None) -> str:
+    """Plan prompt; the compact form numbers the context chunks so citations can refer to them"""
+    compact = COMPACT_OUTPUT if compact is None else compact
+    if compact:
+        contexts = [f"[{i}] {c}" for i, c in enumerate(contexts, 1)]
+    ctx = ("\n\n".join(contexts) if contexts else "")[:max_ctx_chars]
+    return (_PLAN_PROMPT_COMPACT if compact else _PLAN_PROMPT).render(context=ctx, question=question)
+
+def _cashflow_lines(p: UserProfile) -> str:
+    """Precomputed cashflow projections when take-home pay and expenses are known, else the raw answers"""
+    projection = project_profile(p)
+    if projection is not None:
+        return (
+            "- Precomputed projections (quote these numbers, do not recompute):\n"
+            + projection_facts(projection)
+        )
+    return (
+        f"- Monthly take-home: ${p.form.cashflow.monthly_take_home_pay or 'N/A'}\n"
+        f"- Monthly expenses: ${p.form.cashflow.monthly_expenses or 'N/A'}\n"
+        f"- Current savings: ${p.form.cashflow.current_savings or 'N/A'}\n"
+        f"- Savings goal: {p.form.savings_goal.what_are_you_saving_for or 'N/A'} "
+        f"target ${p.form.savings_goal.target_amount or 'N/A'} in "
+        f"{p.form.savings_goal.timeline_months or 'N/A'} months"
     )
-    return f"{system}\n{instr}\nQuestion:\n{question}\n\nContext:\n{ctx}\n\nAnswer (JSON only):"
 
 def _build_question(p: UserProfile) -> str:
     opts = ", ".join([o.value for o in p.form.benefits.employer_plan_options]) or "none provided"
     concerns = ", ".join([c.value for c in p.quiz.top_concerns]) or "unspecified"
     return (
-        "Create a personalized plan based ONLY on the provided context and the user profile:\n"
         f"- Name: {p.name}\n"
         f"- Age: {p.age}\n"
         f"- Salary: ${p.salary:,.0f}\n"
@@ -48,40 +87,74 @@ def _build_question(p: UserProfile) -> str:
         f"- Employer plan options: {opts}\n"
         f"- Employer match %: {p.form.benefits.employer_match_percent or 'N/A'}\n"
         f"- Contributing now: {p.form.benefits.contributing_now}\n"
-        f"- Monthly take-home: ${p.form.cashflow.monthly_take_home_pay or 'N/A'}\n"
-        f"- Monthly expenses: ${p.form.cashflow.monthly_expenses or 'N/A'}\n"
-        f"- Current savings: ${p.form.cashflow.current_savings or 'N/A'}\n"
-        f"- Savings goal: {p.form.savings_goal.what_are_you_saving_for or 'N/A'} "
-        f"target ${p.form.savings_goal.target_amount or 'N/A'} in "
-        f"{p.form.savings_goal.timeline_months or 'N/A'} months\n"
-        "Explain options (401k/Roth/HSA if present), contribution limits, match strategy, and actionable steps. "
-        "If facts are not in the context, answer: I don't know."
+        "- Precomputed contribution plan (use these limits and amounts):\n"
+        f"{contribution_facts(optimize_profile(p))}\n"
+        f"{_cashflow_lines(p)}"
     )
 
-def _retrieve_contexts(retriever, p: UserProfile, k_each: int = 2, k_total: int = 8):
+MAX_QUERIES = 4
+FALLBACK_QUERY = "retirement plan basics"
+K_EACH = RETRIEVAL_K_EACH     # hits per query; None keeps the retriever's own k (TOP_K)
+K_TOTAL = RETRIEVAL_K_TOTAL   # chunks kept after merging
+
+def _retrieval_queries(help_type, plan_options, has_savings_goal: bool, limit: Optional[int] = MAX_QUERIES) -> List[str]:
+    """Retrieval queries for a profile; depends only on the quiz help type and a few form answers"""
+    help_value = getattr(help_type, "value", help_type) or ""
     queries = []
-    if p.help_type.value.startswith("employer"):
+    if help_value.startswith("employer"):
         queries += ["401(k) basics fees match", "Roth 401(k) vs Traditional 401(k)", "auto-enrollment target-date funds"]
-    if any(o.value.lower() in ("hsa", "fsa") for o in p.form.benefits.employer_plan_options):
+    if any(getattr(o, "value", o).lower() in ("hsa", "fsa") for o in plan_options):
         queries += ["HSA eligibility HDHP tax benefits vs FSA"]
-    if p.form.savings_goal.what_are_you_saving_for:
+    if has_savings_goal:
         queries += ["saving plan contribution priority emergency fund rule of thumb"]
+    return queries[:limit] or [FALLBACK_QUERY]
+
+def all_retrieval_queries() -> List[str]:
+    """Every distinct query _retrieval_queries can produce"""
+    queries: List[str] = []
+    for help_type in HelpType:
+        for options in ([], [PlanOption.hsa]):
+            for has_goal in (False, True):
+                for q in _retrieval_queries(help_type, options, has_goal, limit=None):
+                    if q not in queries:
+                        queries.append(q)
+    return queries
+
+def _search(retriever, q: str, k_each: Optional[int] = None) -> List[Tuple[str, str]]:
+    """(source, page_content) hits for one query; k_each overrides the retriever's own k"""
+    vectorstore = getattr(retriever, "vectorstore", None)
+    if k_each is not None and vectorstore is not None and getattr(retriever, "search_type", "similarity") == "similarity":
+        docs = vectorstore.similarity_search(q, **{**(getattr(retriever, "search_kwargs", None) or {}), "k": k_each})
+    elif hasattr(retriever, "invoke"):
+        docs = retriever.invoke(q)[:k_each]
+    else:
+        docs = retriever.similarity_search(q, k=k_each or TOP_K)
+    return [((getattr(d, "metadata", None) or {}).get("source", ""), getattr(d, "page_content", "") or "") for d in docs]
 
+def _merge_hits(hits_per_query: Iterable[List[Tuple[str, str]]], k_total: int = K_TOTAL):
+    """Deduplicate per-query hits in query order, up to k_total chunks"""
     contexts, sources, seen = [], [], set()
-    for q in (queries[:4] or ["retirement plan basics"]):
-        docs = retriever.invoke(q) if hasattr(retriever, "invoke") else retriever.similarity_search(q, k=k_each)
-        for d in docs:
-            s = (getattr(d, "metadata", None) or {}).get("source", "")
-            key = (s, (getattr(d, "page_content", "") or "")[:120])
+    for hits in hits_per_query:
+        for s, text in hits:
+            key = (s, text[:120])
             if key in seen: 
                 continue
             seen.add(key)
-            contexts.append(getattr(d, "page_content", "") or "")
+            contexts.append(text)
             sources.append(s)
             if len(contexts) >= k_total: break
         if len(contexts) >= k_total: break
     return contexts, sources
 
+def _retrieve_contexts(retriever, p: UserProfile, k_each: Optional[int] = None, k_total: Optional[int] = None):
+    """Merged hits of the profile's queries; k_each/k_total default to K_EACH/K_TOTAL at call time"""
+    k_each = K_EACH if k_each is None else k_each
+    k_total = K_TOTAL if k_total is None else k_total
+    queries = _retrieval_queries(
+        p.help_type, p.form.benefits.employer_plan_options, bool(p.form.savings_goal.what_are_you_saving_for)
+    )
+    return _merge_hits((_search(retriever, q, k_each) for q in queries), k_total)
+
 def _call_chat(prompt: str) -> str:
     messages = [
         {"role": "system", "content": "Follow the user-provided prompt exactly."},
@@ -98,7 +171,7 @@ def _call_chat(prompt: str) -> str:
 def _call_text(prompt: str) -> str:
     return client.text_generation(
         prompt,
-        model=MODEL_ID,                
+        model=INFERENCE_BASE_URL or MODEL_ID,
         max_new_tokens=256,
         temperature=0.2,
         top_p=0.9,
@@ -107,9 +180,13 @@ def _call_text(prompt: str) -> str:
         stream=False,                  
     ) or ""
 
-def generate_plan(retriever, p: UserProfile):
+def generate_plan(retriever, p: UserProfile, prefetched: Optional[Tuple[List[str], List[str]]] = None):
+    """
+    Retrieve, prompt and parse a plan. `prefetched` is a (contexts, sources) pair from
+    prefetch.take_prefetched; when given, retrieval is skipped.
+    """
     t0 = time.perf_counter()
-    contexts, sources = _retrieve_contexts(retriever, p)
+    contexts, sources = prefetched if prefetched is not None else _retrieve_contexts(retriever, p)
     t1 = time.perf_counter()
     prompt = _create_prompt(_build_question(p), contexts)
 
@@ -145,6 +222,9 @@ def generate_plan(retriever, p: UserProfile):
 
     try:
         data = json.loads(text)
+        if COMPACT_OUTPUT:
+            data = expand("plan", data, sources)
+            usage.record("plan", text, data)
     except Exception:
         data = {
             "greeting": f"Hi {p.name}, here’s your personalized plan.",
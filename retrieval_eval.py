@@ -0,0 +1,218 @@
+"""
+Retrieval Recall Benchmark
+Measures how much recall the approximate HNSW index gives up for speed. Every embedding
+in the local Chroma collection is exported and brute-force top-k ground truth is
+computed for a golden query set; then the HNSW search breadth (ef) and k are swept and
+recall@k is reported next to per-query search latency, so HNSW_SEARCH_EF, TOP_K /
+RETRIEVAL_K_EACH and RETRIEVAL_K_TOTAL can be chosen from data.
+
+Chroma reads ef from the collection when its index segment loads and has no per-query
+setting, so the sweep runs on a temporary copy of the index, reopened after each change;
+the served index is never written. --apply-ef writes a chosen value into an unversioned
+index directory; versioned indexes get it at install (index_versions.py --search-ef).
+
+Query embeddings are computed once up front, so latencies cover the index search only.
+
+    python retrieval_eval.py --ef 10 20 40 80 160 --k 2 4 8
+    python retrieval_eval.py --apply-ef 40 --index chroma_db
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Retrieval Eval Configuration
+DEFAULT_EFS = [10, 20, 40, 80, 160]
+DEFAULT_KS = [2, 4, 8]
+DEFAULT_REPEATS = 3       # timed passes over the golden set per setting
+PERCENTILES = (50, 95)
+
+CHAT_GOLDEN_QUERIES = [
+    "How much should I keep in an emergency fund?",
+    "Should I pick the Roth 401(k) or the traditional 401(k)?",
+    "What is the 401(k) contribution limit this year?",
+    "Can I contribute to an HSA if I have an FSA?",
+    "How does an employer match work?",
+    "What are target-date funds and their fees?",
+    "Should I pay off credit card debt before investing?",
+    "What happens to my 401(k) if I change jobs?",
+]
+
+
+def golden_queries(path: Optional[str] = None) -> List[str]:
+    """One query per line from a file, else every plan retrieval query plus typical chat questions"""
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    from rag import all_retrieval_queries
+    return all_retrieval_queries() + CHAT_GOLDEN_QUERIES
+
+
+def export_collection(collection) -> Tuple[List[str], np.ndarray]:
+    """Ids and the (N, D) embedding matrix of a Chroma collection"""
+    data = collection.get(include=["embeddings"])
+    return list(data["ids"]), np.asarray(data["embeddings"], dtype=np.float32)
+
+
+def distance_space(collection) -> str:
+    """The collection's HNSW distance: l2 (Chroma's default), ip or cosine"""
+    space = (collection.metadata or {}).get("hnsw:space")
+    if not space:
+        try:
+            space = (collection.configuration or {}).get("hnsw", {}).get("space")
+        except AttributeError:
+            space = None
+    return getattr(space, "value", space) or "l2"
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, space: str = "l2") -> np.ndarray:
+    """(Q, k) row indices of the nearest vectors by brute force, nearest first"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    if space == "cosine":
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    dots = queries @ vectors.T
+    if space == "l2":
+        scores = (vectors * vectors).sum(axis=1)[None, :] - 2.0 * dots  # |q|^2 does not change the order
+    else:
+        scores = -dots
+    k = min(k, vectors.shape[0])
+    idx = np.argpartition(scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(scores, idx, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1)
+
+
+def recall_at_k(approx: Sequence[Sequence[str]], exact: Sequence[Sequence[str]], k: int) -> float:
+    """Mean share of the exact top-k ids the approximate search also returned"""
+    shares = []
+    for a, e in zip(approx, exact):
+        truth = set(e[:k])
+        if truth:
+            shares.append(len(truth & set(a[:k])) / len(truth))
+    return float(np.mean(shares)) if shares else 0.0
+
+
+def timed_queries(collection, embeddings: np.ndarray, k: int) -> Tuple[List[List[str]], List[float]]:
+    """Ids returned by the index for each query embedding, and each search's latency in ms"""
+    hits, latencies = [], []
+    for e in embeddings:
+        t0 = time.perf_counter()
+        res = collection.query(query_embeddings=[e.tolist()], n_results=k, include=[])
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits.append(list(res["ids"][0]))
+    return hits, latencies
+
+
+def _latency_stats(latencies: List[float]) -> Dict[str, float]:
+    return {f"p{p}": round(float(np.percentile(latencies, p)), 3) for p in PERCENTILES}
+
+
+def _open_collection(persist_directory: str, collection_name: str):
+    import chromadb
+    return chromadb.PersistentClient(path=persist_directory).get_collection(collection_name)
+
+
+def sweep(
+    persist_directory: str,
+    queries: List[str],
+    efs: Sequence[int] = DEFAULT_EFS,
+    ks: Sequence[int] = DEFAULT_KS,
+    repeats: int = DEFAULT_REPEATS,
+    embeddings_model=None,
+) -> Dict[str, Any]:
+    """
+    recall@k and search latency for every (ef, k), plus a brute-force baseline row, on a
+    temporary copy of the index at persist_directory. Raises if an ef does not take effect.
+    """
+    from chromadb.api.client import SharedSystemClient
+    from vectorstore import COLLECTION_NAME, load_embeddings, set_search_ef
+
+    embeddings_model = embeddings_model or load_embeddings()
+    embeddings = np.asarray([embeddings_model.embed_query(q) for q in queries], dtype=np.float32)
+
+    with tempfile.TemporaryDirectory(prefix="retrieval_eval-") as tmp:
+        copy = os.path.join(tmp, "index")
+        shutil.copytree(persist_directory, copy)
+        collection = _open_collection(copy, COLLECTION_NAME)
+        ids, vectors = export_collection(collection)
+        space = distance_space(collection)
+        k_max = max(ks)
+        exact_idx = exact_top_k(vectors, embeddings, k_max, space)
+        exact = [[ids[i] for i in row] for row in exact_idx]
+
+        rows = []
+        exact_latencies = []
+        for _ in range(repeats):
+            for e in embeddings:
+                t0 = time.perf_counter()
+                exact_top_k(vectors, e, k_max, space)
+                exact_latencies.append((time.perf_counter() - t0) * 1000)
+        rows.append({"ef": "exact", "k": k_max, "recall": 1.0, "latency_ms": _latency_stats(exact_latencies)})
+
+        try:
+            for ef in efs:
+                applied = set_search_ef(copy, ef)
+                if applied != ef:
+                    raise RuntimeError(f"ef={ef} did not take effect: the reopened index reports ef={applied}")
+                collection = _open_collection(copy, COLLECTION_NAME)
+                for k in ks:
+                    timed_queries(collection, embeddings, k)  # untimed pass after the reload
+                    hits, latencies = [], []
+                    for _ in range(repeats):
+                        hits, run = timed_queries(collection, embeddings, k)
+                        latencies += run
+                    rows.append({"ef": ef, "k": k, "recall": round(recall_at_k(hits, exact, k), 4),
+                                 "latency_ms": _latency_stats(latencies)})
+        finally:
+            SharedSystemClient.clear_system_cache()  # release the copy before it is deleted
+
+    return {"collection_size": len(ids), "space": space, "queries": len(queries), "repeats": repeats, "rows": rows}
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"{report['collection_size']} vectors ({report['space']}), {report['queries']} queries x {report['repeats']} passes",
+        f"{'ef':>6} {'k':>4} {'recall@k':>10} {'p50 ms':>9} {'p95 ms':>9}",
+    ]
+    for r in report["rows"]:
+        lat = r["latency_ms"]
+        lines.append(f"{r['ef']:>6} {r['k']:>4} {r['recall']:>10.4f} {lat['p50']:>9.3f} {lat['p95']:>9.3f}")
+    return "\n".join(lines)
+
+
+# Example usage
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="recall@k vs latency of the HNSW index against exact search")
+    parser.add_argument("--ef", type=int, nargs="+", default=DEFAULT_EFS, help="HNSW search breadths to try")
+    parser.add_argument("--k", type=int, nargs="+", default=DEFAULT_KS, help="result counts to score")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--queries", default=None, help="file with one golden query per line")
+    parser.add_argument("--json", dest="json_out", default=None, help="write the report to this file")
+    parser.add_argument("--index", default=None, help="index directory (default: the active index)")
+    parser.add_argument("--apply-ef", type=int, default=None, help="write this search breadth into --index and exit")
+    args = parser.parse_args()
+
+    from config import INDEX_ROOT
+    from index_versions import current_dir
+    from vectorstore import set_search_ef
+
+    index_dir = args.index or current_dir()
+    if args.apply_ef and os.path.abspath(index_dir).startswith(os.path.abspath(INDEX_ROOT) + os.sep):
+        parser.error("installed index versions are immutable; reinstall the archive with "
+                     "`python index_versions.py install --search-ef N`")
+    if args.apply_ef:
+        print(f"{index_dir}: ef={set_search_ef(index_dir, args.apply_ef)}")
+    else:
+        report = sweep(index_dir, golden_queries(args.queries), args.ef, args.k, args.repeats)
+        print(format_report(report))
+        if args.json_out:
+            with open(args.json_out, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
@@ -85,10 +85,17 @@ class HouseholdCashflow(BaseModel):
     current_savings: Optional[confloat(ge=0)] = None
     notes: Optional[str] = None
 
+class DebtAccount(BaseModel):
+    name: Optional[str] = None
+    balance: confloat(ge=0)
+    apr_percent: confloat(ge=0, le=100) = 0
+    min_payment: confloat(ge=0) = 0
+
 class FormAnswers(BaseModel):
     cashflow: HouseholdCashflow = HouseholdCashflow()
     benefits: BenefitsDetails = BenefitsDetails()
     savings_goal: SavingsGoalDetails = SavingsGoalDetails()
+    debts: List[DebtAccount] = Field(default_factory=list)
 
 class UserProfile(BaseModel):
     quiz: QuizAnswers
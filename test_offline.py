@@ -0,0 +1,377 @@
+"""
+Offline Checks
+Asserts on the numeric cores that run without the LLM, the embedder or a Chroma index.
+test.py stays the end-to-end run against a real index and model.
+
+    python -m pytest -q test_offline.py
+"""
+
+import io
+import json
+import os
+import re
+import tarfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from contributions import get_limits_table, optimize_contributions
+from dedup_corpus import _merged_metadata, cluster_near_duplicates, lsh_candidate_pairs, minhash_signatures
+from etf_screener import SORT_KEYS, Screen, get_screener
+from etf_universe import RISK_TIERS, get_universe
+import index_versions
+import investment_coach
+import plan_store
+from plan_store import PlanStore
+from projections import project_profile, projection_facts, simulate
+from schemas import UserProfile
+
+HERE = Path(__file__).resolve().parent
+
+
+# Plan store
+
+def test_plan_store_serves_fresh_entries_and_regenerates_on_profile_or_version_change(tmp_path, monkeypatch):
+    store = PlanStore(str(tmp_path / "plans.sqlite3"))
+    calls = []
+
+    def produce():
+        calls.append(1)
+        return {"n": len(calls)}
+
+    assert store.get_or_create("r1", "coach", {"age": 30}, produce) == {"n": 1}
+    assert store.get_or_create("r1", "coach", {"age": 30}, produce) == {"n": 1}
+    assert store.get_or_create("r1", "coach", {"age": 31}, produce) == {"n": 2}
+    monkeypatch.setattr(plan_store, "current_version", lambda kind: "another-model")
+    assert store.get_or_create("r1", "coach", {"age": 31}, produce) == {"n": 3}
+    assert len(calls) == 3
+    store.close()
+
+
+def test_plan_store_failed_result_is_not_stored(tmp_path):
+    store = PlanStore(str(tmp_path / "plans.sqlite3"))
+    store.get_or_create("r1", "coach", {}, lambda: {"error": "LLM down"}, is_ok=lambda r: "error" not in r)
+    assert store.get("r1", "coach") is None
+    store.close()
+
+
+def test_plan_store_deferred_writes_are_read_first_and_survive_a_failed_commit(tmp_path, monkeypatch):
+    store = PlanStore(str(tmp_path / "plans.sqlite3"), batch_size=10)
+    store.put("r1", "coach", "h", {"v": 1})
+    store.put("r1", "coach", "h", {"v": 2}, defer=True)
+    assert store.get("r1", "coach")["payload"] == {"v": 2}  # queued write wins over the committed row
+
+    def fail(rows):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(store, "_write", fail)
+    with pytest.raises(RuntimeError):
+        store.flush()
+    assert store.get("r1", "coach")["payload"] == {"v": 2}
+
+    monkeypatch.undo()
+    assert store.flush() == 1
+    assert store.flush() == 0
+    other = PlanStore(store.path)
+    assert other.get("r1", "coach")["payload"] == {"v": 2}
+    store.delete("r1")
+    assert store.get("r1", "coach") is None
+    store.close()
+    other.close()
+
+
+def test_plan_store_delete_drops_queued_writes(tmp_path):
+    store = PlanStore(str(tmp_path / "plans.sqlite3"), batch_size=10)
+    store.put("r1", "coach", "h", {"v": 1}, defer=True)
+    store.delete("r1", "coach")
+    assert store.flush() == 0
+    assert store.get("r1", "coach") is None
+    store.close()
+
+
+# Near-duplicate clustering
+
+def _words(seed: int, n: int = 120) -> list:
+    rng = np.random.RandomState(seed)
+    return [f"w{x}" for x in rng.randint(0, 5000, size=n)]
+
+
+def test_dedup_clusters_near_duplicates_and_keeps_distinct_chunks_apart():
+    base = _words(1)
+    edited = list(base)
+    edited[60] = "changed"
+    texts = [" ".join(base), " ".join(_words(2)), " ".join(edited), " ".join(_words(3))]
+    clusters = sorted(sorted(c) for c in cluster_near_duplicates(texts))
+    assert clusters == [[0, 2], [1], [3]]
+
+
+def test_dedup_pairs_every_member_of_a_shared_bucket():
+    text = " ".join(_words(4))
+    sigs = minhash_signatures([text, text, text, " ".join(_words(5))])
+    pairs = lsh_candidate_pairs(sigs)
+    assert {(0, 1), (0, 2), (1, 2)} <= pairs
+    assert not any(3 in p for p in pairs)
+    assert sorted(sorted(c) for c in cluster_near_duplicates([text] * 3)) == [[0, 1, 2]]
+
+
+def test_dedup_merged_metadata_lists_every_source_once():
+    meta = _merged_metadata([0, 1, 2], [{"source": "a.pdf"}, {"source": "b.pdf"}, {"source": "a.pdf"}], rep=1)
+    assert meta["source"] == "b.pdf"
+    assert meta["merged_sources"] == "a.pdf | b.pdf"
+    assert meta["duplicate_count"] == 3
+
+
+# ETF screener and recommendations
+
+def test_screener_results_meet_every_criterion_in_sort_order():
+    screener, universe = get_screener(), get_universe()
+    for tier in (None,) + RISK_TIERS:
+        for sort_by in SORT_KEYS:
+            s = Screen(risk_tier=tier, max_expense_ratio=0.2, min_avg_daily_volume=1_000_000,
+                       max_min_investment=300, sort_by=sort_by, top_n=3)
+            hits = screener.screen(s)
+            assert len(hits) <= 3
+            for i in hits:
+                assert tier is None or RISK_TIERS[universe.risk_tier[i]] == tier
+                assert universe.expense_ratio[i] <= 0.2
+                assert universe.avg_daily_volume[i] >= 1_000_000
+                assert universe.min_investment[i] <= 300
+            if sort_by == "score":
+                assert list(screener.score[hits]) == sorted(screener.score[hits], reverse=True)
+            if sort_by == "expense_ratio":
+                assert list(universe.expense_ratio[hits]) == sorted(universe.expense_ratio[hits])
+            assert screener.screen_batch([s])[0] == hits.tolist()
+
+
+def test_screener_sector_filter():
+    hits = get_screener().screen(Screen(sectors=("bonds",), top_n=10))
+    assert len(hits) and all(get_universe().sector[i] == "bonds" for i in hits)
+
+
+@pytest.mark.parametrize("fractional", [True, False])
+def test_recommendations_cover_every_allocation_slice(monkeypatch, fractional):
+    monkeypatch.setattr(investment_coach, "FRACTIONAL_SHARES", fractional)
+    for risk in ("low", "medium", "high"):
+        for age in (30, 45, 60):
+            for amount in (10.0, 100.0, 500.0):
+                allocation = investment_coach.calculate_allocation(risk, age, amount, 60)
+                recommended = investment_coach.get_recommended_etfs(risk, amount, allocation)
+                rows = investment_coach._calculate_monthly_breakdown(amount, allocation, recommended)
+                funded = {c for c, pct in allocation["breakdown"].items() if pct > 0}
+
+                assert {r["category"] for r in rows} == funded
+                assert {r["etf"] for r in rows} <= {e["symbol"] for e in recommended[:5]}
+                total_pct = sum(allocation["breakdown"].values())
+                assert sum(r["allocation_percent"] for r in rows) == pytest.approx(total_pct)
+                assert sum(r["monthly_amount"] for r in rows) == pytest.approx(total_pct / 100 * amount, abs=0.05)
+                for r in rows:
+                    price = get_universe().get(r["etf"])["min_investment"]
+                    assert fractional or price <= r["monthly_amount"] or r["buy_every_months"] > 1
+
+
+def test_recommendations_use_the_budget_without_fractional_shares(monkeypatch):
+    monkeypatch.setattr(investment_coach, "FRACTIONAL_SHARES", False)
+    allocation = investment_coach.calculate_allocation("high", 30, 500.0, 60)
+    rows = investment_coach._calculate_monthly_breakdown(
+        500.0, allocation, investment_coach.get_recommended_etfs("high", 500.0, allocation)
+    )
+    large_cap = next(r for r in rows if r["category"] == "us_large_cap")
+    assert get_universe().get(large_cap["etf"])["min_investment"] <= large_cap["monthly_amount"]
+    assert investment_coach.get_recommended_etfs_batch([("high", 500.0)], [allocation])[0] == \
+        investment_coach.get_recommended_etfs("high", 500.0, allocation)
+
+
+# Cashflow projections
+
+def _profile(take_home: float, expenses: float, debts: list, savings: float = 0.0) -> UserProfile:
+    payload = json.loads((HERE / "sample_json").read_text(encoding="utf-8"))
+    payload["form"]["cashflow"].update(
+        monthly_take_home_pay=take_home, monthly_expenses=expenses, current_savings=savings
+    )
+    payload["form"]["debts"] = debts
+    payload["form"]["savings_goal"] = {}
+    return UserProfile.model_validate(payload)
+
+
+def _reference_payoff(balance: float, apr: float, payment: float):
+    """Months and interest to pay off one debt at a fixed payment, one month at a time"""
+    months, interest = 0, 0.0
+    while balance > 0.005:
+        months += 1
+        charge = balance * apr / 1200
+        interest += charge
+        balance = balance + charge - min(payment, balance + charge)
+    return months, interest
+
+
+def _simulate_one(balance: float, apr: float, payment: float, surplus: float = 0.0, savings: float = 1e9):
+    return simulate(
+        np.array([surplus]), np.array([1000.0]), np.array([savings]), np.array([0.0]),
+        np.array([[balance]]), np.array([[apr]]), np.array([[payment]]), ["avalanche"],
+    )
+
+
+@pytest.mark.parametrize("balance,apr,payment", [(1200, 0.0, 100), (1000, 12.0, 100), (18000, 5.5, 200), (3200, 22.9, 90)])
+def test_projection_payoff_matches_a_month_by_month_reference(balance, apr, payment):
+    sim = _simulate_one(balance, apr, payment)
+    months, interest = _reference_payoff(balance, apr, payment)
+    assert sim["debt_free_month"][0] == months
+    assert sim["total_interest"][0] == pytest.approx(interest, abs=0.01)
+    assert sim["debt"][0, 0] == balance and sim["debt"][0, months] == 0
+
+
+def test_projection_avalanche_pays_no_more_interest_than_snowball():
+    proj = project_profile(_profile(5000, 4500, [
+        {"name": "Card", "balance": 3200, "apr_percent": 22.9, "min_payment": 90},
+        {"name": "Store card", "balance": 900, "apr_percent": 8.0, "min_payment": 35},
+    ], savings=30000))
+    options = proj["debt"]["strategies"]
+    assert options["avalanche"]["total_interest"] <= options["snowball"]["total_interest"]
+    assert proj["debt"]["recommended"] == "avalanche"
+
+
+def test_projection_emergency_fund_months():
+    proj = project_profile(_profile(4000, 3000, []))
+    assert proj["emergency_fund"]["starter_month"] == 3
+    assert proj["emergency_fund"]["funded_month"] == 18
+
+
+def test_projection_negative_amortization_is_not_paid_off():
+    proj = project_profile(_profile(3000, 3000, [{"name": "Card", "balance": 5000, "apr_percent": 20, "min_payment": 50}]))
+    for option in proj["debt"]["strategies"].values():
+        assert option["not_paid_off"] == ["Card"]
+        assert option["debt_free_month"] is None and option["total_interest"] is None
+    facts = projection_facts(proj)
+    assert "Card not paid off at the minimum payment" in facts
+    assert not re.search(r"\$[\d,]+ interest", facts)
+
+    # A small surplus that never outgrows the interest once the emergency fund is full
+    proj = project_profile(_profile(3010, 3000, [{"name": "Card", "balance": 5000, "apr_percent": 20, "min_payment": 50}], savings=18000))
+    assert proj["debt"]["strategies"]["avalanche"]["not_paid_off"] == ["Card"]
+
+
+def test_projection_debt_behind_an_amortizing_one_is_paid_off_later():
+    proj = project_profile(_profile(3000, 3000, [
+        {"name": "Card", "balance": 5000, "apr_percent": 20, "min_payment": 50},
+        {"name": "Loan", "balance": 2000, "apr_percent": 5, "min_payment": 100},
+    ]))
+    option = proj["debt"]["strategies"]["avalanche"]
+    assert option["not_paid_off"] == [] and option["debt_free_month"] is not None
+
+
+# Contribution limits
+
+def _contributions(budget, salary=100_000.0, age=40, match=0.0, traditional=True, roth=True, hsa=True, married=False, year=2025):
+    out = optimize_contributions(
+        np.array([budget]), np.array([salary]), np.array([age]), np.array([match]),
+        np.array([traditional]), np.array([roth]), np.array([hsa]), np.array([married]),
+        limits=get_limits_table().for_year(year),
+    )
+    return {k: float(v[0]) for k, v in out.items()}
+
+
+def test_contribution_limits_by_year_and_age():
+    table = get_limits_table()
+    assert table.for_year(2030).year == max(table.years)
+    assert table.for_year(1990).year == min(table.years)
+    assert _contributions(0, age=40)["k_cap"] * 12 == pytest.approx(23_500)
+    assert _contributions(0, age=52)["k_cap"] * 12 == pytest.approx(23_500 + 7_500)
+    assert _contributions(0, age=61)["k_cap"] * 12 == pytest.approx(23_500 + 11_250)
+    assert _contributions(0, age=61, year=2024)["k_cap"] * 12 == pytest.approx(23_000 + 7_500)
+    assert _contributions(0, age=56, married=True)["hsa_cap"] * 12 == pytest.approx(8_550 + 1_000)
+    assert _contributions(0, hsa=False)["hsa_cap"] == 0
+    assert _contributions(0, traditional=False, roth=False)["k_cap"] == 0
+
+
+def test_contribution_waterfall_fills_accounts_up_to_their_caps():
+    out = _contributions(10_000.0, salary=120_000.0, match=5.0)
+    assert out["match_needed"] == pytest.approx(500.0)
+    assert out["traditional_401k"] + out["roth_401k"] == pytest.approx(out["k_cap"])
+    assert out["hsa"] == pytest.approx(out["hsa_cap"])
+    assert out["traditional_401k"] + out["roth_401k"] + out["hsa"] + out["taxable"] == pytest.approx(10_000.0)
+
+    out = _contributions(300.0, salary=120_000.0, match=5.0)
+    assert out["employer_match"] == pytest.approx(300.0) and out["hsa"] == 0 and out["taxable"] == 0
+
+
+def test_contribution_roth_only_within_the_12_percent_bracket():
+    assert _contributions(1000.0, salary=50_000.0)["roth_401k"] > 0
+    assert _contributions(1000.0, salary=150_000.0)["roth_401k"] == 0
+    assert _contributions(1000.0, salary=150_000.0, traditional=False)["roth_401k"] > 0
+
+
+# Versioned index
+
+def _archive(tmp_path, name: str, files: dict) -> str:
+    src = tmp_path / f"src-{name}"
+    for rel, data in files.items():
+        path = src / "chroma_db" / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    archive = str(tmp_path / f"{name}.tar.gz")
+    with tarfile.open(archive, "w:gz") as tar:
+        tar.add(str(src / "chroma_db"), arcname="chroma_db")
+    return archive
+
+
+def test_index_install_is_checksummed_and_idempotent(tmp_path):
+    root = str(tmp_path / "indexes")
+    archive = _archive(tmp_path, "a", {"chroma.sqlite3": b"db", "seg/data.bin": b"vectors"})
+    version = index_versions.install(archive, root)
+    assert index_versions.install(archive, root) == version
+    assert set(index_versions.read_manifest(version, root)["files"]) == {"chroma.sqlite3", "seg/data.bin"}
+    assert index_versions.verify(version, root) == []
+    assert os.listdir(os.path.join(root, "staging")) == []
+
+
+def test_index_install_rejects_unsafe_paths(tmp_path):
+    root = str(tmp_path / "indexes")
+    archive = str(tmp_path / "bad.tar.gz")
+    with tarfile.open(archive, "w:gz") as tar:
+        info = tarfile.TarInfo("../evil")
+        info.size = 1
+        tar.addfile(info, io.BytesIO(b"x"))
+    with pytest.raises(ValueError):
+        index_versions.install(archive, root)
+    assert os.listdir(os.path.join(root, "staging")) == []
+
+
+def test_index_activate_verifies_and_switches_current(tmp_path):
+    root = str(tmp_path / "indexes")
+    v1 = index_versions.install(_archive(tmp_path, "a", {"chroma.sqlite3": b"one"}), root)
+    v2 = index_versions.install(_archive(tmp_path, "b", {"chroma.sqlite3": b"two"}), root)
+    index_versions.activate(v1, root)
+    assert index_versions.current_version(root) == v1
+    index_versions.activate(v2, root)
+    assert index_versions.current_version(root) == v2
+
+    with open(os.path.join(index_versions.version_dir(v1, root), "chroma.sqlite3"), "wb") as f:
+        f.write(b"tampered")
+    with pytest.raises(ValueError):
+        index_versions.activate(v1, root)
+    assert index_versions.current_version(root) == v2
+
+
+def test_index_gc_keeps_current_and_leased_versions_and_working_copies(tmp_path):
+    root = str(tmp_path / "indexes")
+    v1 = index_versions.install(_archive(tmp_path, "a", {"chroma.sqlite3": b"one"}), root)
+    v2 = index_versions.install(_archive(tmp_path, "b", {"chroma.sqlite3": b"two"}), root)
+    index_versions.activate(v2, root)
+
+    lease = index_versions._Lease(index_versions.version_dir(v1, root))  # another process still serves v1
+    assert index_versions.collect_garbage(root) == []
+    lease.close()
+    assert index_versions.collect_garbage(root, keep=1) == []
+    assert index_versions.collect_garbage(root) == [v1]
+    assert [r["version"] for r in index_versions.list_versions(root)] == [v2]
+
+    work = index_versions.checkout(v2, root)
+    with open(os.path.join(work.path, "chroma.sqlite3"), "rb") as f:
+        assert f.read() == b"two"
+    index_versions.collect_garbage(root)
+    assert os.path.isdir(work.path)
+    work.close()
+    index_versions.collect_garbage(root)
+    assert not os.path.exists(work.path)
+    assert index_versions.verify(v2, root) == []
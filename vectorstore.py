@@ -1,8 +1,60 @@
+import warnings
+from typing import Optional
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
-from config import CHROMA_DIR
+from config import HNSW_SEARCH_EF
 
-def load_vectordb():
-    embedding = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    db = Chroma(embedding_function=embedding, persist_directory=CHROMA_DIR)
-    return db
\ No newline at end of file
+DEFAULT_SEARCH_EF = 10  # Chroma's hnsw:search_ef when the collection does not set one
+COLLECTION_NAME = "langchain"  # langchain_chroma's default collection
+
+def configured_search_ef(collection) -> int:
+    """HNSW search breadth a Chroma collection is configured with"""
+    try:
+        ef = (collection.configuration_json or {}).get("hnsw", {}).get("ef_search")
+    except AttributeError:
+        ef = None
+    return int(ef or (collection.metadata or {}).get("hnsw:search_ef") or DEFAULT_SEARCH_EF)
+
+def set_search_ef(persist_directory: str, ef: int, collection_name: str = COLLECTION_NAME) -> int:
+    """
+    Write the HNSW search breadth (candidates kept per query; higher is slower and closer
+    to exact search) into an index on disk, for an offline copy before it is served.
+    Chroma reads it when the index segment is loaded and has no per-process or per-query
+    setting, so serving processes never call this. Returns the value a fresh client reads
+    back.
+    """
+    import chromadb
+    from chromadb.api.client import SharedSystemClient
+    collection = chromadb.PersistentClient(path=persist_directory).get_collection(collection_name)
+    try:
+        collection.modify(configuration={"hnsw": {"ef_search": ef}})
+    except TypeError:
+        metadata = {k: v for k, v in (collection.metadata or {}).items() if k != "hnsw:space"}
+        metadata["hnsw:search_ef"] = ef
+        collection.modify(metadata=metadata)
+    SharedSystemClient.clear_system_cache()  # the next client in this process reloads the segment
+    return configured_search_ef(chromadb.PersistentClient(path=persist_directory).get_collection(collection_name))
+
+def load_embeddings() -> HuggingFaceEmbeddings:
+    return HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+
+def load_vectordb(search_ef: Optional[int] = HNSW_SEARCH_EF, persist_directory: Optional[str] = None):
+    """
+    Chroma index at persist_directory, by default a working copy of the active index
+    version (or CHROMA_DIR). A configured search breadth the index was not set up with
+    only triggers a warning; it is never written at load.
+    """
+    import chromadb
+    from index_versions import open_current
+    embedding = load_embeddings()
+    client = chromadb.PersistentClient(path=persist_directory or open_current())
+    db = Chroma(client=client, collection_name=COLLECTION_NAME, embedding_function=embedding)
+    if search_ef:
+        actual = configured_search_ef(client.get_collection(COLLECTION_NAME))
+        if actual != search_ef:
+            warnings.warn(
+                f"HNSW_SEARCH_EF={search_ef} is not in effect: the index uses ef={actual}. "
+                "Set it when installing the index (`python index_versions.py install --search-ef N`).",
+                RuntimeWarning,
+            )
+    return db